@@ -3,6 +3,7 @@ Django settings for app project.
 """
 
 import os
+from decimal import Decimal
 from pathlib import Path
 
 from decouple import config
@@ -47,6 +48,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "store.audit.AuditMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -88,6 +90,131 @@ DATABASES = {
 }
 
 
+# Cache (docker-compose points it at Redis). Version stamps and cached
+# responses are only shared between gunicorn workers with a shared backend; on
+# the per-process LocMemCache default, snapshots (VersionedSnapshot) of other
+# workers only catch up with an edit once they reach their max age.
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default="clothes-store"),
+    }
+}
+
+# In-memory geography registry (store/geography.py)
+GEOGRAPHY_REGISTRY_MAX_AGE = config(
+    "GEOGRAPHY_REGISTRY_MAX_AGE", default=3600, cast=int
+)  # seconds
+
+# Shipping rate engine (store/shipping.py)
+DEFAULT_SHIPPING_COST = config("DEFAULT_SHIPPING_COST", default="10.00", cast=Decimal)
+SHIPPING_RATES_MAX_AGE = config("SHIPPING_RATES_MAX_AGE", default=3600, cast=int)
+SHIPPING_VARIANT_CACHE_TTL = config(
+    "SHIPPING_VARIANT_CACHE_TTL", default=300, cast=int
+)  # seconds
+
+# Sharded stock for hot SKUs (store/inventory.py)
+SHARDED_STOCK_MAX_SHARDS = config("SHARDED_STOCK_MAX_SHARDS", default=32, cast=int)
+SHARDED_STOCK_MAX_AGE = config("SHARDED_STOCK_MAX_AGE", default=60, cast=int)
+SHARDED_STOCK_CACHE_TTL = config(
+    "SHARDED_STOCK_CACHE_TTL", default=5, cast=int
+)  # seconds
+
+# Order references (store/references.py)
+ORDER_REFERENCE_ALLOCATOR = config(
+    "ORDER_REFERENCE_ALLOCATOR", default="store.references.SequenceBlockAllocator"
+)
+ORDER_REFERENCE_BLOCK_SIZE = config(
+    "ORDER_REFERENCE_BLOCK_SIZE", default=1000, cast=int
+)
+ORDER_REFERENCE_NODE_ID = config(
+    "ORDER_REFERENCE_NODE_ID",
+    default=None,
+    cast=lambda v: None if v is None else int(v),
+)
+
+# Micro-batched checkout (store/batching.py); needs threaded gunicorn workers
+CHECKOUT_BATCHING = config("CHECKOUT_BATCHING", default=False, cast=bool)
+CHECKOUT_BATCH_SIZE = config("CHECKOUT_BATCH_SIZE", default=32, cast=int)
+CHECKOUT_BATCH_WINDOW_MS = config("CHECKOUT_BATCH_WINDOW_MS", default=10, cast=int)
+CHECKOUT_BATCH_MAX_WAIT = config(
+    "CHECKOUT_BATCH_MAX_WAIT", default=5, cast=float
+)  # seconds
+CHECKOUT_BATCH_COMMIT_TIMEOUT = config(
+    "CHECKOUT_BATCH_COMMIT_TIMEOUT", default=30, cast=float
+)  # seconds to wait for a batch that has started committing
+
+# Exports (store/exports.py)
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", default=2000, cast=int)
+# Background export jobs (python manage.py run_exports), stored under MEDIA_ROOT
+EXPORT_JOB_DIR = "exports"
+EXPORT_JOB_STALE_AFTER = config(
+    "EXPORT_JOB_STALE_AFTER", default=300, cast=int
+)  # seconds without a heartbeat before another worker resumes a job
+
+# Order change feed (store/changes.py)
+ORDER_CHANGES_PAGE_SIZE = config("ORDER_CHANGES_PAGE_SIZE", default=200, cast=int)
+ORDER_CHANGES_MAX_PAGE_SIZE = 1000
+ORDER_CHANGES_SETTLE_SECONDS = config(
+    "ORDER_CHANGES_SETTLE_SECONDS", default=5, cast=int
+)
+
+# Bulk order status updates (POST /api/v1/admin/orders/bulk-status/)
+ORDER_BULK_STATUS_MAX = config("ORDER_BULK_STATUS_MAX", default=500, cast=int)
+
+# Admin dashboard KPIs (store/dashboard.py), in seconds
+DASHBOARD_CACHE_TTL = config("DASHBOARD_CACHE_TTL", default=30, cast=int)
+DASHBOARD_STALE_TTL = config("DASHBOARD_STALE_TTL", default=300, cast=int)
+
+# Sales analytics (store/analytics.py): longest date range one report covers
+ANALYTICS_MAX_DAYS = config("ANALYTICS_MAX_DAYS", default=366, cast=int)
+
+# Admin list pagination (store/pagination.py): lists longer than this report
+# an estimated count instead of running an exact COUNT(*)
+PAGINATION_EXACT_COUNT_LIMIT = config(
+    "PAGINATION_EXACT_COUNT_LIMIT", default=10000, cast=int
+)
+
+# Order archival (python manage.py archive_orders, store/archive.py)
+ORDER_ARCHIVE_AFTER_DAYS = config("ORDER_ARCHIVE_AFTER_DAYS", default=365, cast=int)
+ORDER_ARCHIVE_STATUSES = ("delivered", "cancelled", "returned")
+ORDER_ARCHIVE_CHUNK_SIZE = config("ORDER_ARCHIVE_CHUNK_SIZE", default=500, cast=int)
+
+# Product CSV import (store/imports.py): rows upserted per transaction
+PRODUCT_IMPORT_CHUNK_SIZE = config("PRODUCT_IMPORT_CHUNK_SIZE", default=1000, cast=int)
+# Processes parsing rows for API imports (1: parse in the request's process)
+PRODUCT_IMPORT_WORKERS = config("PRODUCT_IMPORT_WORKERS", default=1, cast=int)
+# Larger uploads are queued for the import worker (python manage.py run_imports)
+PRODUCT_IMPORT_SYNC_MAX_BYTES = config(
+    "PRODUCT_IMPORT_SYNC_MAX_BYTES", default=1024 * 1024, cast=int
+)
+IMPORT_JOB_DIR = "imports"
+IMPORT_JOB_STALE_AFTER = config(
+    "IMPORT_JOB_STALE_AFTER", default=300, cast=int
+)  # seconds without a heartbeat before another worker resumes a job
+
+# Audit log writer (store/audit.py): rows are queued in-process and inserted
+# after the request, every AUDIT_FLUSH_INTERVAL seconds or once AUDIT_FLUSH_SIZE
+# are waiting; past AUDIT_BUFFER_SIZE queued rows (or with 0) they are inserted
+# directly
+AUDIT_BUFFER_SIZE = config("AUDIT_BUFFER_SIZE", default=1000, cast=int)
+AUDIT_FLUSH_SIZE = config("AUDIT_FLUSH_SIZE", default=100, cast=int)
+AUDIT_FLUSH_INTERVAL = config("AUDIT_FLUSH_INTERVAL", default=1.0, cast=float)
+# Request header holding the client IP behind a trusted proxy, e.g.
+# HTTP_X_FORWARDED_FOR (empty: use REMOTE_ADDR)
+AUDIT_IP_HEADER = config("AUDIT_IP_HEADER", default="")
+# Audit log retention (python manage.py prune_audit_log): entries older than
+# AUDIT_RETENTION_DAYS are archived as gzip'd NDJSON to AUDIT_ARCHIVE_DIR, then
+# deleted, AUDIT_PRUNE_CHUNK_SIZE at a time
+AUDIT_RETENTION_DAYS = config("AUDIT_RETENTION_DAYS", default=365, cast=int)
+AUDIT_ARCHIVE_DIR = config(
+    "AUDIT_ARCHIVE_DIR", default=os.path.join(BASE_DIR, "audit-archive")
+)
+AUDIT_PRUNE_CHUNK_SIZE = config("AUDIT_PRUNE_CHUNK_SIZE", default=5000, cast=int)
+
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -166,6 +293,20 @@ EMAIL_USE_TLS = config("EMAIL_USE_TLS", default=True, cast=bool)
 EMAIL_HOST_USER = config("EMAIL_HOST_USER", default="")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD", default="")
 DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default="noreply@clothesstore.com")
+ORDER_NOTIFICATION_EMAILS = config(
+    "ORDER_NOTIFICATION_EMAILS",
+    default="",
+    cast=lambda v: [s.strip() for s in v.split(",") if s.strip()],
+)
+
+# Outbox worker (python manage.py drain_outbox)
+OUTBOX_BATCH_SIZE = config("OUTBOX_BATCH_SIZE", default=50, cast=int)
+OUTBOX_MAX_ATTEMPTS = config("OUTBOX_MAX_ATTEMPTS", default=5, cast=int)
+OUTBOX_RETRY_BACKOFF = config("OUTBOX_RETRY_BACKOFF", default=30, cast=int)  # seconds
+OUTBOX_MAX_BACKOFF = config("OUTBOX_MAX_BACKOFF", default=3600, cast=int)  # seconds
+OUTBOX_CLAIM_TIMEOUT = config(
+    "OUTBOX_CLAIM_TIMEOUT", default=300, cast=int
+)  # seconds a claimed batch is left to its worker; keep above a batch's send time
 
 # Swagger/OpenAPI
 SWAGGER_SETTINGS = {
@@ -2,22 +2,36 @@
 Django admin configuration for store models.
 """
 
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.utils import timezone
 
+from .analytics import rebuild_day
+from .inventory import consolidate_stock, rebalance_stock
 from .models import (
+    ArchivedOrder,
+    ArchivedOrderLine,
     AuditLog,
     Baladiya,
     Category,
     Client,
     ClientToken,
+    ExportJob,
+    ImportJob,
     Order,
     OrderLine,
+    OutboxMessage,
     Product,
     ProductCategory,
     ProductImage,
     ProductVariant,
+    ShippingRate,
+    ShippingZone,
+    StockShard,
     Wilaya,
 )
+from .orders import change_order_status
+from .pagination import EstimatedCountPaginator
 
 
 @admin.register(Category)
@@ -36,6 +50,13 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("title",)}
 
 
+class StockShardInline(admin.TabularInline):
+    model = StockShard
+    extra = 0
+    readonly_fields = ["index", "quantity"]
+    can_delete = False
+
+
 @admin.register(ProductVariant)
 class ProductVariantAdmin(admin.ModelAdmin):
     list_display = [
@@ -45,11 +66,25 @@ class ProductVariantAdmin(admin.ModelAdmin):
         "color",
         "price",
         "stock_quantity",
+        "shard_count",
         "is_active",
     ]
     list_filter = ["is_active", "product"]
     search_fields = ["sku", "product__title"]
     raw_id_fields = ["product"]
+    readonly_fields = ["shard_count"]
+    inlines = [StockShardInline]
+    actions = ["rebalance_shards", "consolidate_shards"]
+
+    @admin.action(description="Rebalance stock shards")
+    def rebalance_shards(self, request, queryset):
+        for variant in queryset.filter(shard_count__gt=0):
+            rebalance_stock(variant)
+
+    @admin.action(description="Consolidate stock shards")
+    def consolidate_shards(self, request, queryset):
+        for variant in queryset.filter(shard_count__gt=0):
+            consolidate_stock(variant)
 
 
 @admin.register(ProductImage)
@@ -61,10 +96,25 @@ class ProductImageAdmin(admin.ModelAdmin):
 
 @admin.register(Wilaya)
 class WilayaAdmin(admin.ModelAdmin):
-    list_display = ["name", "code"]
+    list_display = ["name", "code", "shipping_zone"]
+    list_filter = ["shipping_zone"]
+    list_editable = ["shipping_zone"]
     search_fields = ["name", "code"]
 
 
+class ShippingRateInline(admin.TabularInline):
+    model = ShippingRate
+    extra = 0
+
+
+@admin.register(ShippingZone)
+class ShippingZoneAdmin(admin.ModelAdmin):
+    list_display = ["name", "is_active"]
+    list_filter = ["is_active"]
+    search_fields = ["name"]
+    inlines = [ShippingRateInline]
+
+
 @admin.register(Baladiya)
 class BaladiyaAdmin(admin.ModelAdmin):
     list_display = ["name", "wilaya"]
@@ -82,22 +132,101 @@ class OrderLineInline(admin.TabularInline):
 class OrderAdmin(admin.ModelAdmin):
     list_display = ["reference", "name", "phone", "status", "total", "created_at"]
     list_filter = ["status", "payment_status", "wilaya", "created_at"]
-    search_fields = ["reference", "name", "phone"]
+    # Exact and prefix lookups only, so searches can use the indexes
+    search_fields = ["=reference", "=email", "^name", "^phone_digits"]
+    # Bounded counts instead of COUNT(*) over the whole table
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ["reference", "created_at", "updated_at"]
     inlines = [OrderLineInline]
     fieldsets = (
         ("Order Info", {"fields": ("reference", "status", "created_at", "updated_at")}),
-        ("Customer", {"fields": ("name", "phone", "address", "wilaya", "baladiya")}),
+        (
+            "Customer",
+            {"fields": ("name", "email", "phone", "address", "wilaya", "baladiya")},
+        ),
         ("Pricing", {"fields": ("subtotal", "shipping_cost", "total")}),
         ("Payment", {"fields": ("payment_method", "payment_status")}),
     )
 
+    def change_view(self, request, object_id, form_url="", extra_context=None):
+        # Links to archived orders still resolve (store/archive.py)
+        if (
+            object_id.isdigit()
+            and not Order.objects.filter(pk=object_id).exists()
+            and ArchivedOrder.objects.filter(pk=object_id).exists()
+        ):
+            return redirect("admin:store_archivedorder_change", object_id)
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    def save_model(self, request, obj, form, change):
+        # Status changes go through the transition table, restock and rollups
+        new_status = obj.status
+        if change and "status" in form.changed_data:
+            obj.status = form.initial["status"]
+        super().save_model(request, obj, form, change)
+        if new_status != obj.status:
+            (result,) = change_order_status(request.user, new_status, ids=[obj.pk])
+            if result["outcome"] != "updated":
+                self.message_user(
+                    request,
+                    f"Status not changed: {result['outcome'].replace('_', ' ')}",
+                    messages.WARNING,
+                )
+            obj.refresh_from_db()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Totals, lines or dates may have been edited by hand
+        rebuild_day(timezone.localdate(form.instance.created_at))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_day(timezone.localdate(obj.created_at))
+
+    def delete_queryset(self, request, queryset):
+        days = {
+            timezone.localdate(created_at)
+            for created_at in queryset.values_list("created_at", flat=True)
+        }
+        super().delete_queryset(request, queryset)
+        for day in sorted(days):
+            rebuild_day(day)
+
+
+class ArchivedOrderLineInline(admin.TabularInline):
+    model = ArchivedOrderLine
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ["reference", "name", "phone", "status", "total", "created_at"]
+    list_filter = ["status", "created_at"]
+    search_fields = ["=reference", "=email", "^phone_digits"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    inlines = [ArchivedOrderLineInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(OrderLine)
 class OrderLineAdmin(admin.ModelAdmin):
     list_display = ["order", "sku_snapshot", "quantity", "line_total"]
     list_filter = ["order__status"]
-    search_fields = ["order__reference", "sku_snapshot"]
+    search_fields = ["=order__reference", "^sku_snapshot"]
     raw_id_fields = ["order", "product_variant"]
 
 
@@ -105,9 +234,91 @@ class OrderLineAdmin(admin.ModelAdmin):
 class AuditLogAdmin(admin.ModelAdmin):
     list_display = ["admin_user", "action_type", "model_name", "object_id", "timestamp"]
     list_filter = ["action_type", "model_name", "timestamp"]
-    search_fields = ["admin_user__username", "model_name", "object_id"]
+    list_select_related = ["admin_user"]
+    # Exact matches only: substring searches scan the whole table
+    search_fields = ["=admin_user__username", "=object_id"]
     readonly_fields = ["timestamp"]
-    date_hierarchy = "timestamp"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = [
+        "subject",
+        "kind",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "sent_at",
+    ]
+    list_filter = ["status", "kind"]
+    search_fields = ["subject", "order__reference"]
+    raw_id_fields = ["order"]
+    readonly_fields = ["created_at", "sent_at"]
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "kind",
+        "format",
+        "status",
+        "rows_written",
+        "total_rows",
+        "created_by",
+        "created_at",
+    ]
+    list_filter = ["status", "kind", "format"]
+    readonly_fields = [
+        "total_rows",
+        "rows_written",
+        "cursor",
+        "bytes_written",
+        "file",
+        "error",
+        "created_at",
+        "started_at",
+        "heartbeat_at",
+        "finished_at",
+    ]
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "original_name",
+        "status",
+        "rows_processed",
+        "imported",
+        "error_count",
+        "created_by",
+        "created_at",
+    ]
+    list_filter = ["status"]
+    readonly_fields = [
+        "file",
+        "original_name",
+        "file_size",
+        "deactivate_missing",
+        "rows_processed",
+        "imported",
+        "created",
+        "updated",
+        "unchanged",
+        "deactivated",
+        "error_count",
+        "errors_file",
+        "errors_bytes",
+        "seconds",
+        "error",
+        "created_at",
+        "started_at",
+        "heartbeat_at",
+        "finished_at",
+    ]
 
 
 admin.site.register(ProductCategory)
@@ -0,0 +1,290 @@
+"""
+Daily sales rollups behind the admin analytics endpoints.
+
+``DailySales`` and ``DailySkuSales`` hold per-day totals keyed by order
+status, so any date range is answered by summing a few rows per day instead
+of scanning orders. They are updated in the transactions that create orders
+or change their status, and ``rebuild_sales_rollups`` recomputes a range of
+days from the orders themselves.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .geography import get_registry
+from .models import (
+    ArchivedOrder,
+    ArchivedOrderLine,
+    DailySales,
+    DailySkuSales,
+    Order,
+    OrderLine,
+)
+from .utils import start_of_day
+
+# Orders in these statuses are kept in the rollups but do not count as sales
+EXCLUDED_STATUSES = ("cancelled", "returned")
+
+SALES_FIELDS = ("orders", "subtotal", "shipping", "revenue")
+SKU_FIELDS = ("units", "revenue")
+
+ZERO = Decimal("0.00")
+
+
+def _new_deltas():
+    sales = defaultdict(lambda: [0, ZERO, ZERO, ZERO])
+    skus = defaultdict(lambda: [0, ZERO])
+    return sales, skus
+
+
+def _add_order(sales, skus, order, status, lines, sign):
+    """Add (sign=1) or remove (sign=-1) one order under ``status``."""
+    day = timezone.localdate(order.created_at)
+    row = sales[(("day", day), ("status", status), ("wilaya_id", order.wilaya_id or 0))]
+    row[0] += sign
+    row[1] += sign * order.subtotal
+    row[2] += sign * order.shipping_cost
+    row[3] += sign * order.total
+    for sku, quantity, line_total in lines:
+        row = skus[(("day", day), ("sku", sku), ("status", status))]
+        row[0] += sign * quantity
+        row[1] += sign * line_total
+
+
+def _apply(model, deltas, fields):
+    """Increment rollup rows by ``deltas`` ({lookup items: values})."""
+    # A fixed row order keeps concurrent transactions from deadlocking
+    for key in sorted(deltas):
+        values = deltas[key]
+        if not any(values):
+            continue
+        lookup = dict(key)
+        increments = {field: F(field) + value for field, value in zip(fields, values)}
+        if model.objects.filter(**lookup).update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **dict(zip(fields, values)))
+        except IntegrityError:
+            # Another transaction created the row since the update above
+            model.objects.filter(**lookup).update(**increments)
+
+
+def _save(sales, skus):
+    _apply(DailySales, sales, SALES_FIELDS)
+    _apply(DailySkuSales, skus, SKU_FIELDS)
+
+
+def record_new_orders(orders_with_lines):
+    """
+    Add just-created orders, given as ``(order, lines)`` pairs, to the
+    rollups. Call inside the transaction that creates them.
+    """
+    sales, skus = _new_deltas()
+    for order, lines in orders_with_lines:
+        lines = [(line.sku_snapshot, line.quantity, line.line_total) for line in lines]
+        _add_order(sales, skus, order, order.status, lines, 1)
+    _save(sales, skus)
+
+
+def record_status_change(orders, old_status):
+    """
+    Move ``orders`` from ``old_status`` to their current status in the
+    rollups. Call inside the transaction that changes the status.
+    """
+    orders = [order for order in orders if order.status != old_status]
+    if not orders:
+        return
+
+    lines = defaultdict(list)
+    for order_id, *line in OrderLine.objects.filter(
+        order_id__in=[order.id for order in orders]
+    ).values_list("order_id", "sku_snapshot", "quantity", "line_total"):
+        lines[order_id].append(line)
+
+    sales, skus = _new_deltas()
+    for order in orders:
+        _add_order(sales, skus, order, old_status, lines[order.id], -1)
+        _add_order(sales, skus, order, order.status, lines[order.id], 1)
+    _save(sales, skus)
+
+
+# Live and archived orders (store/archive.py) both count in the rollups
+ORDER_SOURCES = ((Order, OrderLine), (ArchivedOrder, ArchivedOrderLine))
+
+
+def rebuild_day(day):
+    """Recompute one day's rollups from its orders; returns the order count."""
+    start = start_of_day(day)
+    end = start_of_day(day + timedelta(days=1))
+    sales, skus = _new_deltas()
+    for order_model, line_model in ORDER_SOURCES:
+        orders = order_model.objects.filter(created_at__gte=start, created_at__lt=end)
+        for row in orders.values("status", "wilaya_id").annotate(
+            count=Count("id"),
+            subtotal_sum=Sum("subtotal"),
+            shipping_sum=Sum("shipping_cost"),
+            total_sum=Sum("total"),
+        ):
+            totals = sales[(row["status"], row["wilaya_id"] or 0)]
+            totals[0] += row["count"]
+            totals[1] += row["subtotal_sum"]
+            totals[2] += row["shipping_sum"]
+            totals[3] += row["total_sum"]
+
+        lines = line_model.objects.filter(
+            order__created_at__gte=start, order__created_at__lt=end
+        )
+        for row in lines.values("order__status", "sku_snapshot").annotate(
+            units=Sum("quantity"), line_revenue=Sum("line_total")
+        ):
+            totals = skus[(row["sku_snapshot"], row["order__status"])]
+            totals[0] += row["units"]
+            totals[1] += row["line_revenue"]
+
+    with transaction.atomic():
+        DailySales.objects.filter(day=day).delete()
+        DailySkuSales.objects.filter(day=day).delete()
+        DailySales.objects.bulk_create(
+            DailySales(
+                day=day,
+                status=status,
+                wilaya_id=wilaya_id,
+                **dict(zip(SALES_FIELDS, values)),
+            )
+            for (status, wilaya_id), values in sales.items()
+        )
+        DailySkuSales.objects.bulk_create(
+            DailySkuSales(
+                day=day, status=status, sku=sku, **dict(zip(SKU_FIELDS, values))
+            )
+            for (sku, status), values in skus.items()
+        )
+    return sum(values[0] for values in sales.values())
+
+
+# Reports (inclusive date ranges)
+
+
+def _money(value):
+    return str(Decimal(value or 0).quantize(ZERO))
+
+
+def _sales(model, start, end):
+    return model.objects.filter(day__gte=start, day__lte=end)
+
+
+def summary(start, end):
+    """Sales totals for the range, plus order counts and revenue per status."""
+    by_status = {}
+    totals = {"orders": 0, "subtotal": ZERO, "shipping": ZERO, "revenue": ZERO}
+    rows = (
+        _sales(DailySales, start, end)
+        .values("status")
+        .annotate(
+            order_count=Sum("orders"),
+            subtotal_sum=Sum("subtotal"),
+            shipping_sum=Sum("shipping"),
+            revenue_sum=Sum("revenue"),
+        )
+        .order_by("status")
+    )
+    for row in rows:
+        by_status[row["status"]] = {
+            "orders": row["order_count"],
+            "revenue": _money(row["revenue_sum"]),
+        }
+        if row["status"] not in EXCLUDED_STATUSES:
+            totals["orders"] += row["order_count"]
+            totals["subtotal"] += row["subtotal_sum"]
+            totals["shipping"] += row["shipping_sum"]
+            totals["revenue"] += row["revenue_sum"]
+
+    average = (
+        (totals["revenue"] / totals["orders"]).quantize(ZERO)
+        if totals["orders"]
+        else ZERO
+    )
+    return {
+        "orders": totals["orders"],
+        "subtotal": _money(totals["subtotal"]),
+        "shipping": _money(totals["shipping"]),
+        "revenue": _money(totals["revenue"]),
+        "average_order_value": _money(average),
+        "by_status": by_status,
+    }
+
+
+def daily(start, end):
+    """Orders and revenue per day, including days without sales."""
+    rows = {
+        row["day"]: row
+        for row in _sales(DailySales, start, end)
+        .exclude(status__in=EXCLUDED_STATUSES)
+        .values("day")
+        .annotate(order_count=Sum("orders"), revenue_sum=Sum("revenue"))
+        .order_by("day")
+    }
+    series = []
+    day = start
+    while day <= end:
+        row = rows.get(day)
+        series.append(
+            {
+                "day": day.isoformat(),
+                "orders": row["order_count"] if row else 0,
+                "revenue": _money(row["revenue_sum"] if row else ZERO),
+            }
+        )
+        day += timedelta(days=1)
+    return series
+
+
+def top_skus(start, end, limit=10):
+    """Best-selling SKUs by units."""
+    rows = (
+        _sales(DailySkuSales, start, end)
+        .exclude(status__in=EXCLUDED_STATUSES)
+        .values("sku")
+        .annotate(unit_count=Sum("units"), revenue_sum=Sum("revenue"))
+        .filter(unit_count__gt=0)
+        .order_by("-unit_count", "sku")[:limit]
+    )
+    return [
+        {
+            "sku": row["sku"],
+            "units": row["unit_count"],
+            "revenue": _money(row["revenue_sum"]),
+        }
+        for row in rows
+    ]
+
+
+def by_wilaya(start, end):
+    """Orders and revenue per wilaya, highest revenue first."""
+    geography = get_registry()
+    rows = (
+        _sales(DailySales, start, end)
+        .exclude(status__in=EXCLUDED_STATUSES)
+        .values("wilaya_id")
+        .annotate(order_count=Sum("orders"), revenue_sum=Sum("revenue"))
+        .filter(order_count__gt=0)
+        .order_by("-revenue_sum", "wilaya_id")
+    )
+    result = []
+    for row in rows:
+        wilaya = geography.wilaya(row["wilaya_id"])
+        result.append(
+            {
+                "wilaya": row["wilaya_id"] or None,
+                "wilaya_name": wilaya.name if wilaya else "",
+                "orders": row["order_count"],
+                "revenue": _money(row["revenue_sum"]),
+            }
+        )
+    return result
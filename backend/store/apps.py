@@ -1,6 +1,27 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save
 
 
 class StoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "store"
+
+    def ready(self):
+        from .audit import flush_at_request_end
+        from .geography import geography_changed
+        from .models import Baladiya, ProductVariant, ShippingRate, ShippingZone, Wilaya
+        from .shipping import shipping_rates_changed, variant_pricing_changed
+
+        for model in (Wilaya, Baladiya):
+            post_save.connect(geography_changed, sender=model)
+            post_delete.connect(geography_changed, sender=model)
+
+        for model in (ShippingZone, ShippingRate, Wilaya):
+            post_save.connect(shipping_rates_changed, sender=model)
+            post_delete.connect(shipping_rates_changed, sender=model)
+
+        post_save.connect(variant_pricing_changed, sender=ProductVariant)
+        post_delete.connect(variant_pricing_changed, sender=ProductVariant)
+
+        request_finished.connect(flush_at_request_end)
@@ -0,0 +1,90 @@
+"""
+Order archival: old orders in a final status move, with their lines, from
+``Order``/``OrderLine`` to ``ArchivedOrder``/``ArchivedOrderLine``.
+
+Keeping only live orders in ``Order`` keeps the indexes that every checkout
+inserts into small. Archived rows keep their ids, lookups fall through with
+``find_order`` and the sales rollups still include them.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderLine, Order, OrderLine
+
+
+def _copied_fields(model):
+    return [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.name != "archived_at"
+    ]
+
+
+def archive_cutoff(days=None):
+    """Orders created before this are old enough to archive."""
+    days = settings.ORDER_ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_chunk(before, statuses=None, chunk_size=None):
+    """
+    Move up to ``chunk_size`` orders created before ``before`` in one of
+    ``statuses`` to the archive, in one transaction. Returns how many moved.
+    """
+    statuses = statuses or settings.ORDER_ARCHIVE_STATUSES
+    chunk_size = chunk_size or settings.ORDER_ARCHIVE_CHUNK_SIZE
+
+    with transaction.atomic():
+        queryset = Order.objects.filter(
+            created_at__lt=before, status__in=statuses
+        ).order_by("pk")
+        # Orders being edited right now are left for the next run
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        else:
+            queryset = queryset.select_for_update()
+        orders = list(queryset.values(*_copied_fields(ArchivedOrder))[:chunk_size])
+        if not orders:
+            return 0
+
+        ids = [order["id"] for order in orders]
+        lines = OrderLine.objects.filter(order_id__in=ids).values(
+            *_copied_fields(ArchivedOrderLine)
+        )
+        ArchivedOrder.objects.bulk_create(ArchivedOrder(**order) for order in orders)
+        ArchivedOrderLine.objects.bulk_create(
+            ArchivedOrderLine(**line) for line in lines
+        )
+        # Cascades to the lines and unlinks outbox messages
+        Order.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def archive_orders(before=None, statuses=None, chunk_size=None):
+    """Archive every eligible order, chunk by chunk; returns the total moved."""
+    before = before or archive_cutoff()
+    total = 0
+    while True:
+        moved = archive_chunk(before, statuses, chunk_size)
+        if not moved:
+            return total
+        total += moved
+
+
+def find_order(**lookup):
+    """
+    The order matching ``lookup``, looked up in ``Order`` first and then in
+    the archive. Raises ``Order.DoesNotExist`` when neither has it.
+    """
+    try:
+        return Order.objects.get(**lookup)
+    except Order.DoesNotExist:
+        pass
+    try:
+        return ArchivedOrder.objects.get(**lookup)
+    except ArchivedOrder.DoesNotExist:
+        raise Order.DoesNotExist("Order matching query does not exist.") from None
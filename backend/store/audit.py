@@ -0,0 +1,280 @@
+"""
+Buffered audit log writer.
+
+``log_admin_action`` queues ``AuditLog`` rows in-process instead of inserting
+them inside the admin request. Rows are queued when the caller's transaction
+commits, so a rolled-back change leaves no entry. Queued rows are
+bulk-inserted when the request has finished (after the response is sent), by
+a background thread every ``AUDIT_FLUSH_INTERVAL`` seconds or as soon as
+``AUDIT_FLUSH_SIZE`` rows are waiting, and at interpreter exit. When
+``AUDIT_BUFFER_SIZE`` rows are already waiting, new rows are inserted
+directly; ``AUDIT_BUFFER_SIZE = 0`` disables buffering altogether.
+
+``AuditMiddleware`` records the client IP of the current request, stored as
+``AuditLog.ip_address``. Updates are logged as ``changed_fields`` diffs.
+
+Retention: ``prune_chunk`` (``python manage.py prune_audit_log``) deletes
+entries older than ``AUDIT_RETENTION_DAYS``, oldest id first, after writing
+them to gzip'd NDJSON files under ``AUDIT_ARCHIVE_DIR``. Ids grow with time,
+so each chunk is a range at the start of the primary key, which is the
+cheapest thing to delete from an InnoDB table.
+"""
+
+import atexit
+import contextvars
+import gzip
+import ipaddress
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+_client_ip = contextvars.ContextVar("audit_client_ip", default=None)
+
+
+def client_ip(request):
+    """
+    Client address of ``request``: the first address of ``AUDIT_IP_HEADER``
+    when set (behind a trusted proxy), else ``REMOTE_ADDR``.
+    """
+    value = ""
+    if settings.AUDIT_IP_HEADER:
+        value = request.META.get(settings.AUDIT_IP_HEADER, "").split(",")[0]
+    value = value.strip() or request.META.get("REMOTE_ADDR", "")
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return None
+
+
+class AuditMiddleware:
+    """Make the client IP available to audit entries logged by the request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _client_ip.set(client_ip(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _client_ip.reset(token)
+
+
+# Longer strings are truncated in logged diffs
+MAX_VALUE_LENGTH = 200
+
+
+def _json_value(value):
+    if isinstance(value, models.Model):
+        return value.pk
+    if isinstance(value, str):
+        if len(value) > MAX_VALUE_LENGTH:
+            return value[:MAX_VALUE_LENGTH] + "..."
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _json_value(item) for key, item in value.items()}
+    return str(value)
+
+
+def changed_fields(instance, data):
+    """
+    Audit ``changes`` for an update of ``instance`` with validated ``data``,
+    taken before saving: ``{field: [old, new]}`` for model fields whose value
+    changes, ``{key: new}`` for other keys (e.g. nested images).
+    """
+    fields = {field.name for field in instance._meta.concrete_fields}
+    changes = {}
+    for key, new in data.items():
+        if key not in fields:
+            changes[key] = _json_value(new)
+            continue
+        old = getattr(instance, key)
+        if old != new:
+            changes[key] = [_json_value(old), _json_value(new)]
+    return changes
+
+
+def _clean(entry):
+    # JSONField would fail the whole batch on a non-serializable value
+    try:
+        json.dumps(entry.changes)
+    except (TypeError, ValueError):
+        entry.changes = {k: str(v) for k, v in entry.changes.items()}
+    return entry
+
+
+class AuditWriter:
+    """In-process queue of ``AuditLog`` rows, inserted in batches."""
+
+    def __init__(self, buffer_size=None, flush_size=None, interval=None):
+        self.buffer_size = (
+            settings.AUDIT_BUFFER_SIZE if buffer_size is None else buffer_size
+        )
+        self.flush_size = flush_size or settings.AUDIT_FLUSH_SIZE
+        self.interval = interval or settings.AUDIT_FLUSH_INTERVAL
+        self.queue = queue.Queue(self.buffer_size)
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, entries):
+        """Queue unsaved ``AuditLog`` rows (inserting them if the queue is full)."""
+        overflow = []
+        for entry in entries:
+            if entry.ip_address is None:
+                entry.ip_address = _client_ip.get()
+            if not self.buffer_size:
+                overflow.append(entry)
+                continue
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                overflow.append(entry)
+        if overflow:
+            self.write(overflow)
+        if self.buffer_size:
+            self._start()
+            if self.queue.qsize() >= self.flush_size:
+                self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="audit-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self.queue.empty():
+                continue
+            close_old_connections()
+            self.flush()
+
+    def flush(self):
+        """Insert every queued row, ``flush_size`` rows per statement."""
+        while True:
+            batch = []
+            while len(batch) < self.flush_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self.write(batch)
+
+    def write(self, entries):
+        try:
+            AuditLog.objects.bulk_create([_clean(entry) for entry in entries])
+        except Exception:
+            # Never fail the caller over its audit trail
+            logger.exception("Failed to write %d audit log entries", len(entries))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditWriter()
+                # Write what is still queued when the worker shuts down
+                atexit.register(_writer.flush)
+    return _writer
+
+
+def queue_on_commit(entries):
+    """
+    Queue unsaved ``AuditLog`` rows once the current transaction commits
+    (right away outside a transaction).
+    """
+    # on_commit callbacks may run after the request's context has been reset
+    ip_address = _client_ip.get()
+    for entry in entries:
+        if entry.ip_address is None:
+            entry.ip_address = ip_address
+    transaction.on_commit(lambda: get_writer().add(entries))
+
+
+def flush_at_request_end(sender, **kwargs):
+    """``request_finished`` receiver: write the rows queued so far."""
+    if _writer is not None and not _writer.queue.empty():
+        _writer.flush()
+
+
+def retention_cutoff(days=None):
+    days = settings.AUDIT_RETENTION_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+ARCHIVE_FIELDS = [
+    "id",
+    "timestamp",
+    "admin_user_id",
+    "action_type",
+    "model_name",
+    "object_id",
+    "changes",
+    "ip_address",
+]
+
+
+def _write_archive(directory, rows):
+    """Write ``rows`` to one gzip'd NDJSON file named after their id range."""
+    name = "audit-{:%Y-%m}-{}-{}.ndjson.gz".format(
+        rows[0]["timestamp"], rows[0]["id"], rows[-1]["id"]
+    )
+    path = os.path.join(directory, name)
+    os.makedirs(directory, exist_ok=True)
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+    # A chunk re-run after a crash overwrites its file instead of duplicating it
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def prune_chunk(before, chunk_size=None, archive_dir=None):
+    """
+    Delete the oldest ``chunk_size`` entries logged before ``before``, first
+    archiving them under ``archive_dir`` unless it is None. Returns how many
+    were deleted.
+    """
+    chunk_size = chunk_size or settings.AUDIT_PRUNE_CHUNK_SIZE
+    rows = list(
+        AuditLog.objects.filter(timestamp__lt=before)
+        .order_by("id")
+        .values(*ARCHIVE_FIELDS, admin_username=F("admin_user__username"))[:chunk_size]
+    )
+    if not rows:
+        return 0
+    if archive_dir is not None:
+        _write_archive(archive_dir, rows)
+    with transaction.atomic():
+        AuditLog.objects.filter(id__in=[row["id"] for row in rows]).delete()
+    return len(rows)
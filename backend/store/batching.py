@@ -0,0 +1,254 @@
+"""
+Micro-batched checkout (enabled with ``CHECKOUT_BATCHING``).
+
+Checkout requests are queued in-process and committed by one background
+thread in small batches. Each batch locks the union of its variants once,
+allocates stock in arrival order and bulk-inserts orders, lines and outbox
+messages. Requests only share a batch when they overlap inside one process,
+so this needs threaded workers (e.g. ``gunicorn --threads 8``).
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .analytics import record_new_orders
+from .inventory import is_sharded
+from .models import Order, OrderLine, OutboxMessage, ProductVariant
+from .orders import CheckoutError, build_order, build_order_line, place_order
+from .outbox import order_notifications
+
+logger = logging.getLogger(__name__)
+
+
+class _Fallback(Exception):
+    """The request cannot be batched and goes through ``place_order``."""
+
+
+class CheckoutPending(Exception):
+    """
+    The batch holding the request did not finish within
+    CHECKOUT_BATCH_COMMIT_TIMEOUT; the order may still be placed.
+    """
+
+
+class CheckoutBatcher:
+    """In-process queue of checkouts committed by a single background thread."""
+
+    def __init__(self, max_batch=None, window=None):
+        self.max_batch = max_batch or settings.CHECKOUT_BATCH_SIZE
+        self.window = (
+            settings.CHECKOUT_BATCH_WINDOW_MS / 1000 if window is None else window
+        )
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, data):
+        """Queue validated checkout data; the future resolves to the Order."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="checkout-batcher", daemon=True
+                )
+                self._thread.start()
+        future = Future()
+        self.queue.put((data, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Callers that gave up waiting have cancelled their futures
+        return [(data, f) for data, f in batch if f.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                self.commit(batch)
+            except Exception:
+                logger.exception("Checkout batch failed, retrying one by one")
+                for data, future in batch:
+                    if not future.done():
+                        self._place_one(data, future)
+
+    def _place_one(self, data, future):
+        try:
+            future.set_result(place_order(data))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _allocate(self, data, variants):
+        """Take stock for one request from the locked variants, all or nothing."""
+        needed = {}
+        for item in data["items"]:
+            needed[item["variant_id"]] = (
+                needed.get(item["variant_id"], 0) + item["quantity"]
+            )
+        for variant_id, quantity in needed.items():
+            variant = variants.get(variant_id)
+            if variant is None:
+                raise CheckoutError(f"Variant {variant_id} not found")
+            if variant.shard_count:
+                raise _Fallback()
+            if variant.stock_quantity < quantity:
+                raise CheckoutError(
+                    f"Insufficient stock for {variant.sku}. "
+                    f"Available: {variant.stock_quantity}"
+                )
+        for variant_id, quantity in needed.items():
+            variants[variant_id].stock_quantity -= quantity
+
+    def commit(self, batch):
+        """Commit a batch of (data, future) pairs in one transaction."""
+        variant_ids = sorted(
+            {item["variant_id"] for data, _ in batch for item in data["items"]}
+        )
+        outcomes = []
+        fallbacks = []
+
+        with transaction.atomic():
+            # Locking in id order keeps concurrent batches deadlock-free
+            variants = {
+                variant.id: variant
+                for variant in ProductVariant.objects.select_for_update()
+                .filter(id__in=variant_ids, is_active=True)
+                .order_by("id")
+            }
+            titles = dict(
+                ProductVariant.objects.filter(id__in=variants).values_list(
+                    "id", "product__title"
+                )
+            )
+            before = {
+                variant.id: variant.stock_quantity for variant in variants.values()
+            }
+
+            orders = []
+            lines = []
+            for data, future in batch:
+                try:
+                    self._allocate(data, variants)
+                except CheckoutError as e:
+                    outcomes.append((future, e))
+                    continue
+                except _Fallback:
+                    fallbacks.append((data, future))
+                    continue
+
+                order_lines = []
+                subtotal = Decimal("0.00")
+                weight = Decimal("0.00")
+                for item in data["items"]:
+                    variant = variants[item["variant_id"]]
+                    line = build_order_line(
+                        variant, titles[variant.id], item["quantity"]
+                    )
+                    subtotal += line.line_total
+                    weight += (variant.weight or 0) * item["quantity"]
+                    order_lines.append(line)
+
+                order = build_order(data, subtotal, weight)
+                order.reference = Order.generate_reference()
+                orders.append(order)
+                lines.append(order_lines)
+                outcomes.append((future, order))
+
+            now = timezone.now()
+            touched = [v for v in variants.values() if v.stock_quantity != before[v.id]]
+            for variant in touched:
+                variant.updated_at = now
+            ProductVariant.objects.bulk_update(
+                touched, ["stock_quantity", "updated_at"]
+            )
+
+            Order.objects.bulk_create(orders)
+            if orders and orders[0].pk is None:
+                # MySQL does not return primary keys from bulk_create
+                ids = dict(
+                    Order.objects.filter(
+                        reference__in=[order.reference for order in orders]
+                    ).values_list("reference", "id")
+                )
+                for order in orders:
+                    order.pk = ids[order.reference]
+
+            for order, order_lines in zip(orders, lines):
+                for line in order_lines:
+                    line.order = order
+            OrderLine.objects.bulk_create([line for group in lines for line in group])
+            record_new_orders(zip(orders, lines))
+            OutboxMessage.objects.bulk_create(
+                [message for order in orders for message in order_notifications(order)]
+            )
+
+        for future, outcome in outcomes:
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+        for data, future in fallbacks:
+            self._place_one(data, future)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    global _batcher
+
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = CheckoutBatcher()
+    return _batcher
+
+
+def submit_checkout(data):
+    """
+    Place an order through the batch queue, waiting at most
+    CHECKOUT_BATCH_MAX_WAIT seconds before falling back to ``place_order``.
+    Once its batch is being committed, the request can no longer fall back;
+    CheckoutPending is raised if that takes over CHECKOUT_BATCH_COMMIT_TIMEOUT
+    more seconds.
+    """
+    if any(is_sharded(item["variant_id"]) for item in data["items"]):
+        return place_order(data)
+
+    future = get_batcher().submit(data)
+    try:
+        return future.result(timeout=settings.CHECKOUT_BATCH_MAX_WAIT)
+    except FutureTimeout:
+        if future.cancel():
+            # Never reached the committer thread
+            return place_order(data)
+        # Already being committed: wait for its outcome
+        try:
+            return future.result(timeout=settings.CHECKOUT_BATCH_COMMIT_TIMEOUT)
+        except FutureTimeout:
+            logger.warning("Checkout batch still committing, giving up waiting")
+            raise CheckoutPending(
+                "Your order is taking longer than usual. "
+                "Check your confirmation email before trying again."
+            )
@@ -0,0 +1,63 @@
+"""
+Admin dashboard KPIs, computed at most once per DASHBOARD_CACHE_TTL seconds
+however many admin tabs poll them.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import analytics
+from .inventory import low_stock_variants
+from .models import Order
+from .utils import cached_computation
+
+CACHE_KEY = "store:dashboard:kpis"
+
+# Cash-on-delivery orders whose cash is still to be collected: on their way,
+# or delivered but not yet marked paid (payment_status is still "pending")
+COD_OPEN_STATUSES = ("confirmed", "shipped", "delivered")
+
+
+def compute_kpis():
+    """KPIs from the sales rollups plus a few indexed aggregate queries."""
+    today = timezone.localdate()
+    sales_today = analytics.summary(today, today)
+    sales_30_days = analytics.summary(today - timedelta(days=29), today)
+
+    cod = Order.objects.filter(
+        status__in=COD_OPEN_STATUSES,
+        payment_method="cash_on_delivery",
+        payment_status="pending",
+    ).aggregate(count=Count("id"), amount=Sum("total"))
+
+    return {
+        "generated_at": timezone.now().isoformat(),
+        "today": {
+            "orders": sales_today["orders"],
+            "revenue": sales_today["revenue"],
+        },
+        "last_30_days": {
+            "orders": sales_30_days["orders"],
+            "revenue": sales_30_days["revenue"],
+            "average_order_value": sales_30_days["average_order_value"],
+        },
+        "pending_orders": Order.objects.filter(status="pending").count(),
+        "cod_to_collect": {
+            "orders": cod["count"],
+            "amount": str(Decimal(cod["amount"] or 0).quantize(Decimal("0.00"))),
+        },
+        "low_stock_variants": low_stock_variants().filter(is_active=True).count(),
+    }
+
+
+def get_kpis():
+    return cached_computation(
+        CACHE_KEY,
+        compute_kpis,
+        ttl=settings.DASHBOARD_CACHE_TTL,
+        stale_ttl=settings.DASHBOARD_STALE_TTL,
+    )
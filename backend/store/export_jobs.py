@@ -0,0 +1,213 @@
+"""
+Background export jobs, produced by the ``run_exports`` worker command.
+
+Each job is written under ``MEDIA_ROOT/EXPORT_JOB_DIR`` as a gzip file with
+one gzip member per chunk. After every chunk the job row records the
+primary-key cursor and the file size, so when a worker dies mid-job the next
+one carries on from that checkpoint after the cursor.
+
+Every claim writes to a working file of its own (``claim_file``), which is
+renamed to the job's file once complete (``publish_file``). A worker wrongly
+judged stale can go on writing for a while after its job was taken over, but
+never to the file of the worker that took it over.
+"""
+
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import uuid
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .exports import DATASETS, csv_row
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+
+class Superseded(Exception):
+    """The job is no longer this worker's to run (taken over or cancelled)."""
+
+
+def media_path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def job_path(job):
+    return media_path(job.file)
+
+
+def download_name(job):
+    return f"{job.kind}-{job.id}.{job.format}.gz"
+
+
+def claim_job(model=ExportJob, stale_after=None):
+    """
+    Lock and start the oldest pending job, or a running one gone stale.
+    Shared with import jobs (store/import_jobs.py) through ``model``.
+    """
+    stale_after = stale_after or settings.EXPORT_JOB_STALE_AFTER
+    stale = timezone.now() - timedelta(seconds=stale_after)
+    with transaction.atomic():
+        queryset = model.objects.filter(
+            Q(status="pending") | Q(status="running", heartbeat_at__lt=stale)
+        ).order_by("created_at", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        job = queryset.first()
+        if job is None:
+            return None
+
+        now = timezone.now()
+        job.status = "running"
+        job.started_at = job.started_at or now
+        job.heartbeat_at = now
+        job.save(update_fields=["status", "started_at", "heartbeat_at"])
+    return job
+
+
+def checkpoint(job, **fields):
+    """
+    Save progress unless another worker has claimed the job since (or it was
+    cancelled), in which case raise Superseded.
+    """
+    fields["heartbeat_at"] = timezone.now()
+    updated = (
+        type(job)
+        .objects.filter(pk=job.pk, status="running", heartbeat_at=job.heartbeat_at)
+        .update(**fields)
+    )
+    if not updated:
+        raise Superseded()
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+PART_SUFFIX = ".part"
+
+
+def final_name(name):
+    """Name of the finished file for a ``claim_file`` working file name."""
+    if name.endswith(PART_SUFFIX):
+        return name[: -len(PART_SUFFIX)].rsplit(".", 1)[0]
+    return name
+
+
+def remove_file(name):
+    try:
+        os.remove(media_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def claim_file(job, field, size):
+    """
+    Point ``job.<field>`` (a file under MEDIA_ROOT) at a working file of this
+    claim's own, starting with the first ``size`` bytes of the file it named
+    so far, i.e. what the job had checkpointed. Returns the new name and the
+    file, open for writing at ``size``.
+    """
+    previous = getattr(job, field)
+    name = f"{final_name(previous)}.{uuid.uuid4().hex[:8]}{PART_SUFFIX}"
+    path = media_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "w+b")
+    try:
+        if size:
+            with open(media_path(previous), "rb") as source:
+                f.write(source.read(size))
+            if f.tell() != size:
+                raise OSError(f"{previous} is shorter than its checkpoint")
+        checkpoint(job, **{field: name})
+    except BaseException:
+        f.close()
+        remove_file(name)
+        raise
+    if previous.endswith(PART_SUFFIX):
+        # Left by the worker this claim took over from
+        remove_file(previous)
+    return name, f
+
+
+def publish_file(job, field, **fields):
+    """Rename this claim's working file to its final name, saving ``fields``."""
+    name = final_name(getattr(job, field))
+    os.replace(media_path(getattr(job, field)), media_path(name))
+    checkpoint(job, **{field: name}, **fields)
+
+
+def _encode(dataset, job, rows, header=False):
+    if job.format == "ndjson":
+        return "".join(
+            json.dumps(dict(zip(dataset.keys, row)), cls=DjangoJSONEncoder) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(dataset.header)
+    writer.writerows(csv_row(row) for row in rows)
+    return buffer.getvalue()
+
+
+def run_job(job, chunk_size=None):
+    """Write (or resume) a claimed job chunk by chunk until it completes."""
+    dataset = DATASETS[job.kind]
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    part = None
+
+    try:
+        if not job.file:
+            job.file = f"{settings.EXPORT_JOB_DIR}/{job.id}.{job.format}.gz"
+        if job.total_rows is None:
+            job.total_rows = dataset.queryset(job.params).count()
+        checkpoint(job, file=job.file, total_rows=job.total_rows)
+
+        # Anything written after the last checkpoint is left behind
+        part, f = claim_file(job, "file", job.bytes_written)
+        with f:
+            rows = dataset.rows(job.params, chunk_size=chunk_size, after=job.cursor)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk and job.bytes_written:
+                    break
+                text = _encode(
+                    dataset,
+                    job,
+                    [row for _, row in chunk],
+                    header=not job.bytes_written,
+                )
+                f.write(gzip.compress(text.encode("utf-8")))
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint(
+                    job,
+                    cursor=chunk[-1][0] if chunk else job.cursor,
+                    rows_written=job.rows_written + len(chunk),
+                    bytes_written=f.tell(),
+                )
+
+        publish_file(job, "file", status="completed", finished_at=timezone.now())
+    except Superseded:
+        logger.warning("Export job %s was taken over by another worker", job.id)
+        if part:
+            remove_file(part)
+    except Exception as e:
+        logger.exception("Export job %s failed", job.id)
+        if part:
+            remove_file(part)
+        ExportJob.objects.filter(pk=job.pk).update(
+            status="failed", error=str(e), finished_at=timezone.now()
+        )
+        job.status = "failed"
+        job.error = str(e)
+    return job
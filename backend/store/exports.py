@@ -0,0 +1,232 @@
+"""
+Memory-bounded exports of orders, products and audit logs.
+
+Rows are read in primary-key pages of ``EXPORT_CHUNK_SIZE`` as ``values_list``
+tuples, so neither model instances nor the full result set are ever held in
+memory (mysqlclient buffers a whole result set client-side, even with
+``QuerySet.iterator()``).
+"""
+
+import csv
+import io
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+
+from .inventory import current_stock
+from .models import AuditLog, Order, OrderLine, ProductVariant
+from .utils import start_of_day
+
+# (CSV header, values_list field) pairs
+ORDER_COLUMNS = [
+    ("Reference", "reference"),
+    ("Email", "email"),
+    ("Status", "status"),
+    ("Total", "total"),
+    ("Created At", "created_at"),
+    ("Payment Status", "payment_status"),
+    ("Name", "name"),
+    ("Phone", "phone"),
+    ("Wilaya", "wilaya__name"),
+    ("Baladiya", "baladiya__name"),
+    ("Subtotal", "subtotal"),
+    ("Shipping Cost", "shipping_cost"),
+]
+
+ORDER_LINE_COLUMNS = [
+    ("Reference", "order__reference"),
+    ("Status", "order__status"),
+    ("Created At", "order__created_at"),
+    ("SKU", "sku_snapshot"),
+    ("Title", "title_snapshot"),
+    ("Unit Price", "price_snapshot"),
+    ("Quantity", "quantity"),
+    ("Line Total", "line_total"),
+]
+
+PRODUCT_COLUMNS = [
+    ("Slug", "product__slug"),
+    ("Title", "product__title"),
+    ("Brand", "product__brand"),
+    ("Product Active", "product__is_active"),
+    ("SKU", "sku"),
+    ("Size", "size"),
+    ("Color", "color"),
+    ("Price", "price"),
+    ("Compare At Price", "compare_at_price"),
+    ("Stock Quantity", "current_stock"),  # shard total for sharded variants
+    ("Barcode", "barcode"),
+    ("Weight", "weight"),
+    ("Variant Active", "is_active"),
+]
+
+AUDIT_LOG_COLUMNS = [
+    ("Timestamp", "timestamp"),
+    ("User", "admin_user__username"),
+    ("Action", "action_type"),
+    ("Model", "model_name"),
+    ("Object Id", "object_id"),
+    ("Changes", "changes"),
+    ("IP Address", "ip_address"),
+]
+
+
+def _date_range(params, field):
+    """Whole-day bounds keep the index on ``field`` usable (no __date cast)."""
+    lookups = {}
+    if params.get("created_from"):
+        day = parse_date(params["created_from"])
+        if day is None:
+            raise ValueError("created_from must be a date (YYYY-MM-DD)")
+        lookups[f"{field}__gte"] = start_of_day(day)
+    if params.get("created_to"):
+        day = parse_date(params["created_to"])
+        if day is None:
+            raise ValueError("created_to must be a date (YYYY-MM-DD)")
+        lookups[f"{field}__lt"] = start_of_day(day + timedelta(days=1))
+    return lookups
+
+
+def order_filters(params, prefix=""):
+    """
+    Translate export query parameters into queryset lookups.
+
+    Supports ``created_from``/``created_to`` (inclusive ISO dates), ``status``
+    and ``wilaya`` (comma-separated). Raises ValueError for invalid values.
+    """
+    lookups = _date_range(params, f"{prefix}created_at")
+
+    if params.get("status"):
+        statuses = params["status"].split(",")
+        unknown = set(statuses) - set(dict(Order.ORDER_STATUS_CHOICES))
+        if unknown:
+            raise ValueError(f"Unknown status: {', '.join(sorted(unknown))}")
+        lookups[f"{prefix}status__in"] = statuses
+
+    if params.get("wilaya"):
+        try:
+            lookups[f"{prefix}wilaya_id__in"] = [
+                int(value) for value in params["wilaya"].split(",")
+            ]
+        except ValueError:
+            raise ValueError("wilaya must be a comma-separated list of ids")
+
+    return lookups
+
+
+def order_line_filters(params):
+    return order_filters(params, prefix="order__")
+
+
+def product_filters(params):
+    """Optional ``is_active`` (true/false) filter on variants."""
+    if params.get("is_active") in (None, ""):
+        return {}
+    return {"is_active": str(params["is_active"]).lower() in ("1", "true")}
+
+
+def audit_log_filters(params):
+    """``created_from``/``created_to`` on the timestamp, plus model and action."""
+    lookups = _date_range(params, "timestamp")
+    if params.get("model_name"):
+        lookups["model_name"] = params["model_name"]
+    if params.get("action_type"):
+        lookups["action_type"] = params["action_type"]
+    return lookups
+
+
+class Dataset:
+    """An exportable model: its columns and query-parameter filters."""
+
+    def __init__(self, model, columns, filters, annotations=None):
+        self.model = model
+        self.columns = columns
+        self.filters = filters
+        self.annotations = annotations or {}
+
+    @property
+    def header(self):
+        return [name for name, _ in self.columns]
+
+    @property
+    def keys(self):
+        """Field names used for NDJSON records."""
+        return [name.lower().replace(" ", "_") for name, _ in self.columns]
+
+    def queryset(self, params):
+        """Filtered queryset; raises ValueError for invalid ``params``."""
+        return self.model.objects.annotate(**self.annotations).filter(
+            **self.filters(params)
+        )
+
+    def rows(self, params, chunk_size=None, after=0):
+        """Yield ``(pk, row)`` pairs, see ``iter_rows``."""
+        return iter_rows(
+            self.queryset(params),
+            [field for _, field in self.columns],
+            chunk_size=chunk_size,
+            after=after,
+        )
+
+
+DATASETS = {
+    "orders": Dataset(Order, ORDER_COLUMNS, order_filters),
+    "order_lines": Dataset(OrderLine, ORDER_LINE_COLUMNS, order_line_filters),
+    "products": Dataset(
+        ProductVariant,
+        PRODUCT_COLUMNS,
+        product_filters,
+        {"current_stock": current_stock()},
+    ),
+    "audit_logs": Dataset(AuditLog, AUDIT_LOG_COLUMNS, audit_log_filters),
+}
+
+
+def iter_rows(queryset, fields, chunk_size=None, after=0):
+    """
+    Yield ``(pk, row)`` for ``queryset`` in primary-key order, one page of
+    ``chunk_size`` rows at a time, starting after primary key ``after``.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    queryset = queryset.order_by("pk").values_list("pk", *fields)
+    while True:
+        page = list(queryset.filter(pk__gt=after)[:chunk_size])
+        if not page:
+            return
+        for pk, *row in page:
+            yield pk, row
+        after = page[-1][0]
+
+
+def order_export(params, lines=False):
+    """(header, rows) for an order or order-line export filtered by ``params``."""
+    dataset = DATASETS["order_lines" if lines else "orders"]
+    rows = (row for _, row in dataset.rows(params))
+    return dataset.header, rows
+
+
+def csv_row(row):
+    """JSON-encode structured values (audit log changes) for CSV cells."""
+    return [
+        json.dumps(value, cls=DjangoJSONEncoder)
+        if isinstance(value, (dict, list))
+        else value
+        for value in row
+    ]
+
+
+def stream_csv(header, rows, rows_per_chunk=1000):
+    """Encode rows as CSV text, yielding one string per ``rows_per_chunk`` rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(csv_row(row))
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,95 @@
+"""
+Process-wide, read-only registry of Wilayas and Baladiyas.
+
+Geography almost never changes, so each worker loads it once and answers
+checkout validation from memory. A version stamp in the cache lets one
+process (admin edit, ``seed_wilayas``) tell the others to reload.
+"""
+
+from collections import namedtuple
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .models import Baladiya, Wilaya
+from .utils import VersionedSnapshot
+
+VERSION_CACHE_KEY = "store:geography:version"
+
+WilayaEntry = namedtuple("WilayaEntry", ["id", "name", "code"])
+BaladiyaEntry = namedtuple("BaladiyaEntry", ["id", "name", "wilaya_id"])
+
+
+class GeographyRegistry:
+    """Immutable snapshot of all wilayas and baladiyas."""
+
+    def __init__(self, version, wilayas, baladiyas):
+        self.version = version
+        self.wilayas = MappingProxyType({w.id: w for w in wilayas})
+        self.baladiyas = MappingProxyType({b.id: b for b in baladiyas})
+        self._wilayas_by_name = MappingProxyType({w.name.lower(): w for w in wilayas})
+        self._baladiyas_by_name = MappingProxyType(
+            {(b.wilaya_id, b.name.lower()): b for b in baladiyas}
+        )
+
+    def wilaya(self, wilaya_id):
+        return self.wilayas.get(wilaya_id)
+
+    def baladiya(self, baladiya_id):
+        return self.baladiyas.get(baladiya_id)
+
+    def baladiya_in_wilaya(self, baladiya_id, wilaya_id):
+        baladiya = self.baladiyas.get(baladiya_id)
+        return baladiya is not None and baladiya.wilaya_id == wilaya_id
+
+    def wilaya_by_name(self, name):
+        return self._wilayas_by_name.get(name.strip().lower())
+
+    def baladiya_by_name(self, wilaya_id, name):
+        return self._baladiyas_by_name.get((wilaya_id, name.strip().lower()))
+
+    def wilaya_instance(self, wilaya_id):
+        """Wilaya model instance built from the registry, without a query."""
+        entry = self.wilayas[wilaya_id]
+        return _as_saved(Wilaya(id=entry.id, name=entry.name, code=entry.code))
+
+    def baladiya_instance(self, baladiya_id):
+        """Baladiya model built from the registry, with its wilaya attached."""
+        entry = self.baladiyas[baladiya_id]
+        baladiya = Baladiya(id=entry.id, name=entry.name, wilaya_id=entry.wilaya_id)
+        baladiya.wilaya = self.wilaya_instance(entry.wilaya_id)
+        return _as_saved(baladiya)
+
+
+def _as_saved(instance):
+    instance._state.adding = False
+    return instance
+
+
+def _load(version):
+    wilayas = [
+        WilayaEntry(*row) for row in Wilaya.objects.values_list("id", "name", "code")
+    ]
+    baladiyas = [
+        BaladiyaEntry(*row)
+        for row in Baladiya.objects.values_list("id", "name", "wilaya_id")
+    ]
+    return GeographyRegistry(version, wilayas, baladiyas)
+
+
+_snapshot = VersionedSnapshot(
+    VERSION_CACHE_KEY, _load, settings.GEOGRAPHY_REGISTRY_MAX_AGE
+)
+
+
+def get_registry():
+    """Return the current registry, loading it if missing or out of date."""
+    return _snapshot.get()
+
+
+def invalidate_registry():
+    """Drop this process's registry and make every worker reload it."""
+    _snapshot.invalidate()
+
+
+geography_changed = _snapshot.changed
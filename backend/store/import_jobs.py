@@ -0,0 +1,133 @@
+"""
+Background product imports, processed by the ``run_imports`` worker command.
+
+Uploads are stored under ``MEDIA_ROOT/IMPORT_JOB_DIR`` and imported chunk by
+chunk with ``ProductImport``. After every chunk the job row records how many
+records are done and the size of its error report, so a job left behind by a
+dead worker is resumed from there. As with exports, each claim writes the
+error report to a working file of its own. Cancelling a job makes its worker
+stop at the next checkpoint.
+"""
+
+import csv
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.utils import timezone
+
+from .export_jobs import (
+    Superseded,
+    checkpoint,
+    claim_file,
+    claim_job,
+    media_path,
+    publish_file,
+    remove_file,
+)
+from .imports import ERROR_COLUMNS, ProductImport
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+
+def create_job(user, upload, deactivate_missing=False):
+    """Store an uploaded CSV file and queue it as an import job."""
+    job = ImportJob.objects.create(
+        created_by=user,
+        original_name=upload.name[:255],
+        file_size=upload.size,
+        deactivate_missing=deactivate_missing,
+    )
+    job.file = f"{settings.IMPORT_JOB_DIR}/{job.id}.csv"
+    job.errors_file = f"{settings.IMPORT_JOB_DIR}/{job.id}.errors.csv"
+    path = media_path(job.file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    job.save(update_fields=["file", "errors_file"])
+    return job
+
+
+def claim_import_job():
+    return claim_job(ImportJob, settings.IMPORT_JOB_STALE_AFTER)
+
+
+def cancel_job(job):
+    """Cancel a pending or running job; returns False if it already ended."""
+    cancelled = ImportJob.objects.filter(
+        pk=job.pk, status__in=("pending", "running")
+    ).update(status="cancelled", finished_at=timezone.now())
+    job.refresh_from_db()
+    return bool(cancelled)
+
+
+def _encode_errors(errors, header=False):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, ERROR_COLUMNS)
+    if header:
+        writer.writeheader()
+    writer.writerows(errors)
+    return buffer.getvalue().encode("utf-8")
+
+
+def run_job(job, chunk_size=None):
+    """Import (or resume) a claimed job until it completes or is cancelled."""
+    importer = ProductImport(chunk_size, deactivate_missing=job.deactivate_missing)
+    importer.rows = job.rows_processed
+    importer.imported = job.imported
+    importer.created = job.created
+    importer.updated = job.updated
+    importer.unchanged = job.unchanged
+    importer.deactivated = job.deactivated
+    importer.seconds = job.seconds
+    part = None
+
+    try:
+        # Errors reported after the last checkpoint are left behind
+        part, errors = claim_file(job, "errors_file", job.errors_bytes)
+        with errors:
+
+            def save_progress(importer):
+                if importer.errors or not job.errors_bytes:
+                    errors.write(
+                        _encode_errors(importer.errors, header=not job.errors_bytes)
+                    )
+                    errors.flush()
+                checkpoint(
+                    job,
+                    rows_processed=importer.rows,
+                    imported=importer.imported,
+                    created=importer.created,
+                    updated=importer.updated,
+                    unchanged=importer.unchanged,
+                    deactivated=importer.deactivated,
+                    error_count=job.error_count + len(importer.errors),
+                    errors_bytes=errors.tell(),
+                    seconds=importer.seconds,
+                )
+                importer.errors.clear()
+
+            with open(media_path(job.file), "rb") as f:
+                importer.run(f, skip=job.rows_processed, on_chunk=save_progress)
+            save_progress(importer)
+
+        publish_file(job, "errors_file", status="completed", finished_at=timezone.now())
+    except Superseded:
+        job.refresh_from_db()
+        if job.status == "cancelled":
+            # Its error report stays available
+            logger.info("Import job %s was cancelled", job.id)
+        else:
+            logger.warning("Import job %s was taken over by another worker", job.id)
+            if part and part != job.errors_file:
+                remove_file(part)
+    except Exception as e:
+        logger.exception("Import job %s failed", job.id)
+        ImportJob.objects.filter(pk=job.pk, status="running").update(
+            status="failed", error=str(e), finished_at=timezone.now()
+        )
+        job.refresh_from_db()
+    return job
@@ -0,0 +1,557 @@
+"""
+Streaming product CSV import.
+
+Columns: ``slug`` and/or ``title``, ``sku`` and ``price`` are required;
+``description``, ``brand``, ``is_active``, ``size``, ``color``,
+``stock_quantity``, ``variant_active``, ``compare_at_price``, ``categories``
+(category slugs) and ``images`` (image URLs) are optional, lists being
+separated by ``|``. Optional columns missing from the file are left
+unchanged on existing products and variants.
+
+The upload is decoded and parsed line by line, and rows are upserted
+``PRODUCT_IMPORT_CHUNK_SIZE`` at a time with ``bulk_create(update_conflicts=
+True)`` keyed on product ``slug`` and variant ``sku`` (MySQL's ON DUPLICATE
+KEY UPDATE takes no target and matches them as unique keys), one transaction
+per chunk. Invalid rows are reported and skipped; the rest of the file is still
+imported. A dry run reports the same errors without writing anything.
+
+Each variant stores a hash of the row it was last imported from, so rows
+identical to the previous import of their SKU are counted as unchanged and
+not written at all (changes made since outside the importer, e.g. sales
+lowering stock, are kept). With ``deactivate_missing`` imported variants
+whose SKU is not in the file are deactivated once the whole file is done,
+and reactivated by the first import that lists them again.
+"""
+
+import codecs
+import csv
+import hashlib
+import json
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import DatabaseError, NotSupportedError, connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Category, Product, ProductCategory, ProductImage, ProductVariant
+from .shipping import evict_variant_pricing
+
+# Model field -> CSV column it comes from; fields are only updated on
+# existing rows when their column is in the file
+PRODUCT_COLUMNS = {
+    "title": "title",
+    "description": "description",
+    "brand": "brand",
+    "is_active": "is_active",
+}
+VARIANT_COLUMNS = {
+    "size": "size",
+    "color": "color",
+    "price": "price",
+    "compare_at_price": "compare_at_price",
+    "stock_quantity": "stock_quantity",
+    "is_active": "variant_active",
+    "image_main": "images",  # first image
+}
+
+LIST_SEPARATOR = "|"
+
+# import_hash of variants deactivated by deactivate_missing_skus: never equal
+# to a row hash, and the only inactive variants an import reactivates
+MISSING_HASH = "missing"
+
+MAX_PRICE = Decimal("99999999.99")
+
+# Keys of each reported error, and the columns of error reports
+ERROR_COLUMNS = ["row", "sku", "error"]
+
+# ``categories`` and ``images`` are None when the file has no such column;
+# ``digest`` is the row's content hash, stored as ProductVariant.import_hash
+ParsedRow = namedtuple(
+    "ParsedRow",
+    ["number", "slug", "product", "sku", "variant", "categories", "images", "digest"],
+)
+
+_validate_url = URLValidator()
+
+
+def _text(row, column, max_length, required=False):
+    value = (row.get(column) or "").strip()
+    if required and not value:
+        raise ValueError(f"{column} is required")
+    if len(value) > max_length:
+        raise ValueError(f"{column} is longer than {max_length} characters")
+    return value
+
+
+def _bool(row, column):
+    value = (row.get(column) or "").strip().lower()
+    if value in ("", "1", "true", "yes"):
+        return True
+    if value in ("0", "false", "no"):
+        return False
+    raise ValueError(f"{column} must be true or false")
+
+
+def _price(row, column):
+    try:
+        value = Decimal((row.get(column) or "").strip())
+    except InvalidOperation:
+        raise ValueError(f"{column} must be a decimal number")
+    if not value.is_finite() or value < 0 or value > MAX_PRICE:
+        raise ValueError(f"{column} must be between 0 and {MAX_PRICE}")
+    if value.as_tuple().exponent < -2:
+        raise ValueError(f"{column} has more than 2 decimal places")
+    return value
+
+
+def _quantity(row, column):
+    value = (row.get(column) or "0").strip()
+    try:
+        quantity = int(value)
+    except ValueError:
+        raise ValueError(f"{column} must be a whole number")
+    if quantity < 0:
+        raise ValueError(f"{column} cannot be negative")
+    return quantity
+
+
+def _list(row, column):
+    if column not in row:
+        return None
+    return tuple(
+        item.strip()
+        for item in (row[column] or "").split(LIST_SEPARATOR)
+        if item.strip()
+    )
+
+
+def _images(row):
+    urls = _list(row, "images")
+    for url in urls or ():
+        if len(url) > 200:
+            raise ValueError("images: URL is longer than 200 characters")
+        try:
+            _validate_url(url)
+        except ValidationError:
+            raise ValueError(f"images: invalid URL {url}")
+    return urls
+
+
+def parse_row(number, row):
+    """
+    Validate one CSV record; raises ValueError with a readable message.
+    Optional fields are only set when their column is in the file.
+    """
+    title = _text(row, "title", 200)
+    slug = _text(row, "slug", 200) or slugify(title)
+    if not slug:
+        raise ValueError("slug or title is required")
+    product = {"title": title or slug}
+    if "description" in row:
+        product["description"] = row["description"] or ""
+    if "brand" in row:
+        product["brand"] = _text(row, "brand", 100)
+    if "is_active" in row:
+        product["is_active"] = _bool(row, "is_active")
+
+    variant = {"price": _price(row, "price")}
+    for field in ("size", "color"):
+        if field in row:
+            variant[field] = _text(row, field, 50)
+    if "stock_quantity" in row:
+        variant["stock_quantity"] = _quantity(row, "stock_quantity")
+    if "variant_active" in row:
+        variant["is_active"] = _bool(row, "variant_active")
+    if "compare_at_price" in row:
+        compare_at = (row["compare_at_price"] or "").strip()
+        variant["compare_at_price"] = (
+            _price(row, "compare_at_price") if compare_at else None
+        )
+    images = _images(row)
+    if images is not None:
+        variant["image_main"] = images[0] if images else None
+
+    sku = _text(row, "sku", 100, True)
+    categories = _list(row, "categories")
+    digest = hashlib.sha1(
+        json.dumps(
+            [slug, product, sku, variant, categories, images],
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+    return ParsedRow(number, slug, product, sku, variant, categories, images, digest)
+
+
+def parse_records(records):
+    """
+    ``(number, sku, ParsedRow or None, error or None)`` for a list of
+    ``(line number, record)`` pairs. Runs in pool workers for parallel
+    validation, so it must not touch the database.
+    """
+    results = []
+    for number, record in records:
+        sku = (record.get("sku") or "").strip()
+        try:
+            results.append((number, sku, parse_row(number, record), None))
+        except ValueError as e:
+            results.append((number, sku, None, str(e)))
+    return results
+
+
+def read_csv(file):
+    """
+    ``(columns, records)`` for an uploaded CSV file, ``records`` yielding
+    ``(line number, record)`` without reading the file into memory. Raises
+    ValueError if required columns are missing.
+    """
+    reader = csv.DictReader(codecs.iterdecode(file, "utf-8-sig"))
+    columns = set(reader.fieldnames or ())
+    missing = {"sku", "price"} - columns
+    if not {"slug", "title"} & columns:
+        missing.add("slug or title")
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    return columns, ((reader.line_num, record) for record in reader)
+
+
+def existing_variants(skus):
+    """
+    {sku: (variant id, product slug, shard count, import hash)} for SKUs
+    already stored.
+    """
+    rows = (
+        ProductVariant.objects.filter(sku__in=skus)
+        .order_by()
+        .values_list("sku", "id", "product__slug", "shard_count", "import_hash")
+    )
+    return {sku: values for sku, *values in rows}
+
+
+def _bounded_map(pool, fn, items, window):
+    """``pool.map`` that keeps at most ``window`` items in flight, in order."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _conflict_target(fields):
+    """``unique_fields`` of an upsert, for backends that take a conflict target."""
+    if connection.features.supports_update_conflicts_with_target:
+        return fields
+    return None
+
+
+class ProductImport:
+    """
+    One import run: row, write and error counters plus throughput.
+
+    ``imported`` counts the rows written (``created`` plus ``updated``).
+    With ``dry_run`` every check runs (including the database ones) but
+    nothing is written; ``imported`` then counts the valid rows. With
+    ``workers`` > 1 rows are parsed and validated in a process pool while
+    this process checks and writes them chunk by chunk.
+    """
+
+    def __init__(
+        self, chunk_size=None, dry_run=False, workers=1, deactivate_missing=False
+    ):
+        self.chunk_size = chunk_size or settings.PRODUCT_IMPORT_CHUNK_SIZE
+        self.dry_run = dry_run
+        self.workers = workers
+        self.deactivate_missing = deactivate_missing
+        self.rows = 0
+        self.imported = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deactivated = 0
+        self.errors = []  # {"row", "sku", "error"}
+        self.seconds = 0.0
+        self.columns = set()
+        self._seen_skus = {}  # sku -> first row number
+        self._feed_skus = set()  # every SKU in the file, valid or not
+        self._category_ids = None  # slug -> id, loaded on first use
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds) if self.seconds else 0
+
+    def error(self, number, sku, message):
+        self.errors.append({"row": number, "sku": sku, "error": message})
+
+    def updated_fields(self, columns):
+        """Model fields of ``columns`` (PRODUCT_/VARIANT_COLUMNS) in the file."""
+        return [field for field, column in columns.items() if column in self.columns]
+
+    @property
+    def category_ids(self):
+        if self._category_ids is None:
+            self._category_ids = dict(Category.objects.values_list("slug", "id"))
+        return self._category_ids
+
+    def run(self, file, skip=0, on_chunk=None):
+        """
+        Import every row of ``file`` after the first ``skip`` (already
+        imported by an earlier run), calling ``on_chunk(self)`` after each
+        chunk, then deactivate missing SKUs if asked to. Returns ``self``.
+        """
+        started = time.monotonic() - self.seconds
+        self.columns, records = read_csv(file)
+        for number, record in islice(records, skip):
+            # Still catch SKUs repeated after the resume point
+            sku = (record.get("sku") or "").strip()
+            self._seen_skus.setdefault(sku, number)
+            self._feed_skus.add(sku)
+        chunks = iter(lambda: list(islice(records, self.chunk_size)), [])
+
+        with ExitStack() as stack:
+            if self.workers > 1:
+                # django.setup() lets spawned (non-fork) workers import this module
+                pool = stack.enter_context(
+                    ProcessPoolExecutor(self.workers, initializer=django.setup)
+                )
+                parsed_chunks = _bounded_map(
+                    pool, parse_records, chunks, self.workers * 2
+                )
+            else:
+                parsed_chunks = map(parse_records, chunks)
+            for parsed in parsed_chunks:
+                self.import_chunk(parsed)
+                self.seconds = time.monotonic() - started
+                if on_chunk:
+                    on_chunk(self)
+        if self.deactivate_missing and self.rows:
+            self.deactivate_missing_skus()
+            self.seconds = time.monotonic() - started
+        return self
+
+    def import_chunk(self, parsed_records):
+        """Check and upsert one chunk of ``parse_records`` results."""
+        self.rows += len(parsed_records)
+        parsed = []
+        for number, sku, row, error in parsed_records:
+            self._feed_skus.add(sku)
+            if error:
+                self.error(number, sku, error)
+                continue
+            if row.sku in self._seen_skus:
+                self.error(
+                    number,
+                    sku,
+                    f"Duplicate SKU (first seen on row {self._seen_skus[row.sku]})",
+                )
+                continue
+            self._seen_skus[row.sku] = number
+            parsed.append(row)
+
+        existing = existing_variants([row.sku for row in parsed])
+        accepted = []
+        for row in parsed:
+            unknown = [
+                slug for slug in row.categories or () if slug not in self.category_ids
+            ]
+            if row.sku in existing and existing[row.sku][1] != row.slug:
+                self.error(
+                    row.number,
+                    row.sku,
+                    f"SKU belongs to product {existing[row.sku][1]}",
+                )
+            elif unknown:
+                self.error(
+                    row.number, row.sku, f"Unknown categories: {', '.join(unknown)}"
+                )
+            elif row.sku in existing and existing[row.sku][3] == row.digest:
+                self.unchanged += 1
+                if self.dry_run:
+                    self.imported += 1  # still a valid row
+            else:
+                accepted.append(row)
+
+        if self.dry_run:
+            self._count(accepted, existing)
+            return
+        try:
+            self._write(accepted, existing)
+            self._count(accepted, existing)
+        except NotSupportedError:
+            # The backend cannot run the import at all, not a bad row
+            raise
+        except DatabaseError:
+            # Find the offending rows by writing the chunk row by row
+            for row in accepted:
+                try:
+                    self._write([row], existing)
+                    self._count([row], existing)
+                except NotSupportedError:
+                    raise
+                except DatabaseError as e:
+                    self.error(row.number, row.sku, str(e))
+
+    def _count(self, rows, existing):
+        created = sum(row.sku not in existing for row in rows)
+        self.created += created
+        self.updated += len(rows) - created
+        self.imported += len(rows)
+
+    def _write(self, rows, existing):
+        """
+        Upsert ``rows`` in one transaction; ``existing`` is their
+        ``existing_variants``.
+        """
+        if not rows:
+            return
+        with transaction.atomic():
+            # Several rows (variants) usually share a product: the last one wins
+            products = {row.slug: row.product for row in rows}
+            Product.objects.bulk_create(
+                [Product(slug=slug, **fields) for slug, fields in products.items()],
+                update_conflicts=True,
+                unique_fields=_conflict_target(["slug"]),
+                update_fields=self.updated_fields(PRODUCT_COLUMNS) + ["updated_at"],
+            )
+            # MySQL does not return ids from an upsert
+            product_ids = dict(
+                Product.objects.filter(slug__in=products)
+                .order_by()
+                .values_list("slug", "id")
+            )
+
+            plain, sharded = [], []
+            for row in rows:
+                variant = ProductVariant(
+                    product_id=product_ids[row.slug],
+                    sku=row.sku,
+                    import_hash=row.digest,
+                    **row.variant,
+                )
+                is_sharded = row.sku in existing and existing[row.sku][2]
+                (sharded if is_sharded else plain).append(variant)
+            fields = self.updated_fields(VARIANT_COLUMNS)
+            self._upsert_variants(plain, fields)
+            # Sharded stock lives in StockShard rows; leave it to the shard tools
+            self._upsert_variants(
+                sharded, [field for field in fields if field != "stock_quantity"]
+            )
+            if "variant_active" not in self.columns:
+                # SKUs deactivated as missing are back in the feed
+                returning = [
+                    existing[row.sku][0]
+                    for row in rows
+                    if row.sku in existing and existing[row.sku][3] == MISSING_HASH
+                ]
+                if returning:
+                    ProductVariant.objects.filter(
+                        id__in=returning, is_active=False
+                    ).update(is_active=True)
+            if "categories" in self.columns:
+                self._replace_categories(rows, product_ids)
+            if "images" in self.columns:
+                self._replace_images(rows)
+
+            evict_variant_pricing(
+                [existing[row.sku][0] for row in rows if row.sku in existing]
+            )
+
+    def _upsert_variants(self, variants, fields):
+        if variants:
+            ProductVariant.objects.bulk_create(
+                variants,
+                update_conflicts=True,
+                unique_fields=_conflict_target(["sku"]),
+                update_fields=fields + ["import_hash", "updated_at"],
+            )
+
+    def _replace_categories(self, rows, product_ids):
+        """Make each product's categories those of its last row."""
+        categories = {product_ids[row.slug]: row.categories for row in rows}
+        ProductCategory.objects.filter(product_id__in=categories).delete()
+        ProductCategory.objects.bulk_create(
+            ProductCategory(product_id=product_id, category_id=self.category_ids[slug])
+            for product_id, slugs in categories.items()
+            for slug in dict.fromkeys(slugs)
+        )
+
+    def _replace_images(self, rows):
+        """Make each variant's images those listed in its row."""
+        variant_ids = dict(
+            ProductVariant.objects.filter(sku__in=[row.sku for row in rows])
+            .order_by()
+            .values_list("sku", "id")
+        )
+        ProductImage.objects.filter(variant_id__in=variant_ids.values()).delete()
+        ProductImage.objects.bulk_create(
+            ProductImage(
+                variant_id=variant_ids[row.sku],
+                image_url=url,
+                alt_text=row.product["title"],
+                position=position,
+            )
+            for row in rows
+            for position, url in enumerate(row.images)
+        )
+
+    def deactivate_missing_skus(self):
+        """
+        Deactivate active imported variants whose SKU was not in the file
+        (only count them in a dry run). Variants created elsewhere are left
+        alone.
+        """
+        missing = [
+            pk
+            for pk, sku in ProductVariant.objects.filter(is_active=True)
+            .exclude(import_hash="")
+            .order_by()
+            .values_list("id", "sku")
+            .iterator(chunk_size=self.chunk_size)
+            if sku not in self._feed_skus
+        ]
+        self.deactivated += len(missing)
+        if self.dry_run:
+            return
+        for start in range(0, len(missing), self.chunk_size):
+            ids = missing[start : start + self.chunk_size]
+            with transaction.atomic():
+                # A SKU coming back is written and reactivated even if its row
+                # is the same
+                ProductVariant.objects.filter(id__in=ids).update(
+                    is_active=False,
+                    import_hash=MISSING_HASH,
+                    updated_at=timezone.now(),
+                )
+                evict_variant_pricing(ids)
+
+    def summary(self):
+        return {
+            "rows": self.rows,
+            "valid" if self.dry_run else "imported": self.imported,
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "deactivated": self.deactivated,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": self.rows_per_second,
+        }
+
+
+def import_products(
+    file, chunk_size=None, dry_run=False, workers=1, deactivate_missing=False
+):
+    """Import a product CSV upload; returns the ``ProductImport`` summary."""
+    importer = ProductImport(chunk_size, dry_run, workers, deactivate_missing)
+    return importer.run(file).summary()
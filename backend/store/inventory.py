@@ -0,0 +1,317 @@
+"""
+Stock reservation, including opt-in sharded stock for hot SKUs.
+
+A sharded variant keeps its stock in ``StockShard`` rows instead of
+``stock_quantity``. Checkouts decrement one random shard, so concurrent
+orders for the same SKU lock different rows. ``stock_quantity`` then holds
+the total as of the last shard/rebalance/consolidate operation, so readers
+use ``available_stock`` or the ``current_stock()`` expression instead, and
+admin edits of ``stock_quantity`` are refused for sharded variants.
+"""
+
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Case,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import OrderLine, ProductVariant, StockShard
+from .utils import VersionedSnapshot
+
+SHARDED_VERSION_CACHE_KEY = "store:inventory:sharded:version"
+TOTAL_CACHE_KEY = "store:inventory:total:{}"
+
+
+class InsufficientStock(Exception):
+    """Raised when a variant cannot cover the requested quantity."""
+
+    def __init__(self, variant, available):
+        self.variant = variant
+        self.available = available
+        super().__init__(
+            f"Insufficient stock for {variant.sku}. Available: {available}"
+        )
+
+
+def current_stock():
+    """
+    Query expression for a variant's stock: ``stock_quantity``, or the sum of
+    its shards if it is sharded.
+    """
+    shard_total = (
+        StockShard.objects.filter(variant=OuterRef("pk"))
+        .order_by()
+        .values("variant")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    return Case(
+        When(shard_count=0, then=F("stock_quantity")),
+        default=Coalesce(Subquery(shard_total), 0),
+        output_field=IntegerField(),
+    )
+
+
+def low_stock_variants(queryset=None):
+    """
+    Variants at or below their low-stock threshold, ordered from the most
+    short of stock. Plain variants are found through the expression index
+    (``store_variant_low_stock_idx``); the few sharded ones are checked
+    against their shard totals first.
+    """
+    queryset = ProductVariant.objects.all() if queryset is None else queryset
+    queryset = queryset.alias(
+        stock_margin=F("stock_quantity") - F("low_stock_threshold")
+    )
+    sharded_ids = _sharded.get()
+    sharded = {}  # id -> margin of the sharded variants that are low
+    if sharded_ids:
+        sharded = dict(
+            ProductVariant.objects.filter(id__in=sharded_ids, shard_count__gt=0)
+            .annotate(margin=current_stock() - F("low_stock_threshold"))
+            .filter(margin__lte=0)
+            .values_list("id", "margin")
+        )
+    if not sharded:
+        return queryset.filter(stock_margin__lte=0, shard_count=0).order_by(
+            "stock_margin", "id"
+        )
+    return (
+        queryset.filter(Q(stock_margin__lte=0, shard_count=0) | Q(id__in=list(sharded)))
+        .alias(
+            margin=Case(
+                *[When(id=pk, then=Value(margin)) for pk, margin in sharded.items()],
+                default=F("stock_margin"),
+            )
+        )
+        .order_by("margin", "id")
+    )
+
+
+def _load_sharded_ids(version):
+    return frozenset(
+        ProductVariant.objects.filter(shard_count__gt=0).values_list("id", flat=True)
+    )
+
+
+_sharded = VersionedSnapshot(
+    SHARDED_VERSION_CACHE_KEY, _load_sharded_ids, settings.SHARDED_STOCK_MAX_AGE
+)
+
+
+def is_sharded(variant_id):
+    return variant_id in _sharded.get()
+
+
+def _split(total, shards):
+    base, extra = divmod(total, shards)
+    return [base + (1 if index < extra else 0) for index in range(shards)]
+
+
+def _locked_total(variant):
+    """Current stock of a locked variant, locking its shards as well."""
+    if not variant.shard_count:
+        return variant.stock_quantity
+    shards = StockShard.objects.select_for_update().filter(variant=variant)
+    return sum(shard.quantity for shard in shards)
+
+
+def _take_from_shards(variant, quantity):
+    """
+    Take stock from the shards of a sharded variant.
+    Returns False if the variant has no shards (it was consolidated).
+    """
+    candidates = list(
+        StockShard.objects.filter(variant=variant, quantity__gte=quantity).values_list(
+            "id", flat=True
+        )
+    )
+    random.shuffle(candidates)
+    for shard_id in candidates:
+        # Conditional decrement: only this shard's row is locked
+        if StockShard.objects.filter(id=shard_id, quantity__gte=quantity).update(
+            quantity=F("quantity") - quantity
+        ):
+            cache.delete(TOTAL_CACHE_KEY.format(variant.pk))
+            return True
+
+    # No single shard covers the quantity: lock them all and take greedily
+    shards = list(
+        StockShard.objects.select_for_update().filter(variant=variant).order_by("index")
+    )
+    if not shards:
+        return False
+    available = sum(shard.quantity for shard in shards)
+    if available < quantity:
+        raise InsufficientStock(variant, available)
+
+    remaining = quantity
+    for shard in shards:
+        taken = min(shard.quantity, remaining)
+        shard.quantity -= taken
+        remaining -= taken
+    StockShard.objects.bulk_update(shards, ["quantity"])
+    cache.delete(TOTAL_CACHE_KEY.format(variant.pk))
+    return True
+
+
+def reserve_stock(variant_id, quantity):
+    """
+    Take ``quantity`` units of an active variant inside the caller's
+    transaction and return the variant.
+    Raises ProductVariant.DoesNotExist or InsufficientStock.
+    """
+    if is_sharded(variant_id):
+        variant = ProductVariant.objects.get(id=variant_id, is_active=True)
+        if variant.shard_count and _take_from_shards(variant, quantity):
+            return variant
+
+    variant = ProductVariant.objects.select_for_update().get(
+        id=variant_id, is_active=True
+    )
+    # Sharded after this worker's snapshot was taken
+    if variant.shard_count and _take_from_shards(variant, quantity):
+        return variant
+
+    if variant.stock_quantity < quantity:
+        raise InsufficientStock(variant, variant.stock_quantity)
+    variant.stock_quantity -= quantity
+    variant.save(update_fields=["stock_quantity", "updated_at"])
+    return variant
+
+
+def restore_stock(order_ids):
+    """
+    Put the stock of the given orders' lines back, inside the caller's
+    transaction. Plain variants get one ``UPDATE ... CASE`` statement and
+    sharded variants another, on their first shard. Returns the number of
+    units restored per variant id.
+    """
+    quantities = dict(
+        OrderLine.objects.filter(order_id__in=order_ids, product_variant__isnull=False)
+        .values("product_variant")
+        .annotate(total=Sum("quantity"))
+        .values_list("product_variant", "total")
+    )
+    if not quantities:
+        return {}
+
+    # Locking the variants keeps shard/consolidate from moving stock meanwhile
+    sharded = {
+        variant_id
+        for variant_id, shard_count in ProductVariant.objects.select_for_update()
+        .filter(id__in=quantities)
+        .order_by("id")
+        .values_list("id", "shard_count")
+        if shard_count
+    }
+    plain = [variant_id for variant_id in quantities if variant_id not in sharded]
+
+    if plain:
+        ProductVariant.objects.filter(id__in=plain).update(
+            stock_quantity=Case(
+                *[
+                    When(
+                        id=variant_id, then=F("stock_quantity") + quantities[variant_id]
+                    )
+                    for variant_id in plain
+                ]
+            ),
+            updated_at=timezone.now(),
+        )
+    if sharded:
+        StockShard.objects.filter(variant_id__in=sharded, index=0).update(
+            quantity=Case(
+                *[
+                    When(
+                        variant_id=variant_id,
+                        then=F("quantity") + quantities[variant_id],
+                    )
+                    for variant_id in sharded
+                ]
+            )
+        )
+        cache.delete_many(
+            [TOTAL_CACHE_KEY.format(variant_id) for variant_id in sharded]
+        )
+    return quantities
+
+
+def available_stock(variant):
+    """Stock available for sale, summing shards (briefly cached) if sharded."""
+    if not variant.shard_count:
+        return variant.stock_quantity
+
+    key = TOTAL_CACHE_KEY.format(variant.pk)
+    total = cache.get(key)
+    if total is None:
+        total = variant.shards.aggregate(total=Sum("quantity"))["total"] or 0
+        cache.set(key, total, settings.SHARDED_STOCK_CACHE_TTL)
+    return total
+
+
+def shard_stock(variant, shards):
+    """Split (or re-split) a variant's stock evenly across ``shards`` rows."""
+    if shards < 1:
+        raise ValueError("A sharded variant needs at least one shard.")
+    with transaction.atomic():
+        variant = ProductVariant.objects.select_for_update().get(pk=variant.pk)
+        total = _locked_total(variant)
+        variant.shards.all().delete()
+        StockShard.objects.bulk_create(
+            [
+                StockShard(variant=variant, index=index, quantity=quantity)
+                for index, quantity in enumerate(_split(total, shards))
+            ]
+        )
+        variant.shard_count = shards
+        variant.stock_quantity = total
+        variant.save(update_fields=["shard_count", "stock_quantity", "updated_at"])
+        cache.delete(TOTAL_CACHE_KEY.format(variant.pk))
+        _sharded.changed(ProductVariant)
+    return variant
+
+
+def rebalance_stock(variant):
+    """Spread a sharded variant's remaining stock evenly again."""
+    with transaction.atomic():
+        variant = ProductVariant.objects.select_for_update().get(pk=variant.pk)
+        shards = list(
+            StockShard.objects.select_for_update()
+            .filter(variant=variant)
+            .order_by("index")
+        )
+        total = sum(shard.quantity for shard in shards)
+        for shard, quantity in zip(shards, _split(total, len(shards) or 1)):
+            shard.quantity = quantity
+        StockShard.objects.bulk_update(shards, ["quantity"])
+        variant.stock_quantity = total
+        variant.save(update_fields=["stock_quantity", "updated_at"])
+        cache.delete(TOTAL_CACHE_KEY.format(variant.pk))
+    return variant
+
+
+def consolidate_stock(variant):
+    """Fold a sharded variant's stock back into ``stock_quantity``."""
+    with transaction.atomic():
+        variant = ProductVariant.objects.select_for_update().get(pk=variant.pk)
+        variant.stock_quantity = _locked_total(variant)
+        variant.shards.all().delete()
+        variant.shard_count = 0
+        variant.save(update_fields=["shard_count", "stock_quantity", "updated_at"])
+        cache.delete(TOTAL_CACHE_KEY.format(variant.pk))
+        _sharded.changed(ProductVariant)
+    return variant
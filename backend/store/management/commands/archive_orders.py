@@ -0,0 +1,48 @@
+"""
+Management command to move old, finished orders to the archive tables.
+Usage: python manage.py archive_orders [--days 365] [--chunk-size 500]
+
+Each chunk is moved in its own transaction, so the command can be
+interrupted and re-run at any time.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.archive import archive_chunk, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = "Archive orders older than --days in a final status"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+            help="Minimum order age in days",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.ORDER_ARCHIVE_CHUNK_SIZE,
+            help="Orders moved per transaction",
+        )
+
+    def handle(self, *args, **options):
+        before = archive_cutoff(options["days"])
+        total = chunks = 0
+        while True:
+            moved = archive_chunk(before, chunk_size=options["chunk_size"])
+            if not moved:
+                break
+            total += moved
+            chunks += 1
+            if chunks % 20 == 0:
+                self.stdout.write(f"Archived {total} orders")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {total} orders created before {before:%Y-%m-%d}"
+            )
+        )
@@ -0,0 +1,324 @@
+"""
+Management command to load-test checkout and cart validation under concurrency
+and check stock invariants afterwards.
+Usage: python manage.py benchmark_checkout --variants 20 --requests 2000 \
+           --workers 16 --mode threads --output bench.json
+
+Runs against the configured database (SQLite or MySQL). Benchmark data is
+removed afterwards unless --keep is given.
+"""
+
+import json
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from store.analytics import rebuild_day
+from store.batching import CheckoutPending, submit_checkout
+from store.inventory import available_stock
+from store.models import (
+    Baladiya,
+    Order,
+    OrderLine,
+    OutboxMessage,
+    Product,
+    ProductVariant,
+    Wilaya,
+)
+from store.orders import CheckoutError, place_order, price_cart
+from store.serializers import CheckoutSerializer
+
+BENCH_SLUG = "benchmark-checkout"
+
+
+def _classify(error):
+    """Map a database error to deadlock / lock_timeout / db_error."""
+    code = error.args[0] if error.args and isinstance(error.args[0], int) else None
+    message = str(error).lower()
+    if code == 1213 or "deadlock" in message:
+        return "deadlock"
+    if code == 1205 or "lock wait" in message or "locked" in message:
+        return "lock_timeout"
+    return "db_error"
+
+
+def run_request(task, batched=False):
+    """Execute one benchmark request; returns (kind, outcome, seconds, order_id)."""
+    kind, payload = task
+    checkout = submit_checkout if batched else place_order
+    started = time.perf_counter()
+    order_id = None
+    try:
+        if kind == "validate":
+            price_cart(payload["items"])
+            outcome = "ok"
+        else:
+            serializer = CheckoutSerializer(data=payload)
+            serializer.is_valid(raise_exception=True)
+            order_id = checkout(serializer.validated_data).id
+            outcome = "ok"
+    except (CheckoutError, ValidationError):
+        outcome = "rejected"
+    except CheckoutPending:
+        outcome = "batch_timeout"
+    except DatabaseError as e:
+        outcome = _classify(e)
+    return kind, outcome, time.perf_counter() - started, order_id
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(len(values) * fraction))
+    return round(values[index] * 1000, 2)
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent checkouts and verify oversell/undersell invariants"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--variants", type=int, default=20)
+        parser.add_argument("--stock", type=int, default=50, help="Stock per variant")
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument(
+            "--mode", choices=["threads", "processes"], default="threads"
+        )
+        parser.add_argument(
+            "--validate-ratio",
+            type=float,
+            default=0.2,
+            help="Fraction of requests that call cart validation instead of checkout",
+        )
+        parser.add_argument("--max-items", type=int, default=3)
+        parser.add_argument("--max-quantity", type=int, default=2)
+        parser.add_argument(
+            "--batched",
+            action="store_true",
+            help="Commit checkouts through the micro-batch queue (threads mode only)",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep benchmark data afterwards"
+        )
+
+    def handle(self, *args, **options):
+        if options["batched"] and options["mode"] != "threads":
+            raise CommandError("--batched needs --mode threads (one shared queue)")
+        rng = random.Random(options["seed"])
+        product, variants, wilaya, baladiya, created_geo = self.seed(options)
+        variant_ids = [variant.id for variant in variants]
+        tasks = [
+            self.make_task(rng, options, variant_ids, wilaya, baladiya)
+            for _ in range(options["requests"])
+        ]
+
+        lock_waits_before = self.innodb_row_lock_waits()
+        started = time.perf_counter()
+        results = self.run_tasks(tasks, options)
+        elapsed = time.perf_counter() - started
+        lock_waits_after = self.innodb_row_lock_waits()
+
+        order_ids = [order_id for *_, order_id in results if order_id]
+        report = self.build_report(options, results, elapsed, variants)
+        if lock_waits_before is not None:
+            report["innodb_row_lock_waits"] = lock_waits_after - lock_waits_before
+
+        if not options["keep"]:
+            self.cleanup(product, order_ids, wilaya if created_geo else None)
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text)
+        self.stdout.write(text)
+        if report["invariants"]["ok"]:
+            self.stdout.write(self.style.SUCCESS("Stock invariants hold"))
+        else:
+            self.stdout.write(self.style.ERROR("Stock invariants violated"))
+
+    def seed(self, options):
+        wilaya = Wilaya.objects.filter(baladiyas__isnull=False).first()
+        created_geo = wilaya is None
+        if created_geo:
+            wilaya = Wilaya.objects.create(name="Benchmark Wilaya")
+            Baladiya.objects.create(name="Benchmark Baladiya", wilaya=wilaya)
+        baladiya = wilaya.baladiyas.first()
+
+        product = Product.objects.create(
+            title="Benchmark checkout", slug=BENCH_SLUG, description=""
+        )
+        ProductVariant.objects.bulk_create(
+            [
+                ProductVariant(
+                    product=product,
+                    sku=f"BENCH-CHK-{index:05d}",
+                    price=100,
+                    stock_quantity=options["stock"],
+                )
+                for index in range(options["variants"])
+            ]
+        )
+        # MySQL's bulk_create does not set primary keys, so reload them
+        variants = list(product.variants.order_by("id"))
+        return product, variants, wilaya, baladiya, created_geo
+
+    def make_task(self, rng, options, variant_ids, wilaya, baladiya):
+        items = [
+            {
+                "variant_id": variant_id,
+                "quantity": rng.randint(1, options["max_quantity"]),
+            }
+            for variant_id in rng.sample(
+                variant_ids, rng.randint(1, min(options["max_items"], len(variant_ids)))
+            )
+        ]
+        if rng.random() < options["validate_ratio"]:
+            return "validate", {"items": items}
+        return "checkout", {
+            "items": items,
+            "name": "Benchmark",
+            "phone": "0550000000",
+            "address": "Benchmark",
+            "wilaya": wilaya.id,
+            "baladiya": baladiya.id,
+        }
+
+    def run_tasks(self, tasks, options):
+        if options["mode"] == "processes":
+            # Children must open their own connections after the fork
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(options["workers"], mp_context=context) as pool:
+                return list(pool.map(run_request, tasks, chunksize=8))
+
+        results = [None] * len(tasks)
+        cursor = iter(range(len(tasks)))
+        lock = threading.Lock()
+
+        def worker():
+            # One connection per thread, closed when the thread is done
+            try:
+                while True:
+                    with lock:
+                        index = next(cursor, None)
+                    if index is None:
+                        return
+                    results[index] = run_request(tasks[index], options["batched"])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options["workers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def innodb_row_lock_waits(self):
+        if connection.vendor != "mysql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_waits'")
+            return int(cursor.fetchone()[1])
+
+    def build_report(self, options, results, elapsed, variants):
+        outcomes = {}
+        latencies = {"checkout": [], "validate": []}
+        for kind, outcome, seconds, _ in results:
+            key = f"{kind}_{outcome}"
+            outcomes[key] = outcomes.get(key, 0) + 1
+            latencies[kind].append(seconds)
+
+        sold = dict(
+            OrderLine.objects.filter(product_variant__in=variants)
+            .values_list("product_variant")
+            .annotate(total=Sum("quantity"))
+        )
+        oversold = []
+        mismatched = []
+        for variant in variants:
+            variant.refresh_from_db()
+            remaining = available_stock(variant)
+            variant_sold = sold.get(variant.id, 0)
+            if remaining < 0 or variant_sold > options["stock"]:
+                oversold.append(variant.sku)
+            if remaining != options["stock"] - variant_sold:
+                mismatched.append(
+                    {
+                        "sku": variant.sku,
+                        "remaining": remaining,
+                        "expected": options["stock"] - variant_sold,
+                    }
+                )
+        orders_created = (
+            Order.objects.filter(lines__product_variant__in=variants).distinct().count()
+        )
+
+        report = {
+            "timestamp": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "mode": options["mode"],
+            "batched": options["batched"],
+            "workers": options["workers"],
+            "requests": options["requests"],
+            "variants": options["variants"],
+            "stock_per_variant": options["stock"],
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_per_second": round(len(results) / elapsed, 2),
+            "checkout_throughput_per_second": round(
+                outcomes.get("checkout_ok", 0) / elapsed, 2
+            ),
+            "outcomes": outcomes,
+            "deadlocks": sum(v for k, v in outcomes.items() if k.endswith("deadlock")),
+            "lock_timeouts": sum(
+                v for k, v in outcomes.items() if k.endswith("lock_timeout")
+            ),
+            "latency_ms": {},
+            "invariants": {
+                "orders_created": orders_created,
+                "checkouts_succeeded": outcomes.get("checkout_ok", 0),
+                "oversold_skus": oversold,
+                "stock_mismatches": mismatched,
+            },
+        }
+        for kind, values in latencies.items():
+            values.sort()
+            report["latency_ms"][kind] = {
+                "p50": _percentile(values, 0.50),
+                "p95": _percentile(values, 0.95),
+                "p99": _percentile(values, 0.99),
+                "max": _percentile(values, 1.0),
+            }
+        invariants = report["invariants"]
+        invariants["ok"] = (
+            not oversold
+            and not mismatched
+            and invariants["orders_created"] == invariants["checkouts_succeeded"]
+        )
+        return report
+
+    def cleanup(self, product, order_ids, wilaya):
+        days = {
+            timezone.localdate(created_at)
+            for created_at in Order.objects.filter(id__in=order_ids).values_list(
+                "created_at", flat=True
+            )
+        }
+        OutboxMessage.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+        # Take the benchmark orders back out of the sales rollups
+        for day in sorted(days):
+            rebuild_day(day)
+        product.delete()
+        if wilaya is not None:
+            wilaya.delete()
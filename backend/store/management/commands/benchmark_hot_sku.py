@@ -0,0 +1,94 @@
+"""
+Management command to benchmark stock reservation on a single hot SKU,
+with and without sharded stock.
+Usage: python manage.py benchmark_hot_sku --threads 16 --orders 2000 --shards 8
+
+Run it against MySQL: SQLite serializes all writers, so sharding cannot help.
+"""
+
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+
+from store.inventory import InsufficientStock, reserve_stock, shard_stock
+from store.models import Product, ProductVariant
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent stock reservation on one hot variant"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--orders", type=int, default=2000)
+        parser.add_argument("--shards", type=int, default=8)
+
+    def handle(self, *args, **options):
+        product = Product.objects.create(
+            title="Benchmark hot SKU", slug="benchmark-hot-sku", description=""
+        )
+        try:
+            for shards in (0, options["shards"]):
+                variant = ProductVariant.objects.create(
+                    product=product,
+                    sku=f"BENCH-HOT-{shards}",
+                    price=1,
+                    stock_quantity=options["orders"],
+                )
+                if shards:
+                    shard_stock(variant, shards)
+                self.report(
+                    f"{shards} shards" if shards else "unsharded",
+                    self.run(variant.id, options["threads"], options["orders"]),
+                )
+        finally:
+            product.delete()
+
+    def run(self, variant_id, threads, orders):
+        """Reserve one unit per transaction from ``threads`` threads."""
+        lock = threading.Lock()
+        stats = {"remaining": orders, "ok": 0, "sold_out": 0, "errors": 0}
+        latencies = []
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if stats["remaining"] <= 0:
+                            return
+                        stats["remaining"] -= 1
+                    started = time.perf_counter()
+                    outcome = "ok"
+                    try:
+                        with transaction.atomic():
+                            reserve_stock(variant_id, 1)
+                    except InsufficientStock:
+                        outcome = "sold_out"
+                    except DatabaseError:
+                        outcome = "errors"
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        stats[outcome] += 1
+                        latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        stats["elapsed"] = time.perf_counter() - started
+        stats["latencies"] = sorted(latencies)
+        return stats
+
+    def report(self, label, stats):
+        latencies = stats["latencies"] or [0]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"{label:>12}: {stats['ok'] / stats['elapsed']:8.1f} orders/s  "
+            f"ok={stats['ok']} sold_out={stats['sold_out']} errors={stats['errors']}  "
+            f"p95={p95 * 1000:.1f}ms"
+        )
@@ -0,0 +1,65 @@
+"""
+Management command to deliver queued outbox messages.
+Usage: python manage.py drain_outbox [--once] [--batch-size 50] [--interval 5]
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver pending outbox messages (order emails) in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.OUTBOX_BATCH_SIZE,
+            help="Messages sent per mail connection",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=settings.OUTBOX_MAX_ATTEMPTS,
+            help="Attempts before a message is marked failed",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when the outbox is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain everything that is due, then exit",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        max_attempts = options["max_attempts"]
+        totals = {"sent": 0, "failed": 0}
+
+        try:
+            while True:
+                stats = drain_outbox(batch_size=batch_size, max_attempts=max_attempts)
+                totals["sent"] += stats["sent"]
+                totals["failed"] += stats["failed"]
+                if stats["sent"] or stats["failed"]:
+                    self.stdout.write(f"Sent {stats['sent']}, failed {stats['failed']}")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Outbox drained: {totals['sent']} sent, {totals['failed']} failed"
+            )
+        )
@@ -0,0 +1,82 @@
+"""
+Management command to import (or only validate) a product CSV file.
+Usage: python manage.py import_products_csv catalog.csv [--dry-run]
+       [--deactivate-missing] [--workers 4] [--chunk-size 1000]
+       [--errors errors.csv]
+
+Rows are parsed and validated in a pool of --workers processes; SKU checks
+against the database and writes happen in this process, chunk by chunk.
+"""
+
+import csv
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.imports import ERROR_COLUMNS, import_products
+
+
+class Command(BaseCommand):
+    help = "Import products from a CSV file, or report every bad row with --dry-run"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to import")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validate every row without writing anything",
+        )
+        parser.add_argument(
+            "--deactivate-missing",
+            action="store_true",
+            help="Deactivate imported SKUs that are not in the file",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processes parsing and validating rows",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.PRODUCT_IMPORT_CHUNK_SIZE,
+            help="Rows per validation chunk and transaction",
+        )
+        parser.add_argument("--errors", help="Write the error report to this CSV file")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], "rb") as f:
+                result = import_products(
+                    f,
+                    chunk_size=options["chunk_size"],
+                    dry_run=options["dry_run"],
+                    workers=options["workers"],
+                    deactivate_missing=options["deactivate_missing"],
+                )
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(str(e))
+
+        if options["errors"]:
+            with open(options["errors"], "w", newline="") as f:
+                writer = csv.DictWriter(f, ERROR_COLUMNS)
+                writer.writeheader()
+                writer.writerows(result["errors"])
+        else:
+            for error in result["errors"]:
+                self.stdout.write(f"Row {error['row']}: {error['error']}")
+
+        self.stdout.write(
+            f"{result['created']} new, {result['updated']} changed, "
+            f"{result['unchanged']} unchanged, {result['deactivated']} deactivated"
+        )
+        done = "valid" if options["dry_run"] else "imported"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{result['rows']} rows, {result[done]} {done}, "
+                f"{len(result['errors'])} errors "
+                f"({result['rows_per_second']} rows/s)"
+            )
+        )
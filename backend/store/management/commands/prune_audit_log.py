@@ -0,0 +1,63 @@
+"""
+Management command to archive and delete old audit log entries.
+Usage: python manage.py prune_audit_log [--days 365] [--chunk-size 5000]
+       [--archive-dir DIR | --no-archive]
+
+Each chunk is written to its own gzip'd NDJSON file (one JSON object per
+entry) and then deleted in its own transaction, so the command can be
+interrupted and re-run at any time.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.audit import prune_chunk, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = "Archive and delete audit log entries older than --days"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.AUDIT_RETENTION_DAYS,
+            help="Minimum entry age in days",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.AUDIT_PRUNE_CHUNK_SIZE,
+            help="Entries archived and deleted per transaction",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=settings.AUDIT_ARCHIVE_DIR,
+            help="Directory receiving the archive files",
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_true",
+            help="Delete the entries without archiving them",
+        )
+
+    def handle(self, *args, **options):
+        before = retention_cutoff(options["days"])
+        archive_dir = None if options["no_archive"] else options["archive_dir"]
+        total = chunks = 0
+        while True:
+            deleted = prune_chunk(before, options["chunk_size"], archive_dir)
+            if not deleted:
+                break
+            total += deleted
+            chunks += 1
+            if chunks % 20 == 0:
+                self.stdout.write(f"Pruned {total} audit log entries")
+
+        where = f", archived to {archive_dir}" if archive_dir and total else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Pruned {total} audit log entries logged before "
+                f"{before:%Y-%m-%d}{where}"
+            )
+        )
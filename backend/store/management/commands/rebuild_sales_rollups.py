@@ -0,0 +1,63 @@
+"""
+Management command to rebuild the daily sales rollups from orders.
+Usage: python manage.py rebuild_sales_rollups [--from 2024-01-01] [--to 2024-12-31]
+
+Each day is recomputed in its own transaction, so the command can be
+interrupted and re-run for any range.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from store.analytics import ORDER_SOURCES, rebuild_day
+
+
+class Command(BaseCommand):
+    help = "Recompute DailySales/DailySkuSales day by day from orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from", dest="start", help="First day (default: first order)"
+        )
+        parser.add_argument("--to", dest="end", help="Last day (default: today)")
+
+    def parse(self, value, name):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"--{name} must be a date (YYYY-MM-DD)")
+        return day
+
+    def handle(self, *args, **options):
+        end = (
+            self.parse(options["end"], "to") if options["end"] else timezone.localdate()
+        )
+        if options["start"]:
+            start = self.parse(options["start"], "from")
+        else:
+            first = [
+                created_at
+                for order_model, _ in ORDER_SOURCES
+                for created_at in order_model.objects.order_by(
+                    "created_at"
+                ).values_list("created_at", flat=True)[:1]
+            ]
+            if not first:
+                self.stdout.write("No orders to roll up")
+                return
+            start = timezone.localdate(min(first))
+
+        day = start
+        days = orders = 0
+        while day <= end:
+            orders += rebuild_day(day)
+            days += 1
+            if days % 30 == 0:
+                self.stdout.write(f"Rebuilt up to {day} ({orders} orders)")
+            day += timedelta(days=1)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {days} days of rollups ({orders} orders)")
+        )
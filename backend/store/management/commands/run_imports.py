@@ -0,0 +1,63 @@
+"""
+Management command to process queued product import jobs.
+Usage: python manage.py run_imports [--once] [--chunk-size 1000] [--interval 5]
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.import_jobs import claim_import_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Run pending product imports, resuming any left behind by a dead worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.PRODUCT_IMPORT_CHUNK_SIZE,
+            help="Rows upserted per transaction and checkpoint",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when no job is waiting",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run every waiting job, then exit",
+        )
+
+    def handle(self, *args, **options):
+        completed = failed = 0
+
+        try:
+            while True:
+                job = claim_import_job()
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["interval"])
+                    continue
+
+                self.stdout.write(f"Running {job}")
+                job = run_job(job, chunk_size=options["chunk_size"])
+                if job.status == "completed":
+                    completed += 1
+                    self.stdout.write(
+                        f"{job}: {job.imported} imported, {job.error_count} errors"
+                    )
+                elif job.status == "failed":
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"{job}: {job.error}"))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Imports done: {completed} completed, {failed} failed")
+        )
@@ -7,6 +7,7 @@ import csv
 
 from django.core.management.base import BaseCommand, CommandError
 
+from store.geography import invalidate_registry
 from store.models import Baladiya, Wilaya
 
 
@@ -87,6 +88,9 @@ class Command(BaseCommand):
                 if created:
                     created_baladiyas += 1
 
+            # Make every worker reload its in-memory geography registry
+            invalidate_registry()
+
             self.stdout.write(
                 self.style.SUCCESS(
                     f"Successfully created {created_wilayas} wilayas and {created_baladiyas} baladiyas"
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.8 on 2026-10-19 16:41
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0006_shipping_zones"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productvariant",
+            name="shard_count",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="StockShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.PositiveSmallIntegerField()),
+                (
+                    "quantity",
+                    models.IntegerField(
+                        default=0,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                    ),
+                ),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="store.productvariant",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["variant", "index"],
+                "unique_together": {("variant", "index")},
+            },
+        ),
+    ]
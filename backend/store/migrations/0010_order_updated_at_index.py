@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-19 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0009_export_jobs"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["updated_at", "id"], name="store_order_updated_a107d2_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.8 on 2026-10-19 16:53
+
+import re
+
+from django.db import migrations, models
+
+
+def backfill_phone_digits(apps, schema_editor):
+    """Fill phone_digits in primary-key chunks (see store.utils.normalize_phone)."""
+    Order = apps.get_model("store", "Order")
+    last_id = 0
+    while True:
+        orders = list(
+            Order.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "phone")[:2000]
+        )
+        if not orders:
+            return
+        for order in orders:
+            digits = re.sub(r"\D", "", order.phone or "")
+            for prefix in ("00213", "213"):
+                if digits.startswith(prefix) and len(digits) > len(prefix):
+                    digits = "0" + digits[len(prefix) :]
+                    break
+            order.phone_digits = digits
+        Order.objects.bulk_update(orders, ["phone_digits"])
+        last_id = orders[-1].id
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0010_order_updated_at_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="phone_digits",
+            field=models.CharField(blank=True, default="", max_length=20),
+        ),
+        migrations.RunPython(backfill_phone_digits, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["phone_digits"], name="store_order_phone_d_c422b1_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["name"], name="store_order_name_7764f1_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["email"], name="store_order_email_9efbc4_idx"),
+        ),
+    ]
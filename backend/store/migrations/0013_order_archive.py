@@ -0,0 +1,113 @@
+# Generated by Django 4.2.8 on 2026-10-19 17:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0012_sales_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedOrder",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("reference", models.CharField(max_length=50, unique=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("confirmed", "Confirmed"),
+                            ("shipped", "Shipped"),
+                            ("delivered", "Delivered"),
+                            ("cancelled", "Cancelled"),
+                            ("returned", "Returned"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("name", models.CharField(blank=True, default="", max_length=200)),
+                ("email", models.EmailField(blank=True, default="", max_length=254)),
+                ("phone", models.CharField(blank=True, default="", max_length=20)),
+                (
+                    "phone_digits",
+                    models.CharField(blank=True, default="", max_length=20),
+                ),
+                ("address", models.TextField(blank=True, default="")),
+                ("subtotal", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "shipping_cost",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                ("total", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "payment_method",
+                    models.CharField(default="cash_on_delivery", max_length=50),
+                ),
+                ("payment_status", models.CharField(default="pending", max_length=20)),
+                ("created_at", models.DateTimeField(db_index=True)),
+                ("updated_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "baladiya",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_orders",
+                        to="store.baladiya",
+                    ),
+                ),
+                (
+                    "wilaya",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_orders",
+                        to="store.wilaya",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedOrderLine",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("sku_snapshot", models.CharField(max_length=100)),
+                ("title_snapshot", models.CharField(max_length=200)),
+                (
+                    "price_snapshot",
+                    models.DecimalField(decimal_places=2, max_digits=10),
+                ),
+                ("quantity", models.IntegerField()),
+                ("line_total", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lines",
+                        to="store.archivedorder",
+                    ),
+                ),
+                (
+                    "product_variant",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="store.productvariant",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.8 on 2026-10-19 17:06
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0013_order_archive"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productvariant",
+            index=models.Index(
+                django.db.models.expressions.CombinedExpression(
+                    models.F("stock_quantity"), "-", models.F("low_stock_threshold")
+                ),
+                name="store_variant_low_stock_idx",
+            ),
+        ),
+    ]
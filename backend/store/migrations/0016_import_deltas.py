@@ -0,0 +1,42 @@
+# Generated by Django 4.2.8 on 2026-10-19 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0015_import_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="created",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="deactivate_missing",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="deactivated",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="unchanged",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="updated",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="productvariant",
+            name="import_hash",
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
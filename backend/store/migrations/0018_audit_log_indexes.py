@@ -0,0 +1,30 @@
+# Generated by Django 4.2.8 on 2026-10-19 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0017_audit_log_timestamp_default"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="auditlog",
+            name="store_audit_model_n_5f9043_idx",
+        ),
+        migrations.AddIndex(
+            model_name="auditlog",
+            index=models.Index(
+                fields=["model_name", "timestamp"],
+                name="store_audit_model_n_a54773_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="auditlog",
+            index=models.Index(
+                fields=["model_name", "object_id"],
+                name="store_audit_model_n_a810d4_idx",
+            ),
+        ),
+    ]
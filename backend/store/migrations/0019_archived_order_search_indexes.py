@@ -0,0 +1,30 @@
+# Generated by Django 4.2.8 on 2026-10-19 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0018_audit_log_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(fields=["status"], name="store_archi_status_7bbaad_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(
+                fields=["phone_digits"], name="store_archi_phone_d_f7f35f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(fields=["name"], name="store_archi_name_fbab02_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(fields=["email"], name="store_archi_email_0fee73_idx"),
+        ),
+    ]
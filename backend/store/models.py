@@ -5,15 +5,63 @@ Store models for the e-commerce application.
 import uuid
 
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 
 
+class ShippingZone(models.Model):
+    """Group of wilayas sharing the same shipping rates."""
+
+    name = models.CharField(max_length=100, unique=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class ShippingRate(models.Model):
+    """Rate tier of a shipping zone, matched on cart weight and subtotal."""
+
+    zone = models.ForeignKey(
+        ShippingZone, on_delete=models.CASCADE, related_name="rates"
+    )
+    min_weight = models.DecimalField(
+        max_digits=8, decimal_places=2, default=0, validators=[MinValueValidator(0)]
+    )
+    # Exclusive upper bound, empty means no limit
+    max_weight = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True
+    )
+    min_subtotal = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)]
+    )
+    price = models.DecimalField(
+        max_digits=10, decimal_places=2, validators=[MinValueValidator(0)]
+    )
+
+    class Meta:
+        ordering = ["zone", "min_weight", "min_subtotal"]
+
+    def __str__(self):
+        return f"{self.zone.name}: {self.price}"
+
+
 class Wilaya(models.Model):
     """Algerian Wilaya (Province)."""
 
     name = models.CharField(max_length=100, unique=True, db_index=True)
     code = models.CharField(max_length=10, unique=True, blank=True, null=True)
+    shipping_zone = models.ForeignKey(
+        ShippingZone,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="wilayas",
+    )
 
     class Meta:
         ordering = ["name"]
@@ -145,10 +193,15 @@ class ProductVariant(models.Model):
     low_stock_threshold = models.IntegerField(
         default=10, validators=[MinValueValidator(0)]
     )
+    # Number of StockShard rows holding this variant's stock (0 = not sharded).
+    # When sharded, stock_quantity is the total as of the last shard operation.
+    shard_count = models.PositiveSmallIntegerField(default=0)
     barcode = models.CharField(max_length=100, blank=True)
     weight = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     image_main = models.URLField(blank=True, null=True)
+    # Hash of the CSV row last imported for this SKU (store/imports.py)
+    import_hash = models.CharField(max_length=40, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -158,6 +211,12 @@ class ProductVariant(models.Model):
             models.Index(fields=["sku"]),
             models.Index(fields=["is_active"]),
             models.Index(fields=["stock_quantity"]),
+            # Low-stock filter (inventory.low_stock_variants) matches this
+            # expression exactly, so it can range-scan the index
+            models.Index(
+                models.F("stock_quantity") - models.F("low_stock_threshold"),
+                name="store_variant_low_stock_idx",
+            ),
         ]
 
     def __str__(self):
@@ -172,6 +231,23 @@ class ProductVariant(models.Model):
         return self.stock_quantity > 0
 
 
+class StockShard(models.Model):
+    """Slice of a hot variant's stock, so concurrent checkouts lock different rows."""
+
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, related_name="shards"
+    )
+    index = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+
+    class Meta:
+        ordering = ["variant", "index"]
+        unique_together = ["variant", "index"]
+
+    def __str__(self):
+        return f"{self.variant.sku} shard {self.index}: {self.quantity}"
+
+
 class ProductImage(models.Model):
     """Product images."""
 
@@ -201,6 +277,20 @@ class Order(models.Model):
         ("returned", "Returned"),
     ]
 
+    # Allowed status changes; cancelled and returned orders are final
+    TRANSITIONS = {
+        "pending": ("confirmed", "shipped", "cancelled"),
+        "confirmed": ("shipped", "cancelled"),
+        "shipped": ("delivered", "returned"),
+        "delivered": ("returned",),
+        "cancelled": (),
+        "returned": (),
+    }
+    # Entering these statuses puts the ordered stock back
+    RESTOCK_STATUSES = ("cancelled", "returned")
+
+    REFERENCE_ATTEMPTS = 3
+
     reference = models.CharField(max_length=50, unique=True, db_index=True)
     status = models.CharField(
         max_length=20, choices=ORDER_STATUS_CHOICES, default="pending"
@@ -208,7 +298,10 @@ class Order(models.Model):
 
     # Customer info
     name = models.CharField(max_length=200, blank=True, default="")
+    email = models.EmailField(blank=True, default="")
     phone = models.CharField(max_length=20, db_index=True, blank=True, default="")
+    # Digits-only national form of ``phone`` for prefix search
+    phone_digits = models.CharField(max_length=20, blank=True, default="")
     address = models.TextField(blank=True, default="")
     wilaya = models.ForeignKey(
         Wilaya, on_delete=models.PROTECT, related_name="orders", null=True, blank=True
@@ -242,20 +335,58 @@ class Order(models.Model):
             models.Index(fields=["status"]),
             models.Index(fields=["phone"]),
             models.Index(fields=["created_at"]),
+            # Admin search (OrderSearchFilter) only uses exact and prefix lookups
+            models.Index(fields=["phone_digits"]),
+            models.Index(fields=["name"]),
+            models.Index(fields=["email"]),
+            # Cursor of the order change feed (store/changes.py)
+            models.Index(fields=["updated_at", "id"]),
         ]
 
     def __str__(self):
         return f"Order {self.reference}"
 
     def save(self, *args, **kwargs):
-        if not self.reference:
+        from .utils import normalize_phone
+
+        self.phone_digits = normalize_phone(self.phone)
+        if self.reference:
+            return super().save(*args, **kwargs)
+
+        from .references import get_allocator
+
+        for attempt in range(self.REFERENCE_ATTEMPTS):
             self.reference = self.generate_reference()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                collided = Order.objects.filter(reference=self.reference).exists()
+                if not collided or attempt == self.REFERENCE_ATTEMPTS - 1:
+                    self.reference = ""
+                    raise
+                get_allocator().reset()
+
+    @classmethod
+    def can_transition(cls, old_status, new_status):
+        return new_status in cls.TRANSITIONS.get(old_status, ())
 
     @staticmethod
     def generate_reference():
         """Generate unique order reference."""
-        return f"ORD-{uuid.uuid4().hex[:8].upper()}"
+        from .references import get_allocator
+
+        return get_allocator().allocate()
+
+
+class ReferenceBlock(models.Model):
+    """Block of order reference numbers claimed by one worker."""
+
+    owner = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reference block {self.id} ({self.owner})"
 
 
 class OrderLine(models.Model):
@@ -280,6 +411,162 @@ class OrderLine(models.Model):
         return f"{self.order.reference} - {self.sku_snapshot} x{self.quantity}"
 
 
+class ArchivedOrder(models.Model):
+    """Old order in a final status, moved out of ``Order`` (store/archive.py)."""
+
+    # Same id as the original order
+    id = models.BigIntegerField(primary_key=True)
+    reference = models.CharField(max_length=50, unique=True)
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+
+    name = models.CharField(max_length=200, blank=True, default="")
+    email = models.EmailField(blank=True, default="")
+    phone = models.CharField(max_length=20, blank=True, default="")
+    phone_digits = models.CharField(max_length=20, blank=True, default="")
+    address = models.TextField(blank=True, default="")
+    wilaya = models.ForeignKey(
+        Wilaya,
+        on_delete=models.PROTECT,
+        related_name="archived_orders",
+        null=True,
+        blank=True,
+    )
+    baladiya = models.ForeignKey(
+        Baladiya,
+        on_delete=models.PROTECT,
+        related_name="archived_orders",
+        null=True,
+        blank=True,
+    )
+
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    shipping_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+
+    payment_method = models.CharField(max_length=50, default="cash_on_delivery")
+    payment_status = models.CharField(max_length=20, default="pending")
+
+    created_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status"]),
+            # Admin search (OrderSearchFilter with ?archived=true)
+            models.Index(fields=["phone_digits"]),
+            models.Index(fields=["name"]),
+            models.Index(fields=["email"]),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.reference}"
+
+
+class ArchivedOrderLine(models.Model):
+    """Line of an archived order, with the same id as the original line."""
+
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(
+        ArchivedOrder, on_delete=models.CASCADE, related_name="lines"
+    )
+    product_variant = models.ForeignKey(
+        ProductVariant, on_delete=models.SET_NULL, null=True, related_name="+"
+    )
+    sku_snapshot = models.CharField(max_length=100)
+    title_snapshot = models.CharField(max_length=200)
+    price_snapshot = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.IntegerField()
+    line_total = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.order.reference} - {self.sku_snapshot} x{self.quantity}"
+
+
+class DailySales(models.Model):
+    """Per-day order rollup by status and wilaya (maintained by store/analytics.py)."""
+
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    wilaya_id = models.PositiveIntegerField(default=0)  # 0: order without wilaya
+    orders = models.IntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    shipping = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["day"]
+        unique_together = ["day", "status", "wilaya_id"]
+
+    def __str__(self):
+        return f"{self.day} {self.status} wilaya {self.wilaya_id}: {self.orders}"
+
+
+class DailySkuSales(models.Model):
+    """Per-day units and line revenue by SKU and order status."""
+
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    sku = models.CharField(max_length=100)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["day"]
+        unique_together = ["day", "sku", "status"]
+
+    def __str__(self):
+        return f"{self.day} {self.sku} ({self.status}): {self.units}"
+
+
+class OutboxMessage(models.Model):
+    """Side effect (email) recorded in the same transaction as its order.
+
+    Rows are delivered after commit by the ``drain_outbox`` worker command.
+    """
+
+    KIND_CHOICES = [
+        ("email", "Email"),
+    ]
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default="email")
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="outbox_messages",
+    )
+    recipients = models.JSONField(default=list)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.subject} ({self.status})"
+
+
 class Client(models.Model):
     """Client model for customer accounts (educational purposes)."""
 
@@ -344,7 +631,8 @@ class AuditLog(models.Model):
     model_name = models.CharField(max_length=100)
     object_id = models.CharField(max_length=100, blank=True)
     changes = models.JSONField(default=dict, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Set when the action is logged, not when the buffered row is written
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
 
     class Meta:
@@ -352,8 +640,113 @@ class AuditLog(models.Model):
         indexes = [
             models.Index(fields=["timestamp"]),
             models.Index(fields=["admin_user", "timestamp"]),
-            models.Index(fields=["model_name"]),
+            models.Index(fields=["model_name", "timestamp"]),
+            models.Index(fields=["model_name", "object_id"]),
         ]
 
     def __str__(self):
         return f"{self.action_type} {self.model_name} by {self.admin_user} at {self.timestamp}"
+
+
+class ExportJob(models.Model):
+    """Background export produced in chunks by the ``run_exports`` worker."""
+
+    KIND_CHOICES = [
+        ("orders", "Orders"),
+        ("order_lines", "Order lines"),
+        ("products", "Products and variants"),
+        ("audit_logs", "Audit logs"),
+    ]
+
+    FORMAT_CHOICES = [
+        ("csv", "CSV"),
+        ("ndjson", "NDJSON"),
+    ]
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default="csv")
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    created_by = models.ForeignKey(
+        "auth.User", on_delete=models.SET_NULL, null=True, related_name="export_jobs"
+    )
+
+    # Progress checkpoint: rows up to ``cursor`` are in the first
+    # ``bytes_written`` bytes of ``file``
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    rows_written = models.PositiveIntegerField(default=0)
+    cursor = models.BigIntegerField(default=0)
+    bytes_written = models.BigIntegerField(default=0)
+    file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "heartbeat_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} export {self.id} ({self.status})"
+
+
+class ImportJob(models.Model):
+    """Product CSV import run in the background by the ``run_imports`` worker."""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+        ("cancelled", "Cancelled"),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    created_by = models.ForeignKey(
+        "auth.User", on_delete=models.SET_NULL, null=True, related_name="import_jobs"
+    )
+    # Stored upload, relative to MEDIA_ROOT
+    file = models.CharField(max_length=255, blank=True)
+    original_name = models.CharField(max_length=255, blank=True)
+    file_size = models.BigIntegerField(default=0)
+    deactivate_missing = models.BooleanField(default=False)
+
+    # Progress checkpoint: the first ``rows_processed`` records are done and
+    # their errors are the first ``errors_bytes`` bytes of ``errors_file``
+    rows_processed = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    deactivated = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors_file = models.CharField(max_length=255, blank=True)
+    errors_bytes = models.BigIntegerField(default=0)
+    seconds = models.FloatField(default=0)  # time spent importing
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "heartbeat_at"]),
+        ]
+
+    def __str__(self):
+        return f"Product import {self.id} ({self.status})"
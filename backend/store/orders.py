@@ -0,0 +1,227 @@
+"""
+Order placement services shared by the API views and management commands.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .analytics import record_new_orders, record_status_change
+from .geography import get_registry
+from .inventory import InsufficientStock, available_stock, reserve_stock, restore_stock
+from .models import Order, OrderLine, ProductVariant
+from .outbox import enqueue_order_notifications
+from .references import normalize_reference
+from .shipping import get_shipping_table
+from .utils import log_admin_actions, normalize_phone
+
+
+class CheckoutError(Exception):
+    """Checkout could not be completed; the message is shown to the customer."""
+
+
+def price_cart(items):
+    """Validate cart items against current stock and return totals."""
+    errors = []
+    validated_items = []
+    total = Decimal("0.00")
+
+    for item in items:
+        variant_id = item.get("variant_id")
+        quantity = item.get("quantity", 1)
+
+        try:
+            variant = ProductVariant.objects.get(id=variant_id, is_active=True)
+            available = available_stock(variant)
+            if available < quantity:
+                errors.append(
+                    f"Insufficient stock for {variant.sku}. Available: {available}"
+                )
+            else:
+                line_total = variant.price * quantity
+                total += line_total
+                validated_items.append(
+                    {
+                        "variant_id": variant.id,
+                        "sku": variant.sku,
+                        "title": variant.product.title,
+                        "price": str(variant.price),
+                        "quantity": quantity,
+                        "line_total": str(line_total),
+                    }
+                )
+        except ProductVariant.DoesNotExist:
+            errors.append(f"Variant {variant_id} not found")
+
+    return {
+        "valid": len(errors) == 0,
+        "errors": errors,
+        "items": validated_items,
+        "subtotal": str(total),
+        "total": str(total),  # Will be recalculated with shipping in checkout
+    }
+
+
+def build_order(data, subtotal, weight):
+    """Unsaved pending cash-on-delivery order for validated checkout data."""
+    shipping_cost = get_shipping_table().quote(data["wilaya"], weight, subtotal).cost
+
+    # Wilaya and baladiya were already validated against the registry
+    geography = get_registry()
+
+    # Payment on delivery - no payment processing needed
+    return Order(
+        status="pending",  # Will be confirmed when payment is received on delivery
+        name=data["name"],
+        email=data.get("email", ""),
+        phone=data["phone"],
+        phone_digits=normalize_phone(data["phone"]),
+        address=data["address"],
+        wilaya=geography.wilaya_instance(data["wilaya"]),
+        baladiya=geography.baladiya_instance(data["baladiya"]),
+        subtotal=subtotal,
+        shipping_cost=shipping_cost,
+        total=subtotal + shipping_cost,
+        payment_method="cash_on_delivery",
+        payment_status="pending",  # Payment on delivery - always pending until delivery
+    )
+
+
+def build_order_line(variant, title, quantity):
+    """Unsaved order line with price snapshots of ``variant``."""
+    return OrderLine(
+        product_variant=variant,
+        sku_snapshot=variant.sku,
+        title_snapshot=title,
+        price_snapshot=variant.price,
+        quantity=quantity,
+        line_total=variant.price * quantity,
+    )
+
+
+def place_order(data):
+    """
+    Reserve stock and create a pending cash-on-delivery order from validated
+    CheckoutSerializer data. Raises CheckoutError, leaving stock untouched.
+    """
+    lines = []
+    subtotal = Decimal("0.00")
+    weight = Decimal("0.00")
+
+    with transaction.atomic():
+        for item in data["items"]:
+            variant_id = item["variant_id"]
+            quantity = item["quantity"]
+
+            try:
+                # Reserve stock (locks the variant row, or one shard if sharded)
+                variant = reserve_stock(variant_id, quantity)
+            except InsufficientStock as e:
+                # Raising rolls back stock reserved for earlier items
+                raise CheckoutError(str(e))
+            except ProductVariant.DoesNotExist:
+                raise CheckoutError(f"Variant {variant_id} not found")
+
+            line = build_order_line(variant, variant.product.title, quantity)
+            subtotal += line.line_total
+            weight += (variant.weight or 0) * quantity
+            lines.append(line)
+
+        order = build_order(data, subtotal, weight)
+        order.save()
+
+        for line in lines:
+            line.order = order
+        OrderLine.objects.bulk_create(lines)
+        record_new_orders([(order, lines)])
+
+        # Emails are delivered after commit by the drain_outbox worker
+        enqueue_order_notifications(order)
+
+    return order
+
+
+def change_order_status(user, new_status, ids=(), references=()):
+    """
+    Move the orders given by id or reference to ``new_status``, with one
+    UPDATE per current status and one audit insert. Orders entering a
+    restock status (cancelled, returned) get their stock back.
+
+    Orders are locked first and final statuses have no way out, so stock is
+    restored exactly once even when the same change is requested twice.
+
+    Returns one outcome per requested id/reference, in request order, with
+    ``outcome`` set to "updated", "unchanged", "invalid_transition" or
+    "not_found".
+    """
+    if new_status not in dict(Order.ORDER_STATUS_CHOICES):
+        raise ValueError(f"Invalid status: {new_status}")
+    references = [normalize_reference(reference) for reference in references]
+    now = timezone.now()
+    previous = {}
+
+    with transaction.atomic():
+        # Locked in id order so concurrent bulk updates cannot deadlock
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(Q(id__in=ids) | Q(reference__in=references))
+            .order_by("id")
+        )
+
+        groups = defaultdict(list)
+        for order in orders:
+            if Order.can_transition(order.status, new_status):
+                groups[order.status].append(order)
+
+        for old_status, group in groups.items():
+            Order.objects.filter(id__in=[order.id for order in group]).update(
+                status=new_status, updated_at=now
+            )
+            for order in group:
+                previous[order.id] = old_status
+                order.status = new_status
+                order.updated_at = now
+            record_status_change(group, old_status)
+
+        if new_status in Order.RESTOCK_STATUSES and previous:
+            restore_stock(list(previous))
+
+        log_admin_actions(
+            user,
+            "update",
+            "Order",
+            [
+                (order_id, {"status": new_status, "previous_status": old_status})
+                for order_id, old_status in previous.items()
+            ],
+        )
+
+    by_id = {order.id: order for order in orders}
+    by_reference = {order.reference: order for order in orders}
+    outcomes = []
+    for key, order in [(i, by_id.get(i)) for i in ids] + [
+        (r, by_reference.get(r)) for r in references
+    ]:
+        if order is None:
+            outcomes.append({"order": key, "outcome": "not_found"})
+            continue
+        if order.id in previous:
+            outcome = "updated"
+        elif order.status == new_status:
+            outcome = "unchanged"
+        else:
+            outcome = "invalid_transition"
+        outcomes.append(
+            {
+                "order": key,
+                "id": order.id,
+                "reference": order.reference,
+                "outcome": outcome,
+                "previous_status": previous.get(order.id, order.status),
+                "status": order.status,
+            }
+        )
+    return outcomes
@@ -0,0 +1,144 @@
+"""
+Transactional outbox for order side effects.
+
+Messages are written in the same transaction as the order they belong to and
+delivered after commit by the ``drain_outbox`` management command, so checkout
+never waits on the mail server.
+
+A worker claims a batch in a short transaction by moving its
+``next_attempt_at`` OUTBOX_CLAIM_TIMEOUT seconds ahead, sends it with no
+transaction or row lock held, then records the outcomes. Messages of a worker
+that dies mid-batch become due again once the claim runs out.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def order_notifications(order):
+    """Unsaved customer confirmation and staff notification for a new order."""
+    messages = []
+    if order.email:
+        messages.append(
+            OutboxMessage(
+                order=order,
+                recipients=[order.email],
+                subject=f"Order Confirmation - {order.reference}",
+                body=f"Thank you for your order {order.reference}. Total: {order.total}",
+            )
+        )
+    if settings.ORDER_NOTIFICATION_EMAILS:
+        messages.append(
+            OutboxMessage(
+                order=order,
+                recipients=list(settings.ORDER_NOTIFICATION_EMAILS),
+                subject=f"New order - {order.reference}",
+                body=(
+                    f"New order {order.reference} from {order.name} "
+                    f"({order.phone}). Total: {order.total}"
+                ),
+            )
+        )
+    return messages
+
+
+def enqueue_order_notifications(order):
+    """Queue the notifications for a new order (call inside its transaction)."""
+    return OutboxMessage.objects.bulk_create(order_notifications(order))
+
+
+def retry_delay(attempts):
+    """Exponential backoff for the given number of failed attempts."""
+    seconds = settings.OUTBOX_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, settings.OUTBOX_MAX_BACKOFF))
+
+
+def _claim_batch(batch_size):
+    """Claim and return the next batch of due messages."""
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutboxMessage.objects.filter(
+            status="pending", next_attempt_at__lte=now
+        ).order_by("next_attempt_at", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers skip rows another worker is claiming
+            queryset = queryset.select_for_update(skip_locked=True)
+        batch = list(queryset[:batch_size])
+        OutboxMessage.objects.filter(id__in=[message.id for message in batch]).update(
+            next_attempt_at=now + timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+        )
+    return batch
+
+
+def _mark_failed(message, error, max_attempts, now):
+    message.attempts += 1
+    message.last_error = str(error)
+    if message.attempts >= max_attempts:
+        message.status = "failed"
+    else:
+        message.next_attempt_at = now + retry_delay(message.attempts)
+    logger.warning(
+        "Outbox message %s failed (attempt %s): %s", message.id, message.attempts, error
+    )
+
+
+def drain_outbox(batch_size=None, max_attempts=None):
+    """
+    Deliver one batch of due outbox messages over a single mail connection.
+    Returns a dict with the number of messages sent and failed.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+    stats = {"sent": 0, "failed": 0}
+
+    batch = _claim_batch(batch_size)
+    if not batch:
+        return stats
+
+    now = timezone.now()
+    mail = get_connection(fail_silently=False)
+    try:
+        mail.open()
+    except Exception as e:
+        for message in batch:
+            _mark_failed(message, e, max_attempts, now)
+        stats["failed"] = len(batch)
+    else:
+        try:
+            for message in batch:
+                email = EmailMessage(
+                    subject=message.subject,
+                    body=message.body,
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=message.recipients,
+                    connection=mail,
+                )
+                try:
+                    mail.send_messages([email])
+                except Exception as e:
+                    _mark_failed(message, e, max_attempts, now)
+                    stats["failed"] += 1
+                else:
+                    message.attempts += 1
+                    message.status = "sent"
+                    message.sent_at = now
+                    message.last_error = ""
+                    stats["sent"] += 1
+        finally:
+            mail.close()
+
+    # Also replaces the claim's next_attempt_at
+    OutboxMessage.objects.bulk_update(
+        batch, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+    )
+
+    return stats
@@ -0,0 +1,126 @@
+"""
+Pagination with estimated counts for very large admin lists.
+
+An exact ``COUNT(*)`` over millions of InnoDB rows scans a whole index on
+every page. Instead the count is taken over at most
+PAGINATION_EXACT_COUNT_LIMIT + 1 rows. Beyond that an unfiltered list
+reports the table statistics estimate, and a filtered one reports the limit
+as a lower bound. ``count_exact`` in the response tells clients which it is.
+"""
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+def estimated_table_rows(model, using="default"):
+    """Row count from the database's table statistics, or None if unknown."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table],
+            )
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(table)],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPage(Page):
+    """Page whose ``has_next`` comes from fetching one extra row."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never counts more than ``exact_limit`` + 1 rows."""
+
+    def __init__(self, *args, exact_limit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exact_limit = exact_limit or settings.PAGINATION_EXACT_COUNT_LIMIT
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        bounded = queryset.order_by()[: self.exact_limit + 1].count()
+        if bounded <= self.exact_limit:
+            return bounded
+
+        self.count_exact = False
+        if not queryset.query.where:
+            estimate = estimated_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_limit:
+                return estimate
+        return self.exact_limit
+
+    def validate_number(self, number):
+        self.count  # sets count_exact
+        if self.count_exact:
+            return super().validate_number(number)
+        # Pages past an estimated count may still exist, so only check the
+        # number itself here and let page() find out
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_("That page number is not an integer"))
+        if number < 1:
+            raise EmptyPage(_("That page number is less than 1"))
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom : bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(_("That page contains no results"))
+        return EstimatedCountPage(
+            rows[: self.per_page], number, self, len(rows) > self.per_page
+        )
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """PageNumberPagination with estimated counts past a threshold."""
+
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "count": self.page.paginator.count,
+                "count_exact": self.page.paginator.count_exact,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema["properties"]["count_exact"] = {"type": "boolean"}
+        return schema
@@ -0,0 +1,147 @@
+"""
+Order reference allocators.
+
+References are Crockford base32 (no I, L, O or U) behind the ``ORD-`` prefix:
+the allocated number followed by ``CHECK_WIDTH`` random characters, so a
+reference cannot be guessed from the previous one. New references are never
+8 characters long, so they cannot clash with legacy ``ORD-XXXXXXXX``
+uuid4-hex references, which stay valid for lookup.
+
+The allocator is chosen with ``settings.ORDER_REFERENCE_ALLOCATOR``.
+"""
+
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+PREFIX = "ORD-"
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+CHECK_WIDTH = 4
+# Characters customers commonly mistype for their Crockford equivalents
+_TYPOS = str.maketrans({"O": "0", "I": "1", "L": "1"})
+
+
+def encode(number, width):
+    """Crockford base32 encoding, left-padded with zeros to ``width``."""
+    chars = []
+    while number:
+        number, remainder = divmod(number, 32)
+        chars.append(ALPHABET[remainder])
+    return "".join(reversed(chars)).rjust(width, "0")
+
+
+def check_chars():
+    """Random characters appended to every new reference."""
+    return "".join(secrets.choice(ALPHABET) for _ in range(CHECK_WIDTH))
+
+
+def normalize_reference(reference):
+    """Canonical form of a reference typed by a customer."""
+    reference = reference.strip().upper()
+    if reference.startswith(PREFIX):
+        return PREFIX + reference[len(PREFIX) :].replace(" ", "").translate(_TYPOS)
+    return reference
+
+
+class SequenceBlockAllocator:
+    """
+    Hands out consecutive numbers from per-worker blocks.
+
+    Each block is claimed by inserting a ``ReferenceBlock`` row, so workers
+    never share a counter row and only pay one insert per block. InnoDB does
+    not reuse auto-increment ids after a rollback, so blocks are never handed
+    out twice.
+    """
+
+    width = 7
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or settings.ORDER_REFERENCE_BLOCK_SIZE
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _claim_block(self):
+        from .models import ReferenceBlock
+
+        block = ReferenceBlock.objects.create(
+            owner=f"{socket.gethostname()}:{os.getpid()}"[:100]
+        )
+        self._next = block.id * self.block_size
+        self._end = self._next + self.block_size
+
+    def allocate(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._claim_block()
+            number = self._next
+            self._next += 1
+        return PREFIX + encode(number, self.width) + check_chars()
+
+    def reset(self):
+        """Abandon the current block (e.g. after a collision)."""
+        with self._lock:
+            self._next = self._end = 0
+
+
+class TimeOrderedAllocator:
+    """
+    Snowflake-style ids: 42 bits of milliseconds since 2024-01-01, a 10-bit
+    node id and a 12-bit per-millisecond counter, encoded in 13 characters.
+
+    Unique as long as concurrent workers have distinct node ids; set
+    ``ORDER_REFERENCE_NODE_ID`` per worker to guarantee it (a random node id
+    is used otherwise).
+    """
+
+    width = 13
+    epoch_ms = 1704067200000
+
+    def __init__(self, node_id=None):
+        if node_id is None:
+            node_id = settings.ORDER_REFERENCE_NODE_ID
+        if node_id is None:
+            node_id = random.getrandbits(10)
+        self.node_id = node_id & 0x3FF
+        self._last_ms = -1
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        with self._lock:
+            now = max(int(time.time() * 1000) - self.epoch_ms, self._last_ms)
+            if now == self._last_ms:
+                self._counter = (self._counter + 1) & 0xFFF
+                if self._counter == 0:
+                    # Counter exhausted for this millisecond: move to the next one
+                    now += 1
+            else:
+                self._counter = 0
+            self._last_ms = now
+            number = (now << 22) | (self.node_id << 12) | self._counter
+        return PREFIX + encode(number, self.width) + check_chars()
+
+    def reset(self):
+        with self._lock:
+            self.node_id = random.getrandbits(10)
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    """Process-wide allocator configured by ORDER_REFERENCE_ALLOCATOR."""
+    global _allocator
+
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = import_string(settings.ORDER_REFERENCE_ALLOCATOR)()
+    return _allocator
@@ -2,15 +2,21 @@
 Serializers for the store API.
 """
 
+from django.conf import settings
 from django.contrib.auth.hashers import check_password, make_password
 from rest_framework import serializers
 
+from .exports import DATASETS
+from .geography import get_registry
+from .inventory import available_stock
 from .models import (
     AuditLog,
     Baladiya,
     Category,
     Client,
     ClientToken,
+    ExportJob,
+    ImportJob,
     Order,
     OrderLine,
     Product,
@@ -62,6 +68,17 @@ class ProductImageSerializer(serializers.ModelSerializer):
         fields = ["id", "image_url", "alt_text", "position"]
 
 
+def _live_stock(variant, data):
+    """Report a sharded variant's stock from its shards, not the snapshot."""
+    if variant.shard_count:
+        stock = available_stock(variant)
+        data["stock_quantity"] = stock
+        if "is_in_stock" in data:
+            data["is_in_stock"] = stock > 0
+            data["is_low_stock"] = stock <= variant.low_stock_threshold
+    return data
+
+
 class ProductVariantSerializer(serializers.ModelSerializer):
     """Product variant serializer."""
 
@@ -94,6 +111,7 @@ class ProductVariantSerializer(serializers.ModelSerializer):
             "compare_at_price",
             "stock_quantity",
             "low_stock_threshold",
+            "shard_count",
             "barcode",
             "weight",
             "is_active",
@@ -105,22 +123,34 @@ class ProductVariantSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["created_at", "updated_at"]
+        read_only_fields = ["shard_count", "created_at", "updated_at"]
+
+    def validate(self, data):
+        """Sharded stock can only change through checkouts and the shard tools."""
+        if (
+            self.instance is not None
+            and self.instance.shard_count
+            and "stock_quantity" in data
+        ):
+            if data["stock_quantity"] != available_stock(self.instance):
+                raise serializers.ValidationError(
+                    {
+                        "stock_quantity": "Stock of a sharded variant cannot be "
+                        "edited; consolidate it first."
+                    }
+                )
+            del data["stock_quantity"]
+        return data
+
+    def to_representation(self, instance):
+        return _live_stock(instance, super().to_representation(instance))
 
     def create(self, validated_data):
         """Create variant with images."""
         images_data = validated_data.pop("images_data", [])
         variant = ProductVariant.objects.create(**validated_data)
 
-        # Create images
-        for idx, img_data in enumerate(images_data):
-            ProductImage.objects.create(
-                variant=variant,
-                image_url=img_data.get("image_url", ""),
-                alt_text=img_data.get("alt_text", ""),
-                position=img_data.get("position", idx),
-            )
-
+        self._create_images(variant, images_data)
         return variant
 
     def update(self, instance, validated_data):
@@ -134,19 +164,46 @@ class ProductVariantSerializer(serializers.ModelSerializer):
 
         # Update images if provided
         if images_data is not None:
-            # Delete existing images
             instance.images.all().delete()
-            # Create new images
-            for idx, img_data in enumerate(images_data):
-                ProductImage.objects.create(
-                    variant=instance,
-                    image_url=img_data.get("image_url", ""),
-                    alt_text=img_data.get("alt_text", ""),
-                    position=img_data.get("position", idx),
-                )
+            self._create_images(instance, images_data)
 
         return instance
 
+    def _create_images(self, variant, images_data):
+        ProductImage.objects.bulk_create(
+            ProductImage(
+                variant=variant,
+                image_url=img_data.get("image_url", ""),
+                alt_text=img_data.get("alt_text", ""),
+                position=img_data.get("position", idx),
+            )
+            for idx, img_data in enumerate(images_data)
+        )
+
+
+class LowStockVariantSerializer(serializers.ModelSerializer):
+    """Row of the low-stock report (product fetched with select_related)."""
+
+    product_title = serializers.CharField(source="product.title", read_only=True)
+
+    class Meta:
+        model = ProductVariant
+        fields = [
+            "id",
+            "product",
+            "product_title",
+            "sku",
+            "size",
+            "color",
+            "stock_quantity",
+            "low_stock_threshold",
+            "shard_count",
+            "is_active",
+        ]
+
+    def to_representation(self, instance):
+        return _live_stock(instance, super().to_representation(instance))
+
 
 class ProductSerializer(serializers.ModelSerializer):
     """Product serializer for public API."""
@@ -256,6 +313,7 @@ class OrderSerializer(serializers.ModelSerializer):
             "reference",
             "status",
             "name",
+            "email",
             "phone",
             "address",
             "wilaya",
@@ -274,59 +332,107 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ["reference", "created_at", "updated_at"]
 
 
-class CheckoutSerializer(serializers.Serializer):
-    """Checkout serializer for guest orders."""
+class OrderChangeSerializer(serializers.ModelSerializer):
+    """Compact order representation for the change feed (ids, no names)."""
 
-    # Cart items
-    items = serializers.ListField(
-        child=serializers.DictField(),
-        help_text="List of cart items with variant_id and quantity",
+    lines = OrderLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            "id",
+            "reference",
+            "status",
+            "payment_status",
+            "name",
+            "email",
+            "phone",
+            "address",
+            "wilaya",
+            "baladiya",
+            "subtotal",
+            "shipping_cost",
+            "total",
+            "lines",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
+class BulkOrderStatusSerializer(serializers.Serializer):
+    """Orders (by id and/or reference) to move to a new status."""
+
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    references = serializers.ListField(
+        child=serializers.CharField(max_length=50), required=False
     )
+    status = serializers.ChoiceField(choices=Order.ORDER_STATUS_CHOICES)
 
-    # Customer info
-    name = serializers.CharField(max_length=200)
-    phone = serializers.CharField(max_length=20)
-    address = serializers.CharField()
+    def validate(self, data):
+        count = len(data.get("ids", [])) + len(data.get("references", []))
+        if not count:
+            raise serializers.ValidationError("Provide ids or references.")
+        if count > settings.ORDER_BULK_STATUS_MAX:
+            raise serializers.ValidationError(
+                f"At most {settings.ORDER_BULK_STATUS_MAX} orders per request."
+            )
+        return data
+
+
+class CartItemSerializer(serializers.Serializer):
+    """One cart line."""
+
+    variant_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class ShippingQuoteSerializer(serializers.Serializer):
+    """Cart and destination for a shipping quote."""
+
+    # Cart items
+    items = CartItemSerializer(
+        many=True, help_text="List of cart items with variant_id and quantity"
+    )
     wilaya = serializers.IntegerField()
-    baladiya = serializers.IntegerField()
 
     def validate_items(self, value):
         """Validate cart items."""
         if not value:
             raise serializers.ValidationError("Cart cannot be empty.")
-        for item in value:
-            if "variant_id" not in item or "quantity" not in item:
-                raise serializers.ValidationError(
-                    "Each item must have variant_id and quantity."
-                )
-            if item["quantity"] <= 0:
-                raise serializers.ValidationError("Quantity must be greater than 0.")
         return value
 
     def validate_wilaya(self, value):
         """Validate wilaya exists."""
-        from .models import Wilaya
-
-        try:
-            Wilaya.objects.get(id=value)
-        except Wilaya.DoesNotExist:
+        if get_registry().wilaya(value) is None:
             raise serializers.ValidationError("Invalid wilaya.")
         return value
 
-    def validate_baladiya(self, value):
-        """Validate baladiya exists and belongs to wilaya."""
-        from .models import Baladiya
 
-        try:
-            baladiya = Baladiya.objects.get(id=value)
-            if baladiya.wilaya.id != self.initial_data.get("wilaya"):
-                raise serializers.ValidationError(
-                    "Baladiya does not belong to selected wilaya."
-                )
-        except Baladiya.DoesNotExist:
+class CheckoutSerializer(ShippingQuoteSerializer):
+    """Checkout serializer for guest orders."""
+
+    # Customer info
+    name = serializers.CharField(max_length=200)
+    email = serializers.EmailField(required=False, allow_blank=True)
+    phone = serializers.CharField(max_length=20)
+    address = serializers.CharField()
+    baladiya = serializers.IntegerField()
+
+    def validate_baladiya(self, value):
+        """Validate baladiya exists."""
+        if get_registry().baladiya(value) is None:
             raise serializers.ValidationError("Invalid baladiya.")
         return value
 
+    def validate(self, data):
+        """Check the baladiya belongs to the selected wilaya."""
+        if not get_registry().baladiya_in_wilaya(data["baladiya"], data["wilaya"]):
+            raise serializers.ValidationError(
+                {"baladiya": "Baladiya does not belong to selected wilaya."}
+            )
+        return data
+
 
 class AuditLogSerializer(serializers.ModelSerializer):
     """Audit log serializer."""
@@ -351,6 +457,90 @@ class AuditLogSerializer(serializers.ModelSerializer):
         read_only_fields = ["timestamp"]
 
 
+class ExportJobSerializer(serializers.ModelSerializer):
+    """Export job with progress; only kind, format and params are writable."""
+
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = [
+            "id",
+            "kind",
+            "format",
+            "params",
+            "status",
+            "total_rows",
+            "rows_written",
+            "progress",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+        read_only_fields = [
+            "status",
+            "total_rows",
+            "rows_written",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+
+    def get_progress(self, obj):
+        """Fraction of rows written, once the worker has counted them."""
+        if obj.status == "completed":
+            return 1.0
+        if not obj.total_rows:
+            return None
+        return round(min(obj.rows_written / obj.total_rows, 1.0), 4)
+
+    def validate_params(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("params must be an object")
+        return value
+
+    def validate(self, data):
+        try:
+            DATASETS[data["kind"]].queryset(data.get("params", {}))
+        except ValueError as e:
+            raise serializers.ValidationError({"params": str(e)})
+        return data
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Import job progress (read-only; jobs are created from an upload)."""
+
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            "id",
+            "status",
+            "original_name",
+            "file_size",
+            "rows_processed",
+            "imported",
+            "created",
+            "updated",
+            "unchanged",
+            "deactivated",
+            "deactivate_missing",
+            "error_count",
+            "rows_per_second",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+        read_only_fields = fields
+
+    def get_rows_per_second(self, obj):
+        return round(obj.rows_processed / obj.seconds) if obj.seconds else None
+
+
 # Admin serializers
 class AdminProductSerializer(serializers.ModelSerializer):
     """Admin product serializer with full details."""
@@ -380,29 +570,48 @@ class AdminProductSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """Create product with categories."""
-        categories_data = self.initial_data.get("categories", [])
+        category_ids = self._category_ids(self.initial_data.get("categories", []))
         product = Product.objects.create(**validated_data)
-        for category_id in categories_data:
-            category = Category.objects.get(id=category_id)
-            ProductCategory.objects.create(product=product, category=category)
+        self._link_categories(product, category_ids)
         return product
 
     def update(self, instance, validated_data):
         """Update product with categories."""
         categories_data = self.initial_data.get("categories", None)
+        if categories_data is not None:
+            category_ids = self._category_ids(categories_data)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
 
         if categories_data is not None:
-            # Update categories
             instance.product_categories.all().delete()
-            for category_id in categories_data:
-                category = Category.objects.get(id=category_id)
-                ProductCategory.objects.create(product=instance, category=category)
+            self._link_categories(instance, category_ids)
 
         return instance
 
+    def _category_ids(self, values):
+        """Check category ids in one query; returns them deduplicated."""
+        try:
+            values = serializers.ListField(
+                child=serializers.IntegerField()
+            ).run_validation(values)
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({"categories": e.detail})
+        ids = list(dict.fromkeys(values))
+        found = set(Category.objects.filter(id__in=ids).values_list("id", flat=True))
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                {"categories": [f"Unknown category id: {pk}" for pk in missing]}
+            )
+        return ids
+
+    def _link_categories(self, product, category_ids):
+        ProductCategory.objects.bulk_create(
+            ProductCategory(product=product, category_id=pk) for pk in category_ids
+        )
+
 
 # Client Authentication Serializers
 class ClientSerializer(serializers.ModelSerializer):
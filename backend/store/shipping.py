@@ -0,0 +1,125 @@
+"""
+Shipping rate engine.
+
+Zones and rate tiers are compiled into a per-process lookup table (see
+``VersionedSnapshot``) and variant prices/weights are read from the cache,
+so quoting a cart does not touch the database once both are warm.
+"""
+
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ProductVariant, ShippingRate, Wilaya
+from .utils import VersionedSnapshot
+
+VERSION_CACHE_KEY = "store:shipping:version"
+VARIANT_CACHE_KEY = "store:shipping:variant:{}"
+
+RateTier = namedtuple("RateTier", ["min_weight", "max_weight", "min_subtotal", "price"])
+ZoneEntry = namedtuple("ZoneEntry", ["id", "name", "tiers"])
+ShippingQuote = namedtuple("ShippingQuote", ["zone", "weight", "subtotal", "cost"])
+VariantPricing = namedtuple("VariantPricing", ["sku", "price", "weight"])
+
+
+class ShippingTable:
+    """Compiled wilaya -> zone -> rate tiers lookup."""
+
+    def __init__(self, version, zones_by_wilaya):
+        self.version = version
+        self.zones_by_wilaya = zones_by_wilaya
+
+    def quote(self, wilaya_id, weight, subtotal):
+        """Cheapest tier of the wilaya's zone matching weight and subtotal."""
+        zone = self.zones_by_wilaya.get(wilaya_id)
+        prices = [
+            tier.price
+            for tier in (zone.tiers if zone else ())
+            if tier.min_weight <= weight
+            and (tier.max_weight is None or weight < tier.max_weight)
+            and tier.min_subtotal <= subtotal
+        ]
+        cost = min(prices) if prices else settings.DEFAULT_SHIPPING_COST
+        return ShippingQuote(zone.name if zone else None, weight, subtotal, cost)
+
+
+def _load(version):
+    tiers = {}
+    rates = ShippingRate.objects.filter(zone__is_active=True).values_list(
+        "zone_id", "min_weight", "max_weight", "min_subtotal", "price"
+    )
+    for zone_id, *tier in rates:
+        tiers.setdefault(zone_id, []).append(RateTier(*tier))
+
+    zones = {}
+    zones_by_wilaya = {}
+    rows = Wilaya.objects.filter(shipping_zone__is_active=True).values_list(
+        "id", "shipping_zone_id", "shipping_zone__name"
+    )
+    for wilaya_id, zone_id, zone_name in rows:
+        if zone_id not in zones:
+            zones[zone_id] = ZoneEntry(
+                zone_id, zone_name, tuple(tiers.get(zone_id, ()))
+            )
+        zones_by_wilaya[wilaya_id] = zones[zone_id]
+    return ShippingTable(version, zones_by_wilaya)
+
+
+_snapshot = VersionedSnapshot(VERSION_CACHE_KEY, _load, settings.SHIPPING_RATES_MAX_AGE)
+
+
+def get_shipping_table():
+    """Return the current shipping table, loading it if missing or out of date."""
+    return _snapshot.get()
+
+
+shipping_rates_changed = _snapshot.changed
+
+
+def get_variant_pricing(variant_ids):
+    """
+    Return {variant_id: VariantPricing} for active variants.
+    Cached entries are used first; misses are loaded with a single query.
+    """
+    keys = {
+        VARIANT_CACHE_KEY.format(variant_id): variant_id for variant_id in variant_ids
+    }
+    pricing = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    missing = [variant_id for variant_id in keys.values() if variant_id not in pricing]
+    if missing:
+        rows = ProductVariant.objects.filter(
+            id__in=missing, is_active=True
+        ).values_list("id", "sku", "price", "weight")
+        loaded = {
+            variant_id: VariantPricing(sku, price, weight or Decimal("0"))
+            for variant_id, sku, price, weight in rows
+        }
+        cache.set_many(
+            {VARIANT_CACHE_KEY.format(k): v for k, v in loaded.items()},
+            settings.SHIPPING_VARIANT_CACHE_TTL,
+        )
+        pricing.update(loaded)
+    return pricing
+
+
+def evict_variant_pricing(variant_ids):
+    """Drop cached prices and weights, now and again once committed."""
+    keys = [VARIANT_CACHE_KEY.format(variant_id) for variant_id in variant_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # Evict again after commit in case another request re-cached the old rows
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def variant_pricing_changed(sender, instance, update_fields=None, **kwargs):
+    """Signal receiver evicting a variant's cached price and weight."""
+    if update_fields and not {"sku", "price", "weight", "is_active"} & set(
+        update_fields
+    ):
+        return
+    evict_variant_pricing([instance.pk])
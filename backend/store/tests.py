@@ -2,14 +2,106 @@
 Tests for the store app.
 """
 
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import timedelta
 from decimal import Decimal
+from unittest import mock
 
+from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import EmptyPage
+from django.db import DatabaseError, NotSupportedError, connection, transaction
+from django.forms.models import model_to_dict
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from .models import Baladiya, Category, Client, Order, Product, ProductVariant, Wilaya
+from . import analytics, dashboard, outbox
+from .analytics import rebuild_day
+from .archive import archive_orders
+from .audit import MAX_VALUE_LENGTH, AuditWriter
+from .batching import CheckoutBatcher, CheckoutPending, submit_checkout
+from .export_jobs import (
+    Superseded,
+    checkpoint,
+    claim_file,
+    claim_job,
+    job_path,
+    run_job,
+)
+from .geography import get_registry
+from .import_jobs import claim_import_job
+from .import_jobs import run_job as run_import_job
+from .imports import import_products
+from .inventory import (
+    InsufficientStock,
+    available_stock,
+    consolidate_stock,
+    low_stock_variants,
+    reserve_stock,
+    shard_stock,
+)
+from .models import (
+    ArchivedOrder,
+    AuditLog,
+    Baladiya,
+    Category,
+    Client,
+    ExportJob,
+    ImportJob,
+    Order,
+    OrderLine,
+    OutboxMessage,
+    Product,
+    ProductVariant,
+    ShippingRate,
+    ShippingZone,
+    Wilaya,
+)
+from .orders import CheckoutError, place_order
+from .outbox import drain_outbox
+from .pagination import EstimatedCountPaginator
+from .references import (
+    CHECK_WIDTH,
+    SequenceBlockAllocator,
+    TimeOrderedAllocator,
+    get_allocator,
+    normalize_reference,
+)
+from .utils import cached_computation, log_admin_action
+
+
+class AuditLogMixin:
+    """Write audit rows, which are queued on commit, inside TestCase."""
+
+    def setUp(self):
+        super().setUp()
+        # A writer of our own, whose background thread never flushes
+        writer = AuditWriter(interval=3600)
+        patcher = mock.patch("store.audit._writer", writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.audit_writer = writer
+
+    @contextmanager
+    def audited(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            yield
+        self.audit_writer.flush()
 
 
 class CategoryModelTest(TestCase):
@@ -228,3 +320,1607 @@ class AdminAPITest(TestCase):
         }
         response = self.client.post("/api/v1/admin/products/", data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class OutboxTest(TestCase):
+    """Test checkout emails go through the outbox."""
+
+    def setUp(self):
+        self.client = APIClient()
+        product = Product.objects.create(title="Test Product", description="Test")
+        self.variant = ProductVariant.objects.create(
+            product=product, sku="TEST-001", price=Decimal("29.99"), stock_quantity=10
+        )
+        self.wilaya = Wilaya.objects.create(name="Alger", code="16")
+        self.baladiya = Baladiya.objects.create(name="Alger Centre", wilaya=self.wilaya)
+
+    def checkout(self):
+        data = {
+            "items": [{"variant_id": self.variant.id, "quantity": 1}],
+            "name": "Test User",
+            "email": "buyer@example.com",
+            "phone": "0550123456",
+            "address": "123 Main St",
+            "wilaya": self.wilaya.id,
+            "baladiya": self.baladiya.id,
+        }
+        return self.client.post("/api/v1/checkout/", data, format="json")
+
+    def test_checkout_queues_email_without_sending(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.recipients, ["buyer@example.com"])
+        self.assertEqual(message.status, "pending")
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_drain_sends_pending_messages(self):
+        self.checkout()
+        self.assertEqual(drain_outbox(), {"sent": 1, "failed": 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboxMessage.objects.get().status, "sent")
+        self.assertEqual(drain_outbox(), {"sent": 0, "failed": 0})
+
+    def test_drain_backs_off_on_failure(self):
+        self.checkout()
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=OSError("smtp down"),
+        ):
+            self.assertEqual(drain_outbox(max_attempts=2), {"sent": 0, "failed": 1})
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, "pending")
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, message.created_at)
+        # Not due yet, so the next drain leaves it alone
+        self.assertEqual(drain_outbox(), {"sent": 0, "failed": 0})
+
+    def test_claimed_messages_are_skipped_until_the_claim_runs_out(self):
+        self.checkout()
+        concurrent = []
+
+        def send_messages(backend, messages):
+            # Another worker draining while this batch is being sent
+            concurrent.append(drain_outbox())
+            return len(messages)
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            send_messages,
+        ):
+            self.assertEqual(drain_outbox(), {"sent": 1, "failed": 0})
+        self.assertEqual(concurrent, [{"sent": 0, "failed": 0}])
+        self.assertEqual(OutboxMessage.objects.get().status, "sent")
+
+        # A worker that died after claiming: its messages are due again later
+        self.checkout()
+        claimed = outbox._claim_batch(10)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(drain_outbox(), {"sent": 0, "failed": 0})
+        later = timezone.now() + timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT + 1)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            self.assertEqual(drain_outbox(), {"sent": 1, "failed": 0})
+
+
+class GeographyRegistryTest(TestCase):
+    """Test the in-memory Wilaya/Baladiya registry."""
+
+    def setUp(self):
+        self.wilaya = Wilaya.objects.create(name="Alger", code="16")
+        self.baladiya = Baladiya.objects.create(name="Alger Centre", wilaya=self.wilaya)
+        self.other = Wilaya.objects.create(name="Oran", code="31")
+
+    def test_lookups(self):
+        registry = get_registry()
+        self.assertEqual(registry.wilaya(self.wilaya.id).name, "Alger")
+        self.assertTrue(registry.baladiya_in_wilaya(self.baladiya.id, self.wilaya.id))
+        self.assertFalse(registry.baladiya_in_wilaya(self.baladiya.id, self.other.id))
+        self.assertEqual(registry.wilaya_by_name(" oran ").id, self.other.id)
+        self.assertEqual(
+            registry.baladiya_by_name(self.wilaya.id, "alger centre").id,
+            self.baladiya.id,
+        )
+
+    def test_loaded_once(self):
+        get_registry()
+        with self.assertNumQueries(0):
+            get_registry().wilaya(self.wilaya.id)
+
+    def test_reloads_after_edit(self):
+        get_registry()
+        self.wilaya.name = "El Djazair"
+        self.wilaya.save()
+        self.assertEqual(get_registry().wilaya(self.wilaya.id).name, "El Djazair")
+
+    def test_checkout_rejects_baladiya_from_other_wilaya(self):
+        product = Product.objects.create(title="Test Product", description="Test")
+        variant = ProductVariant.objects.create(
+            product=product, sku="TEST-001", price=Decimal("29.99"), stock_quantity=10
+        )
+        data = {
+            "items": [{"variant_id": variant.id, "quantity": 1}],
+            "name": "Test User",
+            "phone": "0550123456",
+            "address": "123 Main St",
+            "wilaya": self.other.id,
+            "baladiya": self.baladiya.id,
+        }
+        response = APIClient().post("/api/v1/checkout/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("baladiya", response.data)
+
+
+class ShippingQuoteTest(TestCase):
+    """Test per-wilaya shipping rates."""
+
+    def setUp(self):
+        self.client = APIClient()
+        zone = ShippingZone.objects.create(name="Nord")
+        ShippingRate.objects.create(
+            zone=zone, max_weight=Decimal("2.00"), price=Decimal("400.00")
+        )
+        ShippingRate.objects.create(
+            zone=zone, min_weight=Decimal("2.00"), price=Decimal("700.00")
+        )
+        ShippingRate.objects.create(
+            zone=zone, min_subtotal=Decimal("10000.00"), price=Decimal("0.00")
+        )
+        self.wilaya = Wilaya.objects.create(name="Alger", code="16", shipping_zone=zone)
+        self.baladiya = Baladiya.objects.create(name="Alger Centre", wilaya=self.wilaya)
+        self.unzoned = Wilaya.objects.create(name="Tamanrasset", code="11")
+        product = Product.objects.create(title="Test Product", description="Test")
+        self.variant = ProductVariant.objects.create(
+            product=product,
+            sku="TEST-001",
+            price=Decimal("1000.00"),
+            weight=Decimal("0.50"),
+            stock_quantity=50,
+        )
+
+    def quote(self, quantity, wilaya=None):
+        data = {
+            "wilaya": (wilaya or self.wilaya).id,
+            "items": [{"variant_id": self.variant.id, "quantity": quantity}],
+        }
+        return self.client.post("/api/v1/shipping/quote/", data, format="json")
+
+    def test_tiers_by_weight_and_subtotal(self):
+        self.assertEqual(self.quote(1).data["shipping_cost"], "400.00")
+        self.assertEqual(self.quote(4).data["shipping_cost"], "700.00")
+        self.assertEqual(self.quote(10).data["shipping_cost"], "0.00")
+        self.assertEqual(self.quote(1).data["zone"], "Nord")
+
+    def test_default_rate_without_zone(self):
+        response = self.quote(1, wilaya=self.unzoned)
+        self.assertEqual(response.data["shipping_cost"], "10.00")
+
+    def test_rejects_non_integer_items(self):
+        for item in (
+            {"variant_id": "abc", "quantity": 1},
+            {"variant_id": self.variant.id, "quantity": "two"},
+            {"variant_id": self.variant.id, "quantity": 0},
+            {"variant_id": self.variant.id},
+        ):
+            response = self.client.post(
+                "/api/v1/shipping/quote/",
+                {"wilaya": self.wilaya.id, "items": [item]},
+                format="json",
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("items", response.data)
+
+    def test_quote_hot_path_has_no_queries(self):
+        self.quote(1)
+        with self.assertNumQueries(0):
+            response = self.quote(2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_price_change_evicts_cached_variant(self):
+        self.quote(1)
+        self.variant.price = Decimal("20.00")
+        self.variant.save()
+        self.assertEqual(self.quote(1).data["subtotal"], "20.00")
+
+    def test_checkout_uses_shipping_engine(self):
+        data = {
+            "items": [{"variant_id": self.variant.id, "quantity": 1}],
+            "name": "Test User",
+            "phone": "0550123456",
+            "address": "123 Main St",
+            "wilaya": self.wilaya.id,
+            "baladiya": self.baladiya.id,
+        }
+        response = self.client.post("/api/v1/checkout/", data, format="json")
+        self.assertEqual(response.data["shipping_cost"], "400.00")
+        self.assertEqual(response.data["total"], "1400.00")
+
+
+class ShardedStockTest(TestCase):
+    """Test sharded stock for hot variants."""
+
+    def setUp(self):
+        product = Product.objects.create(title="Test Product", description="Test")
+        self.variant = ProductVariant.objects.create(
+            product=product, sku="HOT-001", price=Decimal("10.00"), stock_quantity=10
+        )
+
+    def test_shard_splits_stock(self):
+        shard_stock(self.variant, 3)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.shard_count, 3)
+        self.assertEqual(
+            sorted(self.variant.shards.values_list("quantity", flat=True)), [3, 3, 4]
+        )
+        self.assertEqual(available_stock(self.variant), 10)
+
+    def test_reserve_decrements_one_shard(self):
+        variant = shard_stock(self.variant, 2)
+        reserve_stock(variant.id, 2)
+        quantities = sorted(variant.shards.values_list("quantity", flat=True))
+        self.assertEqual(quantities, [3, 5])
+        # Spans shards once no single shard can cover the quantity
+        reserve_stock(variant.id, 6)
+        self.assertEqual(available_stock(variant), 2)
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(self.variant.id, 3)
+
+    def test_consolidate_restores_stock_quantity(self):
+        shard_stock(self.variant, 4)
+        reserve_stock(self.variant.id, 1)
+        variant = consolidate_stock(self.variant)
+        self.assertEqual(variant.shard_count, 0)
+        self.assertEqual(variant.stock_quantity, 9)
+        self.assertFalse(variant.shards.exists())
+
+    def test_readers_use_shard_totals_and_admin_edits_are_refused(self):
+        variant = shard_stock(self.variant, 2)
+        reserve_stock(variant.id, 8)  # stock_quantity still says 10
+        self.assertEqual([v.sku for v in low_stock_variants()], ["HOT-001"])
+
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        url = f"/api/v1/admin/variants/{variant.id}/"
+        response = client.get(url)
+        self.assertEqual(response.data["stock_quantity"], 2)
+        self.assertTrue(response.data["is_low_stock"])
+        response = client.patch(url, {"stock_quantity": 50}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # Echoing the current stock back (e.g. a full PUT) is fine
+        response = client.patch(
+            url, {"stock_quantity": 2, "color": "Red"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(consolidate_stock(variant).stock_quantity, 2)
+
+    def test_failed_checkout_rolls_back_reserved_stock(self):
+        wilaya = Wilaya.objects.create(name="Alger", code="16")
+        baladiya = Baladiya.objects.create(name="Alger Centre", wilaya=wilaya)
+        other = ProductVariant.objects.create(
+            product=self.variant.product, sku="HOT-002", price=1, stock_quantity=1
+        )
+        data = {
+            "items": [
+                {"variant_id": self.variant.id, "quantity": 2},
+                {"variant_id": other.id, "quantity": 5},
+            ],
+            "name": "Test User",
+            "phone": "0550123456",
+            "address": "123 Main St",
+            "wilaya": wilaya.id,
+            "baladiya": baladiya.id,
+        }
+        response = APIClient().post("/api/v1/checkout/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock_quantity, 10)
+
+
+class OrderReferenceTest(TestCase):
+    """Test order reference allocation."""
+
+    def setUp(self):
+        self.wilaya = Wilaya.objects.create(name="Alger", code="16")
+
+    def create_order(self, **kwargs):
+        return Order.objects.create(
+            wilaya=self.wilaya,
+            subtotal=Decimal("1.00"),
+            total=Decimal("1.00"),
+            **kwargs,
+        )
+
+    def test_sequence_blocks_are_unique(self):
+        allocator = SequenceBlockAllocator(block_size=10)
+        references = {allocator.allocate() for _ in range(35)}
+        self.assertEqual(len(references), 35)
+        self.assertTrue(
+            all(len(ref) == len("ORD-") + 7 + CHECK_WIDTH for ref in references)
+        )
+
+    def test_time_ordered_references_sort_by_time(self):
+        allocator = TimeOrderedAllocator(node_id=1)
+        references = [allocator.allocate() for _ in range(5000)]
+        self.assertEqual(len(set(references)), 5000)
+        self.assertEqual(references, sorted(references))
+
+    def test_save_retries_on_collision(self):
+        taken = self.create_order()
+        allocator = get_allocator()
+        with mock.patch.object(
+            Order,
+            "generate_reference",
+            side_effect=[taken.reference, allocator.allocate()],
+        ):
+            order = self.create_order()
+        self.assertNotEqual(order.reference, taken.reference)
+
+    def test_legacy_reference_lookup(self):
+        order = self.create_order(reference="ORD-1A2B3C4D", email="a@example.com")
+        response = APIClient().get(
+            "/api/v1/orders/ord-1a2b3c4d/", {"email": "a@example.com"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["reference"], order.reference)
+        self.assertEqual(normalize_reference("ord-0ilo"), "ORD-0110")
+
+    def test_lookup_needs_matching_email_or_phone(self):
+        order = self.create_order(phone="0550 12 34 56")
+        url = f"/api/v1/orders/{order.reference}/"
+        client = APIClient()
+        for params in ({}, {"email": ""}, {"phone": "0550000000"}):
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = client.get(url, {"phone": "+213 550 12 34 56"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CheckoutBatchTest(TestCase):
+    """Test micro-batched checkout commits."""
+
+    def setUp(self):
+        product = Product.objects.create(title="Test Product", description="Test")
+        self.variant = ProductVariant.objects.create(
+            product=product, sku="BATCH-001", price=Decimal("10.00"), stock_quantity=3
+        )
+        wilaya = Wilaya.objects.create(name="Alger", code="16")
+        self.data = {
+            "name": "Test User",
+            "email": "",
+            "phone": "0550123456",
+            "address": "123 Main St",
+            "wilaya": wilaya.id,
+            "baladiya": Baladiya.objects.create(name="Alger Centre", wilaya=wilaya).id,
+        }
+
+    def checkout(self, quantity):
+        return (
+            {
+                **self.data,
+                "items": [{"variant_id": self.variant.id, "quantity": quantity}],
+            },
+            Future(),
+        )
+
+    def test_batch_allocates_in_arrival_order(self):
+        batch = [self.checkout(2), self.checkout(2), self.checkout(1)]
+        CheckoutBatcher().commit(batch)
+
+        first, second, third = (future for _, future in batch)
+        self.assertEqual(first.result().lines.get().quantity, 2)
+        with self.assertRaises(CheckoutError):
+            second.result()
+        self.assertEqual(third.result().total, Decimal("20.00"))
+        self.assertEqual(OrderLine.objects.count(), 2)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock_quantity, 0)
+
+    @override_settings(CHECKOUT_BATCH_MAX_WAIT=0.01, CHECKOUT_BATCH_COMMIT_TIMEOUT=0.01)
+    def test_gives_up_on_a_stuck_batch(self):
+        data, future = self.checkout(1)
+        # Picked up by the committer thread, which never finishes it
+        future.set_running_or_notify_cancel()
+        batcher = mock.Mock(submit=mock.Mock(return_value=future))
+        with mock.patch("store.batching.get_batcher", return_value=batcher):
+            with self.assertRaises(CheckoutPending):
+                submit_checkout(data)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderExportTest(TestCase):
+    """Test the streaming order CSV export."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        self.wilaya = Wilaya.objects.create(name="Alger", code="16")
+        self.pending = Order.objects.create(
+            wilaya=self.wilaya, email="a@example.com", subtotal=10, total=10
+        )
+        self.shipped = Order.objects.create(status="shipped", subtotal=20, total=20)
+        self.pending.lines.create(
+            sku_snapshot="SKU-1",
+            title_snapshot="Shirt",
+            price_snapshot=5,
+            quantity=2,
+            line_total=10,
+        )
+
+    def export(self, **params):
+        response = self.client.get("/api/v1/admin/export/orders-csv/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b"".join(response.streaming_content).decode()
+        return [line.split(",") for line in content.splitlines()]
+
+    def test_export_filters_orders(self):
+        with self.settings(EXPORT_CHUNK_SIZE=1):
+            rows = self.export()
+        self.assertEqual(rows[0][:3], ["Reference", "Email", "Status"])
+        self.assertEqual(len(rows), 3)
+
+        rows = self.export(status="pending", wilaya=str(self.wilaya.id))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(
+            rows[1][:3], [self.pending.reference, "a@example.com", "pending"]
+        )
+
+    def test_export_order_lines(self):
+        rows = self.export(lines="1")
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], self.pending.reference)
+        self.assertEqual(rows[1][3], "SKU-1")
+
+    def test_export_rejects_bad_dates(self):
+        response = self.client.get(
+            "/api/v1/admin/export/orders-csv/", {"created_from": "yesterday"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportJobTest(TestCase):
+    """Test background export jobs."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        self.orders = [
+            Order.objects.create(subtotal=total, total=total) for total in (1, 2, 3)
+        ]
+
+    def create_job(self, **data):
+        response = self.client.post("/api/v1/admin/exports/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return ExportJob.objects.get(id=response.data["id"])
+
+    def read(self, job):
+        with gzip.open(job_path(job), "rt") as f:
+            return f.read().splitlines()
+
+    def test_job_exports_in_chunks_and_downloads(self):
+        job = self.create_job(kind="orders", format="ndjson")
+        job = run_job(claim_job(), chunk_size=2)
+        self.assertEqual((job.status, job.rows_written), ("completed", 3))
+
+        records = [json.loads(line) for line in self.read(job)]
+        self.assertEqual(
+            [r["reference"] for r in records], [o.reference for o in self.orders]
+        )
+        response = self.client.get(f"/api/v1/admin/exports/{job.id}/")
+        self.assertEqual(response.data["progress"], 1.0)
+        response = self.client.get(f"/api/v1/admin/exports/{job.id}/download/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Reading the body (not close(), which fires request_finished) is enough
+        body = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(len(body.decode().splitlines()), 3)
+
+        os.remove(job_path(job))
+        response = self.client.get(f"/api/v1/admin/exports/{job.id}/download/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_job_resumes_after_worker_dies(self):
+        job = self.create_job(kind="orders", params={"status": "pending"})
+        claimed = claim_job()
+        compress = gzip.compress
+        calls = []
+
+        def dying_compress(data):
+            calls.append(data)
+            if len(calls) == 2:
+                # Half-written chunk, then the worker is killed
+                with open(job_path(claimed), "ab") as f:
+                    f.write(b"garbage")
+                raise KeyboardInterrupt
+            return compress(data)
+
+        with mock.patch("gzip.compress", dying_compress):
+            with self.assertRaises(KeyboardInterrupt):
+                run_job(claimed, chunk_size=2)
+
+        self.assertIsNone(claim_job())
+        ExportJob.objects.filter(id=job.id).update(
+            heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+        job = run_job(claim_job(), chunk_size=2)
+        self.assertEqual(job.status, "completed")
+        lines = self.read(job)
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0].split(",")[0], "Reference")
+        self.assertEqual(os.listdir(os.path.dirname(job_path(job))), ["1.csv.gz"])
+
+    def test_superseded_worker_writes_to_its_own_file(self):
+        job = self.create_job(kind="orders")
+        stale = claim_job()
+        checkpoint(stale, file=f"exports/{job.id}.csv.gz")
+        _, stale_file = claim_file(stale, "file", 0)
+        stale_file.write(b"first worker")
+        stale_file.flush()
+
+        ExportJob.objects.filter(id=job.id).update(
+            heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+        job = run_job(claim_job(), chunk_size=2)
+        self.assertEqual(job.status, "completed")
+        # The stale worker keeps writing after the takeover
+        stale_file.write(b"garbage")
+        stale_file.close()
+        self.assertEqual(len(self.read(job)), 4)
+        with self.assertRaises(Superseded):
+            checkpoint(stale, bytes_written=1)
+
+    def test_invalid_params_rejected(self):
+        response = self.client.post(
+            "/api/v1/admin/exports/",
+            {"kind": "orders", "params": {"status": "lost"}},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderChangeFeedTest(TestCase):
+    """Test the incremental order change feed."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        self.orders = [
+            Order.objects.create(subtotal=total, total=total) for total in (1, 2, 3)
+        ]
+        self.settle()
+
+    def settle(self):
+        # Changes are only published once they are older than the settle window
+        Order.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+
+    def changes(self, **params):
+        response = self.client.get("/api/v1/admin/orders/changes/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_feed_pages_by_cursor(self):
+        first = self.changes(limit=2)
+        self.assertTrue(first["has_more"])
+        rest = self.changes(since=first["next_cursor"], limit=2)
+        self.assertFalse(rest["has_more"])
+        ids = [o["id"] for o in first["results"] + rest["results"]]
+        self.assertEqual(ids, [o.id for o in self.orders])
+
+        done = self.changes(since=rest["next_cursor"])
+        self.assertEqual(done["results"], [])
+        self.assertEqual(done["next_cursor"], rest["next_cursor"])
+
+    def test_feed_returns_changed_orders_only(self):
+        cursor = self.changes()["next_cursor"]
+        self.orders[0].status = "shipped"
+        self.orders[0].save()
+        self.assertEqual(self.changes(since=cursor)["results"], [])
+
+        Order.objects.filter(id=self.orders[0].id).update(
+            updated_at=timezone.now() - timedelta(seconds=30)
+        )
+        changed = self.changes(since=cursor)["results"]
+        self.assertEqual(
+            [(o["id"], o["status"]) for o in changed], [(self.orders[0].id, "shipped")]
+        )
+
+    def test_invalid_cursor(self):
+        for since in ("x", "9" * 30 + ".1", "1." + "9" * 30):
+            response = self.client.get(
+                "/api/v1/admin/orders/changes/", {"since": since}
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AdminOrderListTest(TestCase):
+    """Test the admin order list queries and search."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        wilaya = Wilaya.objects.create(name="Alger", code="16")
+        baladiya = Baladiya.objects.create(name="Alger Centre", wilaya=wilaya)
+        for index in range(5):
+            order = Order.objects.create(
+                name=f"Customer {index}",
+                phone=f"+213 550 00 00 0{index}",
+                wilaya=wilaya,
+                baladiya=baladiya,
+                subtotal=1,
+                total=1,
+            )
+            order.lines.create(
+                sku_snapshot="SKU",
+                title_snapshot="Shirt",
+                price_snapshot=1,
+                quantity=1,
+                line_total=1,
+            )
+
+    def search(self, term):
+        response = self.client.get("/api/v1/admin/orders/", {"search": term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["results"]
+
+    def test_list_query_count_is_constant(self):
+        # count, page of orders with wilaya/baladiya, lines prefetch
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/v1/admin/orders/")
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertEqual(response.data["results"][0]["wilaya_name"], "Alger")
+
+    def test_search_by_reference_phone_and_name(self):
+        order = Order.objects.get(name="Customer 3")
+        self.assertEqual(self.search(order.reference.lower())[0]["id"], order.id)
+        self.assertEqual(self.search("0550 00 00 03")[0]["id"], order.id)
+        self.assertEqual(len(self.search("0550")), 5)
+        self.assertEqual(len(self.search("customer")), 5)
+        self.assertEqual(self.search("Nobody"), [])
+
+
+class SalesAnalyticsTest(TestCase):
+    """Test incrementally maintained sales rollups."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        product = Product.objects.create(title="Shirt", description="Test")
+        self.variant = ProductVariant.objects.create(
+            product=product, sku="SHIRT-M", price=Decimal("10.00"), stock_quantity=50
+        )
+        self.wilaya = Wilaya.objects.create(name="Alger", code="16")
+        baladiya = Baladiya.objects.create(name="Alger Centre", wilaya=self.wilaya)
+        self.orders = [
+            place_order(
+                {
+                    "items": [{"variant_id": self.variant.id, "quantity": quantity}],
+                    "name": "Test User",
+                    "phone": "0550123456",
+                    "address": "123 Main St",
+                    "wilaya": self.wilaya.id,
+                    "baladiya": baladiya.id,
+                }
+            )
+            for quantity in (1, 2, 3)
+        ]
+
+    def report(self, name):
+        response = self.client.get(f"/api/v1/admin/analytics/{name}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["results"]
+
+    def test_rollups_follow_orders_and_status_changes(self):
+        self.client.patch(
+            f"/api/v1/admin/orders/{self.orders[2].id}/update_status/",
+            {"status": "cancelled"},
+        )
+        summary = self.report("summary")
+        # Shipping defaults to 10.00 per order
+        self.assertEqual(summary["orders"], 2)
+        self.assertEqual(summary["revenue"], "50.00")
+        self.assertEqual(summary["by_status"]["cancelled"]["orders"], 1)
+        self.assertEqual(
+            self.report("top-skus"),
+            [{"sku": "SHIRT-M", "units": 3, "revenue": "30.00"}],
+        )
+        self.assertEqual(self.report("wilayas")[0]["wilaya_name"], "Alger")
+        self.assertEqual(self.report("daily")[-1]["orders"], 2)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        incremental = self.report("summary")
+        rebuild_day(timezone.localdate())
+        self.assertEqual(self.report("summary"), incremental)
+
+    def test_rejects_bad_range(self):
+        response = self.client.get(
+            "/api/v1/admin/analytics/summary/",
+            {"from": "2024-02-01", "to": "2024-01-01"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            "/api/v1/admin/analytics/daily/",
+            {"from": "0001-01-01", "to": "2024-01-01"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            "/api/v1/admin/analytics/daily/",
+            {"from": "2024-01-01", "to": "2024-12-31"},
+        )
+        self.assertEqual(len(response.data["results"]), 366)
+
+    def test_django_admin_edits_keep_rollups_in_sync(self):
+        order_admin = admin.site._registry[Order]
+        request = RequestFactory().post("/")
+        request.user = User.objects.create_superuser(username="root")
+        order = self.orders[2]
+        form_class = order_admin.get_form(request, order)
+        data = model_to_dict(order, fields=form_class.base_fields)
+        form = form_class({**data, "status": "cancelled"}, instance=order)
+        self.assertTrue(form.is_valid(), form.errors)
+        order_admin.save_model(request, form.save(commit=False), form, True)
+        order_admin.save_related(request, form, [], True)
+
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock_quantity, 47)  # 3 units restocked
+        self.assertEqual(self.report("summary")["orders"], 2)
+
+        order_admin.delete_model(request, self.orders[0])
+        self.assertEqual(self.report("summary")["orders"], 1)
+
+
+class BulkOrderStatusTest(AuditLogMixin, TestCase):
+    """Test bulk order status transitions."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        self.orders = [
+            Order.objects.create(subtotal=1, total=1, status=order_status)
+            for order_status in ("pending", "pending", "confirmed", "shipped")
+        ]
+
+    def bulk(self, **data):
+        return self.client.post(
+            "/api/v1/admin/orders/bulk-status/", data, format="json"
+        )
+
+    def test_bulk_update_reports_outcomes(self):
+        pending, other, confirmed, shipped = self.orders
+        with self.audited(), CaptureQueriesContext(connection) as queries:
+            response = self.bulk(
+                ids=[pending.id, confirmed.id, shipped.id, 999999],
+                references=[other.reference.lower()],
+                status="shipped",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r["outcome"] for r in response.data["results"]],
+            ["updated", "updated", "unchanged", "not_found", "updated"],
+        )
+        self.assertEqual(response.data["counts"]["updated"], 3)
+        # One UPDATE per previous status (pending, confirmed)
+        statements = [q["sql"] for q in queries.captured_queries]
+        self.assertEqual(
+            sum(sql.startswith('UPDATE "store_order"') for sql in statements), 2
+        )
+        self.assertEqual(Order.objects.filter(status="shipped").count(), 4)
+        self.assertEqual(AuditLog.objects.filter(model_name="Order").count(), 3)
+
+    def test_bulk_update_validates_input(self):
+        self.assertEqual(self.bulk(status="shipped").status_code, 400)
+        response = self.bulk(ids=[self.orders[0].id], status="lost")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderStateMachineTest(TestCase):
+    """Test order status transitions and stock restoration."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        product = Product.objects.create(title="Shirt", description="Test")
+        self.plain = ProductVariant.objects.create(
+            product=product, sku="PLAIN", price=Decimal("10.00"), stock_quantity=10
+        )
+        self.hot = shard_stock(
+            ProductVariant.objects.create(
+                product=product, sku="HOT", price=Decimal("10.00"), stock_quantity=10
+            ),
+            2,
+        )
+        wilaya = Wilaya.objects.create(name="Alger", code="16")
+        self.data = {
+            "name": "Test User",
+            "phone": "0550123456",
+            "address": "123 Main St",
+            "wilaya": wilaya.id,
+            "baladiya": Baladiya.objects.create(name="Centre", wilaya=wilaya).id,
+        }
+
+    def order(self, *items):
+        return place_order(
+            {
+                **self.data,
+                "items": [
+                    {"variant_id": variant.id, "quantity": quantity}
+                    for variant, quantity in items
+                ],
+            }
+        )
+
+    def set_status(self, order, new_status):
+        return self.client.patch(
+            f"/api/v1/admin/orders/{order.id}/update_status/", {"status": new_status}
+        )
+
+    def test_cancel_restores_stock_once(self):
+        first = self.order((self.plain, 2), (self.hot, 3))
+        second = self.order((self.plain, 1))
+        self.assertEqual(available_stock(self.hot), 7)
+
+        response = self.client.post(
+            "/api/v1/admin/orders/bulk-status/",
+            {"ids": [first.id, second.id], "status": "cancelled"},
+            format="json",
+        )
+        self.assertEqual(response.data["counts"], {"updated": 2})
+        self.plain.refresh_from_db()
+        self.assertEqual(self.plain.stock_quantity, 10)
+        self.assertEqual(available_stock(self.hot), 10)
+
+        # Cancelling again is a no-op
+        self.assertEqual(self.set_status(first, "cancelled").status_code, 200)
+        self.plain.refresh_from_db()
+        self.assertEqual(self.plain.stock_quantity, 10)
+
+    def test_invalid_transitions_rejected(self):
+        order = self.order((self.plain, 2))
+        for new_status in ("shipped", "delivered"):
+            self.assertEqual(self.set_status(order, new_status).status_code, 200)
+        response = self.set_status(order, "pending")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.set_status(order, "returned").status_code, 200)
+        self.plain.refresh_from_db()
+        self.assertEqual(self.plain.stock_quantity, 10)
+
+
+class DashboardTest(TestCase):
+    """Test the cached admin dashboard KPIs."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        Order.objects.create(subtotal=10, total=10)
+        Order.objects.create(subtotal=20, total=20, status="shipped")
+        Order.objects.create(subtotal=30, total=30, status="delivered")
+        Order.objects.create(
+            subtotal=40, total=40, status="delivered", payment_status="paid"
+        )
+        product = Product.objects.create(title="Shirt", description="Test")
+        ProductVariant.objects.create(
+            product=product, sku="LOW", price=1, stock_quantity=2
+        )
+
+    def test_kpis_are_computed_once_per_ttl(self):
+        with mock.patch(
+            "store.dashboard.compute_kpis", wraps=dashboard.compute_kpis
+        ) as compute:
+            first = self.client.get("/api/v1/admin/dashboard/").data
+            Order.objects.create(subtotal=5, total=5)
+            second = self.client.get("/api/v1/admin/dashboard/").data
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first["pending_orders"], 1)
+        self.assertEqual(first["cod_to_collect"], {"orders": 2, "amount": "50.00"})
+        self.assertEqual(first["low_stock_variants"], 1)
+
+    def test_stale_value_served_while_locked(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cached_computation("kpi-test", compute, 0, 60), 1)
+        cache.add("kpi-test:lock", 1, 10)
+        # Expired, but another caller holds the lock: serve the stale value
+        self.assertEqual(cached_computation("kpi-test", compute, 0, 60), 1)
+        cache.delete("kpi-test:lock")
+        self.assertEqual(cached_computation("kpi-test", compute, 0, 60), 2)
+
+
+@override_settings(PAGINATION_EXACT_COUNT_LIMIT=5)
+class EstimatedCountPaginationTest(TestCase):
+    """Test bounded counts on the admin lists."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        for i in range(7):
+            AuditLog.objects.create(
+                admin_user=self.admin,
+                action_type="update" if i % 2 else "create",
+                model_name="Order",
+                object_id=str(i),
+            )
+
+    def test_small_lists_have_exact_counts(self):
+        response = self.client.get("/api/v1/admin/audit-logs/?action_type=update")
+        self.assertEqual(response.data["count"], 3)
+        self.assertTrue(response.data["count_exact"])
+
+    def test_large_lists_are_bounded_and_still_page(self):
+        # SQLite has no table statistics, so the limit is a lower bound
+        response = self.client.get("/api/v1/admin/audit-logs/")
+        self.assertEqual(response.data["count"], 5)
+        self.assertFalse(response.data["count_exact"])
+
+        paginator = EstimatedCountPaginator(
+            AuditLog.objects.order_by("id"), 3, exact_limit=5
+        )
+        self.assertEqual(paginator.count, 5)
+        last = paginator.page(3)
+        self.assertEqual([log.object_id for log in last], ["6"])
+        self.assertFalse(last.has_next())
+        self.assertTrue(paginator.page(2).has_next())
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+
+class OrderArchiveTest(TestCase):
+    """Test moving old finished orders to the archive tables."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", is_staff=True)
+        self.client = APIClient()
+        product = Product.objects.create(title="Shirt", description="Test")
+        variant = ProductVariant.objects.create(
+            product=product, sku="SHIRT-M", price=Decimal("10.00"), stock_quantity=50
+        )
+        wilaya = Wilaya.objects.create(name="Alger", code="16")
+        baladiya = Baladiya.objects.create(name="Alger Centre", wilaya=wilaya)
+        self.orders = [
+            place_order(
+                {
+                    "items": [{"variant_id": variant.id, "quantity": 2}],
+                    "name": "Test User",
+                    "email": "test@example.com",
+                    "phone": "0550123456",
+                    "address": "123 Main St",
+                    "wilaya": wilaya.id,
+                    "baladiya": baladiya.id,
+                }
+            )
+            for _ in range(3)
+        ]
+        old = timezone.now() - timedelta(days=400)
+        Order.objects.filter(pk__in=[o.id for o in self.orders[:2]]).update(
+            created_at=old
+        )
+        Order.objects.filter(pk=self.orders[0].id).update(status="delivered")
+
+    def test_moves_only_old_finished_orders(self):
+        self.assertEqual(archive_orders(chunk_size=1), 1)
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual(archived.id, self.orders[0].id)
+        self.assertEqual(archived.reference, self.orders[0].reference)
+        self.assertEqual([line.quantity for line in archived.lines.all()], [2])
+        self.assertFalse(Order.objects.filter(pk=archived.id).exists())
+        self.assertFalse(OrderLine.objects.filter(order_id=archived.id).exists())
+        # Old but pending, and recent orders stay
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_lookups_fall_through_to_archive(self):
+        archive_orders()
+        order = self.orders[0]
+        response = self.client.get(
+            f"/api/v1/orders/{order.reference}/", {"email": "test@example.com"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "delivered")
+        self.assertEqual(len(response.data["lines"]), 1)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(f"/api/v1/admin/orders/{order.id}/")
+        self.assertEqual(response.data["reference"], order.reference)
+        response = self.client.get("/api/v1/admin/orders/", {"archived": "true"})
+        self.assertEqual(response.data["count"], 1)
+
+        url = f"/api/v1/admin/orders/{order.id}/update_status/"
+        response = self.client.patch(url, {"status": "returned"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.patch(
+            url + "?archived=true", {"status": "returned"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(ArchivedOrder.objects.get().status, "delivered")
+
+    def test_rollups_still_include_archived_orders(self):
+        day = timezone.localdate(timezone.now() - timedelta(days=400))
+        rebuild_day(day)
+        before = analytics.summary(day, day)
+        archive_orders()
+        rebuild_day(day)
+        self.assertEqual(analytics.summary(day, day), before)
+        self.assertEqual(before["by_status"]["delivered"]["orders"], 1)
+
+
+class LowStockReportTest(TestCase):
+    """Test the indexed low-stock filter and report."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        product = Product.objects.create(title="Shirt", description="Test")
+        for sku, stock, active in [
+            ("OUT", 0, True),
+            ("LOW", 5, True),
+            ("EDGE", 10, True),
+            ("OK", 11, True),
+            ("OLD", 1, False),
+        ]:
+            ProductVariant.objects.create(
+                product=product,
+                sku=sku,
+                price=1,
+                stock_quantity=stock,
+                is_active=active,
+            )
+
+    def test_filter_matches_index_expression(self):
+        queryset = low_stock_variants()
+        self.assertEqual(
+            [variant.sku for variant in queryset], ["OUT", "OLD", "LOW", "EDGE"]
+        )
+        # Whether the planner picks the index depends on table statistics;
+        # what matters is that the filter compares the indexed expression
+        qn = connection.ops.quote_name
+        table = qn(ProductVariant._meta.db_table)
+        expression = (
+            f"({table}.{qn('stock_quantity')} - "
+            f"{table}.{qn('low_stock_threshold')}) <= 0"
+        )
+        self.assertIn(expression, str(queryset.query))
+
+        response = self.client.get("/api/v1/admin/variants/", {"low_stock": "true"})
+        self.assertEqual(response.data["count"], 4)
+
+    def test_report_is_paginated_without_extra_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/v1/admin/variants/low-stock/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["sku"] for row in response.data["results"]], ["OUT", "LOW", "EDGE"]
+        )
+        self.assertEqual(response.data["results"][0]["product_title"], "Shirt")
+
+
+class ProductImportTest(TestCase):
+    """Test the streaming product CSV upsert."""
+
+    HEADER = "title,slug,brand,sku,size,color,price,stock_quantity\n"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        self.other = Product.objects.create(title="Other", description="")
+        ProductVariant.objects.create(product=self.other, sku="TAKEN", price=1)
+
+    def upload(self, body):
+        return self.client.post(
+            "/api/v1/admin/import/products-csv/",
+            {"file": SimpleUploadedFile("products.csv", (self.HEADER + body).encode())},
+            format="multipart",
+        )
+
+    def test_creates_updates_and_reports_bad_rows(self):
+        response = self.upload(
+            "Shirt,shirt,Acme,SHIRT-S,S,Red,10.00,5\n"
+            "Shirt,shirt,Acme,SHIRT-M,M,Red,10.00,5\n"
+            "Shirt,shirt,Acme,SHIRT-L,L,Red,abc,5\n"
+            "Shirt,shirt,Acme,SHIRT-S,S,Red,10.00,5\n"
+            "Shirt,shirt,Acme,TAKEN,S,Red,10.00,-1\n"
+            "Shirt,shirt,Acme,TAKEN,S,Red,10.00,1\n"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["rows"], 6)
+        self.assertEqual(response.data["imported"], 2)
+        self.assertEqual(
+            response.data["errors"],
+            [
+                "Row 4: price must be a decimal number",
+                "Row 5: Duplicate SKU (first seen on row 2)",
+                "Row 6: stock_quantity cannot be negative",
+                "Row 7: SKU belongs to product other",
+            ],
+        )
+
+        # A second upload updates in place
+        response = self.upload("Shirt v2,shirt,Acme,SHIRT-S,S,Blue,12.50,7\n")
+        self.assertEqual(response.data["imported"], 1)
+        variant = ProductVariant.objects.get(sku="SHIRT-S")
+        self.assertEqual(variant.price, Decimal("12.50"))
+        self.assertEqual(variant.stock_quantity, 7)
+        self.assertEqual(variant.product.title, "Shirt v2")
+        self.assertEqual(Product.objects.filter(slug="shirt").count(), 1)
+
+    def test_upserts_without_conflict_target_on_mysql(self):
+        file = SimpleUploadedFile(
+            "products.csv", (self.HEADER + "Shirt,shirt,,SKU-1,,,1.00,1\n").encode()
+        )
+        targets = []
+
+        def bulk_create(queryset, objs, **kwargs):
+            targets.append(kwargs["unique_fields"])
+            raise NotSupportedError("no upserts here")
+
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+        with mock.patch.object(
+            connection.features, "supports_update_conflicts_with_target", False
+        ), mock.patch("django.db.models.QuerySet.bulk_create", bulk_create):
+            # A backend that cannot upsert fails the import, not its rows
+            with self.assertRaises(NotSupportedError):
+                import_products(file)
+        self.assertEqual(targets, [None])
+
+    def test_writes_in_chunks_with_constant_queries(self):
+        rows = "".join(f"Shirt,shirt,,SKU-{i},,,1.00,1\n" for i in range(50))
+        file = SimpleUploadedFile("products.csv", (self.HEADER + rows).encode())
+        # Per chunk: existing SKUs, savepoint, product upsert, product ids,
+        # variant upsert, release
+        with self.assertNumQueries(6 * 5):
+            result = import_products(file, chunk_size=10)
+        self.assertEqual(result["imported"], 50)
+        self.assertEqual(
+            ProductVariant.objects.filter(sku__startswith="SKU-").count(), 50
+        )
+
+    def test_rejects_missing_columns(self):
+        response = self.client.post(
+            "/api/v1/admin/import/products-csv/",
+            {"file": SimpleUploadedFile("products.csv", b"name,cost\nx,1\n")},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportJobTest(TestCase):
+    """Test background product import jobs."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+
+    def upload(self):
+        body = "slug,sku,price\n" + "".join(
+            f"shirt,SKU-{i},{'bad' if i == 3 else '1.00'}\n" for i in range(5)
+        )
+        response = self.client.post(
+            "/api/v1/admin/import/products-csv/?async=1",
+            {"file": SimpleUploadedFile("catalog.csv", body.encode())},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return ImportJob.objects.get(id=response.data["id"])
+
+    def test_job_imports_in_background_and_reports_errors(self):
+        job = self.upload()
+        self.assertFalse(ProductVariant.objects.exists())
+
+        job = run_import_job(claim_import_job(), chunk_size=2)
+        self.assertEqual(job.status, "completed")
+        self.assertEqual((job.rows_processed, job.imported, job.error_count), (5, 4, 1))
+
+        response = self.client.get(f"/api/v1/admin/import/jobs/{job.id}/")
+        self.assertEqual(response.data["imported"], 4)
+        response = self.client.get(f"/api/v1/admin/import/jobs/{job.id}/errors/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            report, ["row,sku,error", "5,SKU-3,price must be a decimal number"]
+        )
+
+    def test_cancel_stops_the_worker(self):
+        job = self.upload()
+        claimed = claim_import_job()
+        response = self.client.post(f"/api/v1/admin/import/jobs/{job.id}/cancel/")
+        self.assertEqual(response.data["status"], "cancelled")
+
+        job = run_import_job(claimed, chunk_size=2)
+        self.assertEqual(job.status, "cancelled")
+        # Noticed when claiming its error report file, before the first chunk
+        self.assertFalse(ProductVariant.objects.exists())
+        self.assertIsNone(claim_import_job())
+        response = self.client.post(f"/api/v1/admin/import/jobs/{job.id}/cancel/")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+
+class ProductImportDryRunTest(AuditLogMixin, TestCase):
+    """Test validating product CSV files without writing them."""
+
+    CSV = (
+        "slug,sku,price,stock_quantity\n"
+        "shirt,SHIRT-S,10.00,5\n"
+        "shirt,SHIRT-M,1O.00,5\n"
+        "shirt,SHIRT-L,10.00,-2\n"
+        "shirt,SHIRT-S,10.00,5\n"
+        "shirt,TAKEN,10.00,5\n"
+    )
+    EXPECTED = [
+        (3, "price must be a decimal number"),
+        (4, "stock_quantity cannot be negative"),
+        (5, "Duplicate SKU (first seen on row 2)"),
+        (6, "SKU belongs to product other"),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        other = Product.objects.create(title="Other", description="")
+        ProductVariant.objects.create(product=other, sku="TAKEN", price=1)
+
+    def test_api_reports_every_error_without_writing(self):
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        with self.audited():
+            response = client.post(
+                "/api/v1/admin/import/products-csv/?dry_run=1",
+                {"file": SimpleUploadedFile("catalog.csv", self.CSV.encode())},
+                format="multipart",
+            )
+        self.assertEqual(response.data["valid"], 1)
+        self.assertEqual(
+            response.data["errors"],
+            [f"Row {row}: {error}" for row, error in self.EXPECTED],
+        )
+        self.assertEqual(ProductVariant.objects.count(), 1)
+        self.assertFalse(AuditLog.objects.exists())
+
+        with self.settings(PRODUCT_IMPORT_SYNC_MAX_BYTES=10):
+            response = client.post(
+                "/api/v1/admin/import/products-csv/?dry_run=1",
+                {"file": SimpleUploadedFile("catalog.csv", self.CSV.encode())},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_command_validates_in_a_process_pool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalog.csv")
+            report = os.path.join(directory, "errors.csv")
+            with open(path, "w") as f:
+                f.write(self.CSV)
+            out = io.StringIO()
+            call_command(
+                "import_products_csv",
+                path,
+                "--dry-run",
+                "--workers=2",
+                "--chunk-size=2",
+                f"--errors={report}",
+                stdout=out,
+            )
+            with open(report) as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual(
+            [(int(row["row"]), row["error"]) for row in rows], self.EXPECTED
+        )
+        self.assertIn("5 rows, 1 valid, 4 errors", out.getvalue())
+        self.assertEqual(ProductVariant.objects.count(), 1)
+
+
+class ProductImportRichColumnsTest(TestCase):
+    """Test importing categories, images and compare-at prices."""
+
+    HEADER = "slug,sku,price,compare_at_price,categories,images\n"
+
+    def setUp(self):
+        self.men = Category.objects.create(name="Men", slug="men")
+        self.shirts = Category.objects.create(name="Shirts", slug="shirts")
+        Category.objects.create(name="Sale", slug="sale")
+
+    def run_import(self, body, **kwargs):
+        file = SimpleUploadedFile("catalog.csv", (self.HEADER + body).encode())
+        return import_products(file, **kwargs)
+
+    def test_imports_and_replaces_categories_and_images(self):
+        result = self.run_import(
+            "shirt,SHIRT-S,10.00,15.00,men|shirts,"
+            "https://cdn.example.com/s1.jpg|https://cdn.example.com/s2.jpg\n"
+            "shirt,SHIRT-M,10.00,,men|shirts,\n"
+            "shirt,SHIRT-L,10.00,,men|nope,\n"
+            "shirt,SHIRT-XL,10.00,,,not-a-url\n"
+        )
+        self.assertEqual(result["imported"], 2)
+        self.assertEqual(
+            sorted((e["row"], e["error"]) for e in result["errors"]),
+            [(4, "Unknown categories: nope"), (5, "images: invalid URL not-a-url")],
+        )
+        product = Product.objects.get(slug="shirt")
+        self.assertEqual(
+            set(product.product_categories.values_list("category_id", flat=True)),
+            {self.men.id, self.shirts.id},
+        )
+        variant = ProductVariant.objects.get(sku="SHIRT-S")
+        self.assertEqual(variant.compare_at_price, Decimal("15.00"))
+        self.assertEqual(variant.image_main, "https://cdn.example.com/s1.jpg")
+        self.assertEqual(
+            list(variant.images.values_list("image_url", "position")),
+            [
+                ("https://cdn.example.com/s1.jpg", 0),
+                ("https://cdn.example.com/s2.jpg", 1),
+            ],
+        )
+
+        self.run_import("shirt,SHIRT-S,10.00,,sale,https://cdn.example.com/s3.jpg\n")
+        self.assertEqual(
+            list(product.product_categories.values_list("category__slug", flat=True)),
+            ["sale"],
+        )
+        self.assertEqual(
+            list(variant.images.values_list("image_url", flat=True)),
+            ["https://cdn.example.com/s3.jpg"],
+        )
+        variant.refresh_from_db()
+        self.assertIsNone(variant.compare_at_price)
+
+    def test_categories_are_resolved_once_and_written_in_bulk(self):
+        rows = "".join(
+            f"shirt,SKU-{i},1.00,,men|shirts,https://cdn.example.com/{i}.jpg\n"
+            for i in range(20)
+        )
+        # Category map once; per chunk: existing SKUs, savepoint, product
+        # upsert, product ids, variant upsert, link delete + insert, variant
+        # ids, image delete + insert, release
+        with self.assertNumQueries(1 + 11 * 2):
+            result = self.run_import(rows, chunk_size=10)
+        self.assertEqual(result["imported"], 20)
+
+    def test_admin_api_rejects_unknown_category_ids(self):
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_user(username="admin", is_staff=True)
+        )
+        data = {"title": "Hat", "description": "Wool", "categories": [self.men.id, 999]}
+        response = client.post("/api/v1/admin/products/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data["categories"] = [self.men.id, "abc"]
+        response = client.post("/api/v1/admin/products/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("categories", response.data)
+        data["categories"] = [self.men.id, self.shirts.id]
+        response = client.post("/api/v1/admin/products/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["categories"], [self.men.id, self.shirts.id])
+
+
+class ProductImportDeltaTest(TestCase):
+    """Test that re-imports only write changed rows."""
+
+    HEADER = "slug,sku,price,stock_quantity\n"
+
+    def run_import(self, body, **kwargs):
+        file = SimpleUploadedFile("catalog.csv", (self.HEADER + body).encode())
+        return import_products(file, **kwargs)
+
+    def counts(self, result):
+        keys = ["created", "updated", "unchanged", "deactivated"]
+        return [result[key] for key in keys]
+
+    def test_unchanged_rows_are_not_written(self):
+        feed = "shirt,SHIRT-S,10.00,5\nshirt,SHIRT-M,10.00,5\nhat,HAT,4.00,9\n"
+        self.assertEqual(self.counts(self.run_import(feed)), [3, 0, 0, 0])
+
+        # Only the existing-SKU lookup of each chunk runs
+        with self.assertNumQueries(2):
+            result = self.run_import(feed, chunk_size=2)
+        self.assertEqual(self.counts(result), [0, 0, 3, 0])
+        self.assertEqual(result["imported"], 0)
+
+        result = self.run_import(feed.replace("HAT,4.00", "HAT,4.50"))
+        self.assertEqual(self.counts(result), [0, 1, 2, 0])
+        self.assertEqual(ProductVariant.objects.get(sku="HAT").price, Decimal("4.50"))
+
+    def test_deactivates_imported_skus_missing_from_the_feed(self):
+        self.run_import("shirt,SHIRT-S,10.00,5\nshirt,SHIRT-M,10.00,5\n")
+        manual = Product.objects.create(title="Manual", description="")
+        ProductVariant.objects.create(product=manual, sku="MANUAL", price=1)
+
+        result = self.run_import(
+            "shirt,SHIRT-S,10.00,5\n", deactivate_missing=True, dry_run=True
+        )
+        self.assertEqual(self.counts(result), [0, 0, 1, 1])
+        self.assertEqual(result["valid"], 1)
+        self.assertTrue(ProductVariant.objects.get(sku="SHIRT-M").is_active)
+
+        result = self.run_import("shirt,SHIRT-S,10.00,5\n", deactivate_missing=True)
+        self.assertEqual(self.counts(result), [0, 0, 1, 1])
+        self.assertEqual(
+            set(ProductVariant.objects.filter(is_active=True).values_list("sku")),
+            {("SHIRT-S",), ("MANUAL",)},
+        )
+
+        # A SKU coming back is written again, even with the same row
+        result = self.run_import("shirt,SHIRT-M,10.00,5\n")
+        self.assertEqual(self.counts(result), [0, 1, 0, 0])
+        self.assertTrue(ProductVariant.objects.get(sku="SHIRT-M").is_active)
+
+        # Variants deactivated by hand stay inactive
+        ProductVariant.objects.filter(sku="MANUAL").update(is_active=False)
+        result = self.run_import("manual,MANUAL,2.00,5\n")
+        self.assertEqual(self.counts(result), [0, 1, 0, 0])
+        self.assertFalse(ProductVariant.objects.get(sku="MANUAL").is_active)
+
+
+class AuditWriterTest(AuditLogMixin, TestCase):
+    """Test the buffered audit log writer."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="admin", is_staff=True)
+
+    def entry(self, object_id, changes=None):
+        return AuditLog(
+            admin_user=self.user,
+            action_type="update",
+            model_name="Order",
+            object_id=str(object_id),
+            changes=changes or {},
+        )
+
+    def test_buffers_and_falls_back_to_direct_writes_when_full(self):
+        writer = AuditWriter(buffer_size=2, flush_size=10, interval=60)
+        writer.add([self.entry(1, {"total": Decimal("9.50")}), self.entry(2)])
+        self.assertFalse(AuditLog.objects.exists())
+
+        # The buffer is full: this one is written right away
+        writer.add([self.entry(3)])
+        self.assertEqual(
+            list(AuditLog.objects.values_list("object_id", flat=True)), ["3"]
+        )
+
+        with self.assertNumQueries(1):
+            writer.flush()
+        self.assertEqual(AuditLog.objects.count(), 3)
+        self.assertEqual(AuditLog.objects.get(object_id="1").changes, {"total": "9.50"})
+
+    @override_settings(AUDIT_IP_HEADER="HTTP_X_FORWARDED_FOR")
+    def test_admin_requests_are_written_at_request_end_with_the_client_ip(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.audited():
+            response = client.post(
+                "/api/v1/admin/categories/",
+                {"name": "Hats", "slug": "hats"},
+                HTTP_X_FORWARDED_FOR="203.0.113.7, 10.0.0.1",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        entry = AuditLog.objects.get(model_name="Category")
+        self.assertEqual(entry.ip_address, "203.0.113.7")
+        self.assertEqual(entry.admin_user, self.user)
+
+    def test_rolled_back_changes_are_not_logged(self):
+        with self.audited():
+            with transaction.atomic():
+                log_admin_action(self.user, "update", "Order", 1)
+            try:
+                with transaction.atomic():
+                    log_admin_action(self.user, "update", "Order", 2)
+                    raise DatabaseError("rolled back")
+            except DatabaseError:
+                pass
+        self.assertEqual(
+            list(AuditLog.objects.values_list("object_id", flat=True)), ["1"]
+        )
+
+
+class AuditRetentionTest(AuditLogMixin, TestCase):
+    """Test compact audit diffs and audit log pruning."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="admin", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_updates_log_only_changed_fields(self):
+        product = Product.objects.create(title="Shirt", description="x" * 500)
+        variant = ProductVariant.objects.create(
+            product=product, sku="SHIRT-S", color="Red", price=Decimal("10.00")
+        )
+        with self.audited():
+            response = self.client.patch(
+                f"/api/v1/admin/variants/{variant.id}/",
+                {"color": "Red", "price": "12.50"},
+                format="json",
+            )
+            self.client.patch(
+                f"/api/v1/admin/products/{product.slug}/",
+                {"description": "y" * 500},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        entries = AuditLog.objects.filter(action_type="update").order_by("id")
+        self.assertEqual(entries[0].changes, {"price": ["10.00", "12.50"]})
+        old, new = entries[1].changes["description"]
+        self.assertEqual((len(old), new[-4:]), (MAX_VALUE_LENGTH + 3, "y..."))
+
+        response = self.client.get(
+            "/api/v1/admin/audit-logs/",
+            {"model_name": "ProductVariant", "object_id": variant.id},
+        )
+        self.assertEqual(response.data["count"], 1)
+
+    def test_prune_archives_old_entries_in_chunks(self):
+        now = timezone.now()
+        for days in (400, 390, 380, 10):
+            AuditLog.objects.create(
+                admin_user=self.user,
+                action_type="update",
+                model_name="Order",
+                object_id=str(days),
+                changes={"status": ["pending", "shipped"]},
+                timestamp=now - timedelta(days=days),
+            )
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command(
+                "prune_audit_log",
+                "--days=365",
+                "--chunk-size=2",
+                f"--archive-dir={directory}",
+                stdout=io.StringIO(),
+            )
+            archived = []
+            for name in sorted(os.listdir(directory)):
+                self.assertTrue(name.endswith(".ndjson.gz"))
+                with gzip.open(os.path.join(directory, name), "rt") as f:
+                    archived += [json.loads(line) for line in f]
+
+        self.assertEqual([row["object_id"] for row in archived], ["400", "390", "380"])
+        self.assertEqual(archived[0]["admin_username"], "admin")
+        self.assertEqual(archived[0]["changes"], {"status": ["pending", "shipped"]})
+        self.assertEqual(
+            list(AuditLog.objects.values_list("object_id", flat=True)), ["10"]
+        )
@@ -25,6 +25,10 @@ router.register(
 )
 router.register(r"admin/orders", views.AdminOrderViewSet, basename="admin-order")
 router.register(r"admin/clients", views.AdminClientViewSet, basename="admin-client")
+router.register(r"admin/exports", views.AdminExportJobViewSet, basename="admin-export")
+router.register(
+    r"admin/import/jobs", views.AdminImportJobViewSet, basename="admin-import-job"
+)
 router.register(
     r"admin/audit-logs", views.AdminAuditLogViewSet, basename="admin-audit-log"
 )
@@ -34,6 +38,7 @@ urlpatterns = [
     # Public endpoints
     path("search/", views.search_products, name="search"),
     path("cart/validate/", views.validate_cart, name="validate-cart"),
+    path("shipping/quote/", views.shipping_quote, name="shipping-quote"),
     path("checkout/", views.checkout, name="checkout"),
     path(
         "orders/<str:reference>/",
@@ -63,4 +68,21 @@ urlpatterns = [
         name="import-products-csv",
     ),
     path("admin/export/orders-csv/", views.export_orders_csv, name="export-orders-csv"),
+    path("admin/dashboard/", views.admin_dashboard, name="admin-dashboard"),
+    path(
+        "admin/analytics/summary/",
+        views.analytics_summary,
+        name="analytics-summary",
+    ),
+    path("admin/analytics/daily/", views.analytics_daily, name="analytics-daily"),
+    path(
+        "admin/analytics/top-skus/",
+        views.analytics_top_skus,
+        name="analytics-top-skus",
+    ),
+    path(
+        "admin/analytics/wilayas/",
+        views.analytics_wilayas,
+        name="analytics-wilayas",
+    ),
 ]
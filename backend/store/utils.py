@@ -2,41 +2,48 @@
 Utility functions for the store app.
 """
 
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from datetime import time as dt_time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
 from .models import AuditLog
 
 
 def log_admin_action(user, action_type, model_name, object_id, changes=None):
-    """Log admin action to audit log."""
-    import json
+    """Log admin action to audit log (buffered, see store/audit.py)."""
+    log_admin_actions(user, action_type, model_name, [(object_id, changes)])
+
 
+def log_admin_actions(user, action_type, model_name, entries):
+    """Log several admin actions, given as (object_id, changes), in one insert."""
     from django.contrib.auth.models import AnonymousUser
 
-    if isinstance(user, AnonymousUser):
+    from .audit import queue_on_commit
+
+    if isinstance(user, AnonymousUser) or not entries:
         return
 
-    # Convert changes to JSON-serializable format
-    if changes:
-        try:
-            # Try to serialize to ensure it's valid JSON
-            json.dumps(changes)
-        except (TypeError, ValueError):
-            # If it contains non-serializable data, convert to string representation
-            changes = {k: str(v) for k, v in changes.items()}
-
-    try:
-        AuditLog.objects.create(
-            admin_user=user,
-            action_type=action_type,
-            model_name=model_name,
-            object_id=str(object_id),
-            changes=changes or {},
-        )
-    except Exception as e:
-        # Log error but don't fail the request
-        import logging
-
-        logger = logging.getLogger(__name__)
-        logger.error(f"Failed to create audit log: {e}")
+    now = timezone.now()
+    queue_on_commit(
+        [
+            AuditLog(
+                admin_user=user,
+                action_type=action_type,
+                model_name=model_name,
+                object_id=str(object_id),
+                changes=changes or {},
+                timestamp=now,
+            )
+            for object_id, changes in entries
+        ]
+    )
 
 
 def calculate_order_totals(subtotal, discount=0, shipping_cost=0):
@@ -57,6 +64,20 @@ def calculate_order_totals(subtotal, discount=0, shipping_cost=0):
     }
 
 
+def start_of_day(day):
+    """Aware datetime at midnight of ``day`` in the current time zone."""
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+def normalize_phone(phone):
+    """Digits of an Algerian phone number in national form (+213 -> 0)."""
+    digits = re.sub(r"\D", "", phone or "")
+    for prefix in ("00213", "213"):
+        if digits.startswith(prefix) and len(digits) > len(prefix):
+            return "0" + digits[len(prefix) :]
+    return digits
+
+
 def process_payment(amount, method="card", email=None):
     """
     Mock payment processor.
@@ -88,3 +109,82 @@ def process_payment(amount, method="card", email=None):
         "message": "Payment processed successfully",
         "transaction_id": transaction_id,
     }
+
+
+def cached_computation(key, compute, ttl, stale_ttl, lock_timeout=10):
+    """
+    ``compute()`` cached for ``ttl`` seconds, recomputed by one caller at a time.
+
+    Once the value is older than ``ttl``, the caller that wins a ``cache.add``
+    lock recomputes it while everyone else keeps getting the previous value
+    (kept up to ``stale_ttl`` more seconds). Only a cold cache makes callers
+    wait, up to ``lock_timeout`` seconds, for the winner.
+    """
+    entry = cache.get(key)  # (value, fresh_until)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, (value, time.time() + ttl), ttl + stale_ttl)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        return entry[0]
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
+
+
+class VersionedSnapshot:
+    """
+    Per-process copy of rarely-changing data.
+    The copy is rebuilt when the version stamp stored in the shared cache
+    changes, or once it is older than ``max_age`` seconds.
+
+    Other processes only see the new stamp when ``CACHES["default"]`` is
+    shared between them (Redis in docker-compose). With a per-process cache
+    such as LocMemCache they are eventually consistent, up to ``max_age``.
+    """
+
+    def __init__(self, cache_key, loader, max_age):
+        self.cache_key = cache_key
+        self.loader = loader  # called with the version stamp
+        self.max_age = max_age
+        self._state = None  # (value, version, loaded_at)
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = cache.get_or_set(self.cache_key, uuid.uuid4().hex, None)
+        state = self._state
+        if (
+            state is not None
+            and state[1] == version
+            and time.monotonic() - state[2] < self.max_age
+        ):
+            return state[0]
+
+        with self._lock:
+            if self._state is state:
+                self._state = (self.loader(version), version, time.monotonic())
+            return self._state[0]
+
+    def invalidate(self):
+        """Drop this process's copy and bump the shared version stamp."""
+        self._state = None
+        cache.set(self.cache_key, uuid.uuid4().hex, None)
+
+    def changed(self, sender, **kwargs):
+        """Signal receiver for saves/deletes of the underlying models."""
+        # Reload locally right away (this process can see its own writes) and
+        # tell the other workers once the change is committed.
+        self._state = None
+        transaction.on_commit(self.invalidate)
@@ -3,39 +3,63 @@ API views for the store.
 """
 
 import csv
-import io
+import os
+from datetime import timedelta
 from decimal import Decimal
 
 from django.conf import settings
 from django.contrib.auth.hashers import check_password, make_password
-from django.core.mail import send_mail
-from django.db import transaction
 from django.db.models import Q
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status, viewsets
+from rest_framework import filters, mixins, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
+from . import analytics
+from .archive import find_order
+from .audit import changed_fields
+from .batching import CheckoutPending, submit_checkout
+from .changes import order_changes
+from .dashboard import get_kpis
+from .export_jobs import download_name, job_path
+from .exports import order_export, stream_csv
+from .import_jobs import cancel_job, create_job, media_path
+from .imports import import_products
+from .inventory import (
+    consolidate_stock,
+    low_stock_variants,
+    rebalance_stock,
+    shard_stock,
+)
 from .models import (
+    ArchivedOrder,
     AuditLog,
     Baladiya,
     Category,
     Client,
     ClientToken,
+    ExportJob,
+    ImportJob,
     Order,
-    OrderLine,
     Product,
     ProductVariant,
     Wilaya,
 )
+from .orders import CheckoutError, change_order_status, place_order, price_cart
+from .pagination import EstimatedCountPagination
+from .references import PREFIX as REFERENCE_PREFIX
+from .references import normalize_reference
 from .serializers import (
     AdminClientSerializer,
     AdminProductSerializer,
     AuditLogSerializer,
     BaladiyaSerializer,
+    BulkOrderStatusSerializer,
     CategorySerializer,
     CheckoutSerializer,
     ClientLoginSerializer,
@@ -43,13 +67,19 @@ from .serializers import (
     ClientRegisterSerializer,
     ClientSerializer,
     ClientUpdateSerializer,
+    ExportJobSerializer,
+    ImportJobSerializer,
+    LowStockVariantSerializer,
+    OrderChangeSerializer,
     OrderSerializer,
     ProductDetailSerializer,
     ProductSerializer,
     ProductVariantSerializer,
+    ShippingQuoteSerializer,
     WilayaSerializer,
 )
-from .utils import log_admin_action
+from .shipping import get_shipping_table, get_variant_pricing
+from .utils import log_admin_action, normalize_phone
 
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -161,44 +191,42 @@ def search_products(request):
 @permission_classes([AllowAny])
 def validate_cart(request):
     """Validate cart items and return totals."""
-    items = request.data.get("items", [])
-    errors = []
-    validated_items = []
-    total = Decimal("0.00")
+    return Response(price_cart(request.data.get("items", [])))
 
-    for item in items:
-        variant_id = item.get("variant_id")
-        quantity = item.get("quantity", 1)
 
-        try:
-            variant = ProductVariant.objects.get(id=variant_id, is_active=True)
-            if variant.stock_quantity < quantity:
-                errors.append(
-                    f"Insufficient stock for {variant.sku}. Available: {variant.stock_quantity}"
-                )
-            else:
-                line_total = variant.price * quantity
-                total += line_total
-                validated_items.append(
-                    {
-                        "variant_id": variant.id,
-                        "sku": variant.sku,
-                        "title": variant.product.title,
-                        "price": str(variant.price),
-                        "quantity": quantity,
-                        "line_total": str(line_total),
-                    }
-                )
-        except ProductVariant.DoesNotExist:
-            errors.append(f"Variant {variant_id} not found")
+@api_view(["POST"])
+@permission_classes([AllowAny])
+def shipping_quote(request):
+    """Quote shipping for a cart (served from memory and cache)."""
+    serializer = ShippingQuoteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    data = serializer.validated_data
+    items = data["items"]
+    pricing = get_variant_pricing([item["variant_id"] for item in items])
+
+    subtotal = Decimal("0.00")
+    weight = Decimal("0.00")
+    for item in items:
+        variant = pricing.get(item["variant_id"])
+        if variant is None:
+            return Response(
+                {"error": f"Variant {item['variant_id']} not found"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        subtotal += variant.price * item["quantity"]
+        weight += variant.weight * item["quantity"]
+
+    quote = get_shipping_table().quote(data["wilaya"], weight, subtotal)
     return Response(
         {
-            "valid": len(errors) == 0,
-            "errors": errors,
-            "items": validated_items,
-            "subtotal": str(total),
-            "total": str(total),  # Will be recalculated with shipping in checkout
+            "wilaya": data["wilaya"],
+            "zone": quote.zone,
+            "weight": str(weight),
+            "subtotal": str(subtotal),
+            "shipping_cost": str(quote.cost),
+            "total": str(subtotal + quote.cost),
         }
     )
 
@@ -211,101 +239,15 @@ def checkout(request):
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    data = serializer.validated_data
-    items = data["items"]
-
-    # Validate stock and build order lines
-    order_lines_data = []
-    subtotal = Decimal("0.00")
-
-    with transaction.atomic():
-        for item in items:
-            variant_id = item["variant_id"]
-            quantity = item["quantity"]
-
-            try:
-                variant = ProductVariant.objects.select_for_update().get(
-                    id=variant_id, is_active=True
-                )
-
-                if variant.stock_quantity < quantity:
-                    return Response(
-                        {
-                            "error": f"Insufficient stock for {variant.sku}. Available: {variant.stock_quantity}"
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Reserve stock
-                variant.stock_quantity -= quantity
-                variant.save()
-
-                line_total = variant.price * quantity
-                subtotal += line_total
-
-                order_lines_data.append(
-                    {
-                        "variant": variant,
-                        "sku_snapshot": variant.sku,
-                        "title_snapshot": variant.product.title,
-                        "price_snapshot": variant.price,
-                        "quantity": quantity,
-                        "line_total": line_total,
-                    }
-                )
-            except ProductVariant.DoesNotExist:
-                return Response(
-                    {"error": f"Variant {variant_id} not found"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-        # Calculate totals
-        shipping_cost = Decimal("10.00")  # Default shipping
-        total = subtotal + shipping_cost
-
-        # Get wilaya and baladiya
-        wilaya = Wilaya.objects.get(id=data["wilaya"])
-        baladiya = Baladiya.objects.get(id=data["baladiya"])
-
-        # Payment on delivery - no payment processing needed
-        # Create order with pending payment status
-        order = Order.objects.create(
-            status="pending",  # Will be confirmed when payment is received on delivery
-            name=data["name"],
-            phone=data["phone"],
-            address=data["address"],
-            wilaya=wilaya,
-            baladiya=baladiya,
-            subtotal=subtotal,
-            shipping_cost=shipping_cost,
-            total=total,
-            payment_method="cash_on_delivery",
-            payment_status="pending",  # Payment on delivery - always pending until delivery
-        )
-
-        # Create order lines
-        for line_data in order_lines_data:
-            OrderLine.objects.create(
-                order=order,
-                product_variant=line_data["variant"],
-                sku_snapshot=line_data["sku_snapshot"],
-                title_snapshot=line_data["title_snapshot"],
-                price_snapshot=line_data["price_snapshot"],
-                quantity=line_data["quantity"],
-                line_total=line_data["line_total"],
-            )
-
-        # Send confirmation email (mock/console)
-        try:
-            send_mail(
-                subject=f"Order Confirmation - {order.reference}",
-                message=f"Thank you for your order {order.reference}. Total: {order.total}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[order.email],
-                fail_silently=True,
-            )
-        except Exception as e:
-            print(f"Email send failed: {e}")
+    try:
+        if settings.CHECKOUT_BATCHING:
+            order = submit_checkout(serializer.validated_data)
+        else:
+            order = place_order(serializer.validated_data)
+    except CheckoutError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except CheckoutPending as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
     serializer = OrderSerializer(order)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -314,10 +256,21 @@ def checkout(request):
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_order_by_reference(request, reference):
-    """Get order by reference (for guest order lookup)."""
-    email = request.query_params.get("email", "")
+    """
+    Get order by reference (for guest order lookup). The ``email`` or
+    ``phone`` given must match the order's.
+    """
+    lookup = {"reference": normalize_reference(reference)}
+    email = request.query_params.get("email", "").strip()
+    phone = normalize_phone(request.query_params.get("phone", ""))
+    if email:
+        lookup["email__iexact"] = email
+    if phone:
+        lookup["phone_digits"] = phone
+    if len(lookup) == 1:
+        return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
     try:
-        order = Order.objects.get(reference=reference, email=email)
+        order = find_order(**lookup)
         serializer = OrderSerializer(order)
         return Response(serializer.data)
     except Order.DoesNotExist:
@@ -344,13 +297,10 @@ class AdminCategoryViewSet(viewsets.ModelViewSet):
         )
 
     def perform_update(self, serializer):
+        changes = changed_fields(serializer.instance, serializer.validated_data)
         instance = serializer.save()
         log_admin_action(
-            self.request.user,
-            "update",
-            "Category",
-            str(instance.id),
-            serializer.validated_data,
+            self.request.user, "update", "Category", str(instance.id), changes
         )
 
     def perform_destroy(self, instance):
@@ -385,13 +335,10 @@ class AdminProductViewSet(viewsets.ModelViewSet):
         )
 
     def perform_update(self, serializer):
+        changes = changed_fields(serializer.instance, serializer.validated_data)
         instance = serializer.save()
         log_admin_action(
-            self.request.user,
-            "update",
-            "Product",
-            str(instance.id),
-            serializer.validated_data,
+            self.request.user, "update", "Product", str(instance.id), changes
         )
 
     def perform_destroy(self, instance):
@@ -412,6 +359,13 @@ class AdminProductVariantViewSet(viewsets.ModelViewSet):
     serializer_class = ProductVariantSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
 
+    def get_queryset(self):
+        """``?low_stock=true`` keeps variants at or below their threshold."""
+        queryset = super().get_queryset()
+        if self.request.query_params.get("low_stock") in ("1", "true"):
+            queryset = low_stock_variants(queryset)
+        return queryset
+
     def perform_create(self, serializer):
         instance = serializer.save()
         log_admin_action(
@@ -423,13 +377,10 @@ class AdminProductVariantViewSet(viewsets.ModelViewSet):
         )
 
     def perform_update(self, serializer):
+        changes = changed_fields(serializer.instance, serializer.validated_data)
         instance = serializer.save()
         log_admin_action(
-            self.request.user,
-            "update",
-            "ProductVariant",
-            str(instance.id),
-            serializer.validated_data,
+            self.request.user, "update", "ProductVariant", str(instance.id), changes
         )
 
     def perform_destroy(self, instance):
@@ -442,21 +393,129 @@ class AdminProductVariantViewSet(viewsets.ModelViewSet):
         )
         instance.delete()
 
+    def _stock_response(self, variant, action_name):
+        log_admin_action(
+            self.request.user,
+            "update",
+            "ProductVariant",
+            str(variant.id),
+            {"stock": action_name, "shard_count": variant.shard_count},
+        )
+        data = self.get_serializer(variant).data
+        data["shards"] = list(variant.shards.values("index", "quantity"))
+        return Response(data)
+
+    @action(detail=True, methods=["post"])
+    def shard_stock(self, request, pk=None):
+        """Split the variant's stock across N shard rows (flash-sale mode)."""
+        try:
+            shards = int(request.data.get("shards", 0))
+        except (TypeError, ValueError):
+            shards = 0
+        if not 1 <= shards <= settings.SHARDED_STOCK_MAX_SHARDS:
+            return Response(
+                {
+                    "error": f"shards must be between 1 and {settings.SHARDED_STOCK_MAX_SHARDS}"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        variant = shard_stock(self.get_object(), shards)
+        return self._stock_response(variant, "shard_stock")
+
+    @action(detail=True, methods=["post"])
+    def rebalance_stock(self, request, pk=None):
+        """Spread a sharded variant's remaining stock evenly."""
+        variant = rebalance_stock(self.get_object())
+        return self._stock_response(variant, "rebalance_stock")
+
+    @action(detail=True, methods=["post"])
+    def consolidate_stock(self, request, pk=None):
+        """Fold shard rows back into stock_quantity."""
+        variant = consolidate_stock(self.get_object())
+        return self._stock_response(variant, "consolidate_stock")
+
+    @action(detail=False, methods=["get"], url_path="low-stock")
+    def low_stock(self, request):
+        """
+        Paginated low-stock report, most short of stock first. Active
+        variants only unless ``?include_inactive=true``.
+        """
+        queryset = low_stock_variants().select_related("product")
+        if request.query_params.get("include_inactive") not in ("1", "true"):
+            queryset = queryset.filter(is_active=True)
+
+        paginator = EstimatedCountPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(
+            LowStockVariantSerializer(page, many=True).data
+        )
+
+
+class OrderSearchFilter(filters.BaseFilterBackend):
+    """
+    Order search for ``?search=`` that only uses indexed exact or prefix
+    lookups: a reference, an email, a phone number prefix in any formatting,
+    or otherwise a customer name prefix.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get("search", "").strip()
+        if not term:
+            return queryset
+
+        reference = normalize_reference(term)
+        if reference.startswith(REFERENCE_PREFIX):
+            return queryset.filter(reference=reference)
+        if "@" in term:
+            return queryset.filter(email__iexact=term)
+        digits = normalize_phone(term)
+        if digits and not any(char.isalpha() for char in term):
+            return queryset.filter(phone_digits__startswith=digits)
+        return queryset.filter(name__istartswith=term)
+
 
 class AdminOrderViewSet(viewsets.ReadOnlyModelViewSet):
     """Admin order viewset."""
 
-    queryset = Order.objects.all().prefetch_related("lines")
+    # Wilaya and baladiya names are serialized for every order
+    queryset = (
+        Order.objects.all()
+        .select_related("wilaya", "baladiya")
+        .prefetch_related("lines")
+    )
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    pagination_class = EstimatedCountPagination
+    filter_backends = [DjangoFilterBackend, OrderSearchFilter]
     filterset_fields = ["status", "payment_status"]
-    search_fields = ["reference", "email", "first_name", "last_name"]
+
+    def get_queryset(self):
+        """``?archived=true`` lists archived orders instead (read-only)."""
+        if self.request.query_params.get("archived") in ("1", "true"):
+            return (
+                ArchivedOrder.objects.all()
+                .select_related("wilaya", "baladiya")
+                .prefetch_related("lines")
+            )
+        return super().get_queryset()
+
+    def retrieve(self, request, *args, **kwargs):
+        """Fall through to the archive for orders no longer in ``Order``."""
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            order = get_object_or_404(ArchivedOrder, pk=kwargs["pk"])
+            return Response(self.get_serializer(order).data)
 
     @action(detail=True, methods=["patch"])
     def update_status(self, request, pk=None):
         """Update order status."""
         order = self.get_object()
+        if isinstance(order, ArchivedOrder):
+            return Response(
+                {"error": "Archived orders cannot be changed"},
+                status=status.HTTP_409_CONFLICT,
+            )
         new_status = request.data.get("status")
 
         if new_status not in dict(Order.ORDER_STATUS_CHOICES):
@@ -464,15 +523,153 @@ class AdminOrderViewSet(viewsets.ReadOnlyModelViewSet):
                 {"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        order.status = new_status
-        order.save()
+        (result,) = change_order_status(request.user, new_status, ids=[order.id])
+        if result["outcome"] == "not_found":
+            # Archived since it was read
+            raise Http404
+        if result["outcome"] == "invalid_transition":
+            return Response(
+                {
+                    "error": f"Cannot change status from {result['status']} "
+                    f"to {new_status}"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
+        serializer = self.get_serializer(self.get_object())
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["post"], url_path="bulk-status")
+    def bulk_status(self, request):
+        """Move many orders (ids and/or references) to one status."""
+        serializer = BulkOrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        outcomes = change_order_status(
+            request.user,
+            data["status"],
+            ids=data.get("ids", []),
+            references=data.get("references", []),
+        )
+        counts = {}
+        for outcome in outcomes:
+            counts[outcome["outcome"]] = counts.get(outcome["outcome"], 0) + 1
+        return Response({"counts": counts, "results": outcomes})
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        Orders changed since ``?since=<cursor>`` (all orders without it),
+        oldest first. Pass ``next_cursor`` back as ``since`` to continue.
+        """
+        try:
+            limit = int(request.query_params.get("limit", 0))
+            orders, next_cursor, has_more = order_changes(
+                since=request.query_params.get("since"), limit=limit
+            )
+        except ValueError:
+            return Response(
+                {"error": "Invalid since cursor or limit"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "results": OrderChangeSerializer(orders, many=True).data,
+                "next_cursor": next_cursor,
+                "has_more": has_more,
+            }
+        )
+
+
+class AdminExportJobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """Admin export jobs: create, poll progress and download the result."""
+
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["kind", "status"]
+
+    def perform_create(self, serializer):
+        job = serializer.save(created_by=self.request.user)
         log_admin_action(
-            request.user, "update", "Order", str(order.id), {"status": new_status}
+            self.request.user,
+            "export",
+            "ExportJob",
+            str(job.id),
+            {"kind": job.kind, "format": job.format, "params": job.params},
         )
 
-        serializer = self.get_serializer(order)
-        return Response(serializer.data)
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        """Download the gzip'd export file of a completed job."""
+        job = self.get_object()
+        if job.status != "completed":
+            return Response(
+                {"error": f"Export is {job.status}"}, status=status.HTTP_409_CONFLICT
+            )
+        try:
+            f = open(job_path(job), "rb")
+        except FileNotFoundError:
+            return Response(
+                {"error": "Export file not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return FileResponse(
+            f,
+            as_attachment=True,
+            filename=download_name(job),
+            content_type="application/gzip",
+        )
+
+
+class AdminImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Admin product import jobs: upload, poll progress, cancel, get errors."""
+
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["status"]
+
+    def create(self, request):
+        """Queue the uploaded CSV ``file`` for the import worker."""
+        if "file" not in request.FILES:
+            return Response(
+                {"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        job = _queue_import(request)
+        return Response(self.get_serializer(job).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=["post"])
+    def cancel(self, request, pk=None):
+        """Stop a pending or running import (rows already written stay)."""
+        job = self.get_object()
+        if not cancel_job(job):
+            return Response(
+                {"error": f"Import is {job.status}"}, status=status.HTTP_409_CONFLICT
+            )
+        log_admin_action(
+            request.user, "update", "ImportJob", str(job.id), {"cancel": True}
+        )
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=["get"])
+    def errors(self, request, pk=None):
+        """Download the rows rejected so far as CSV (row, sku, error)."""
+        job = self.get_object()
+        path = media_path(job.errors_file) if job.errors_file else ""
+        if not job.errors_bytes or not os.path.exists(path):
+            return Response(
+                {"error": "No error report yet"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return FileResponse(
+            open(path, "rb"),
+            as_attachment=True,
+            filename=f"import-{job.id}-errors.csv",
+            content_type="text/csv",
+        )
 
 
 class WilayaViewSet(viewsets.ReadOnlyModelViewSet):
@@ -496,11 +693,22 @@ class BaladiyaViewSet(viewsets.ReadOnlyModelViewSet):
 class AdminAuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     """Admin audit log viewset."""
 
-    queryset = AuditLog.objects.all().select_related("admin_user")
+    queryset = (
+        AuditLog.objects.all()
+        .select_related("admin_user")
+        .order_by("-timestamp", "-id")
+    )
     serializer_class = AuditLogSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
+    pagination_class = EstimatedCountPagination
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ["action_type", "model_name", "admin_user"]
+    filterset_fields = {
+        "action_type": ["exact"],
+        "model_name": ["exact"],
+        "object_id": ["exact"],
+        "admin_user": ["exact"],
+        "timestamp": ["gte", "lt"],
+    }
 
 
 class AdminClientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -509,88 +717,197 @@ class AdminClientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Client.objects.all().order_by("-created_at")
     serializer_class = AdminClientSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
+    pagination_class = EstimatedCountPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ["email", "first_name", "last_name", "phone"]
     filterset_fields = ["is_active"]
 
 
+def _queue_import(request, deactivate_missing=False):
+    """Store the uploaded ``file`` as an import job for the worker."""
+    job = create_job(request.user, request.FILES["file"], deactivate_missing)
+    log_admin_action(
+        request.user,
+        "import",
+        "Product",
+        "",
+        {"job": job.id, "file": job.original_name, "size": job.file_size},
+    )
+    return job
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def import_products_csv(request):
-    """Import products from CSV."""
+    """
+    Import (create or update) products and variants from a CSV upload, see
+    store/imports.py. Invalid rows are reported and skipped.
+
+    Files over PRODUCT_IMPORT_SYNC_MAX_BYTES, or any file with ``?async=1``,
+    are queued as an import job instead (202 with the job). ``?dry_run=1``
+    only validates the file and reports every bad row; larger dry runs are
+    refused (413), the ``import_products_csv --dry-run`` command handles them.
+    ``?deactivate_missing=1`` deactivates imported SKUs absent from the file.
+    """
     if "file" not in request.FILES:
         return Response(
             {"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST
         )
 
-    file = request.FILES["file"]
-    decoded_file = file.read().decode("utf-8")
-    io_string = io.StringIO(decoded_file)
-    reader = csv.DictReader(io_string)
-
-    imported = 0
-    errors = []
-
-    for row_num, row in enumerate(reader, start=2):
-        try:
-            # Create or update product
-            product, created = Product.objects.get_or_create(
-                slug=row.get("slug", ""),
-                defaults={
-                    "title": row.get("title", ""),
-                    "description": row.get("description", ""),
-                    "brand": row.get("brand", ""),
-                    "is_active": row.get("is_active", "true").lower() == "true",
-                },
-            )
+    upload = request.FILES["file"]
+    dry_run = request.query_params.get("dry_run") in ("1", "true")
+    deactivate_missing = request.query_params.get("deactivate_missing") in (
+        "1",
+        "true",
+    )
+    if dry_run and upload.size > settings.PRODUCT_IMPORT_SYNC_MAX_BYTES:
+        return Response(
+            {
+                "error": "Dry runs are limited to "
+                f"{settings.PRODUCT_IMPORT_SYNC_MAX_BYTES} bytes; validate larger "
+                "files with the import_products_csv --dry-run command"
+            },
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    if not dry_run and (
+        request.query_params.get("async") in ("1", "true")
+        or upload.size > settings.PRODUCT_IMPORT_SYNC_MAX_BYTES
+    ):
+        job = _queue_import(request, deactivate_missing)
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
-            # Create variant
-            variant, _ = ProductVariant.objects.get_or_create(
-                sku=row.get("sku", ""),
-                defaults={
-                    "product": product,
-                    "size": row.get("size", ""),
-                    "color": row.get("color", ""),
-                    "price": Decimal(row.get("price", "0")),
-                    "stock_quantity": int(row.get("stock_quantity", "0")),
-                    "is_active": row.get("variant_active", "true").lower() == "true",
-                },
-            )
+    try:
+        result = import_products(
+            upload,
+            dry_run=dry_run,
+            workers=settings.PRODUCT_IMPORT_WORKERS,
+            deactivate_missing=deactivate_missing,
+        )
+    except (ValueError, csv.Error) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            imported += 1
-        except Exception as e:
-            errors.append(f"Row {row_num}: {str(e)}")
+    result["errors"] = [
+        f"Row {error['row']}: {error['error']}" for error in result["errors"]
+    ]
+    if dry_run:
+        return Response(result)
 
     log_admin_action(
         request.user,
         "import",
         "Product",
         "",
-        {"imported": imported, "errors": len(errors)},
+        {
+            "imported": result["imported"],
+            "unchanged": result["unchanged"],
+            "deactivated": result["deactivated"],
+            "errors": len(result["errors"]),
+        },
     )
-
-    return Response({"imported": imported, "errors": errors})
+    return Response(result)
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def export_orders_csv(request):
-    """Export orders to CSV."""
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="orders.csv"'
+    """
+    Stream orders (or order lines with ``?lines=1``) as CSV, optionally
+    filtered by created_from, created_to, status and wilaya.
+    """
+    lines = request.query_params.get("lines", "").lower() in ("1", "true")
+    try:
+        header, rows = order_export(request.query_params, lines=lines)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    filename = "order-lines.csv" if lines else "orders.csv"
+    response = StreamingHttpResponse(stream_csv(header, rows), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    # Counting would cost a second scan, so record the filters instead
+    filters = {
+        key: request.query_params[key]
+        for key in ("created_from", "created_to", "status", "wilaya")
+        if request.query_params.get(key)
+    }
+    log_admin_action(
+        request.user, "export", "Order", "", {"filters": filters, "lines": lines}
+    )
+
+    return response
 
-    writer = csv.writer(response)
-    writer.writerow(["Reference", "Email", "Status", "Total", "Created At"])
 
-    orders = Order.objects.all()
-    for order in orders:
-        writer.writerow(
-            [order.reference, order.email, order.status, order.total, order.created_at]
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def admin_dashboard(request):
+    """Dashboard KPIs (cached for a few seconds, see store/dashboard.py)."""
+    return Response(get_kpis())
+
+
+def _analytics_range(request):
+    """
+    Inclusive (from, to) dates; the last 30 days by default, at most
+    ANALYTICS_MAX_DAYS days.
+    """
+    end = request.query_params.get("to")
+    end = parse_date(end) if end else timezone.localdate()
+    start = request.query_params.get("from")
+    start = parse_date(start) if start else end - timedelta(days=29)
+    if start is None or end is None:
+        raise ValueError("from and to must be dates (YYYY-MM-DD)")
+    if start > end:
+        raise ValueError("from must not be after to")
+    if (end - start).days >= settings.ANALYTICS_MAX_DAYS:
+        raise ValueError(f"The range cannot exceed {settings.ANALYTICS_MAX_DAYS} days")
+    return start, end
+
+
+def _analytics_response(request, report, **kwargs):
+    try:
+        start, end = _analytics_range(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        {
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "results": report(start, end, **kwargs),
+        }
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def analytics_summary(request):
+    """Sales totals and per-status counts for a date range."""
+    return _analytics_response(request, analytics.summary)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def analytics_daily(request):
+    """Orders and revenue per day for a date range."""
+    return _analytics_response(request, analytics.daily)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def analytics_top_skus(request):
+    """Best-selling SKUs for a date range."""
+    try:
+        limit = min(int(request.query_params.get("limit", 10)), 100)
+    except ValueError:
+        return Response(
+            {"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST
         )
+    return _analytics_response(request, analytics.top_skus, limit=max(limit, 1))
 
-    log_admin_action(request.user, "export", "Order", "", {"count": orders.count()})
 
-    return response
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def analytics_wilayas(request):
+    """Orders and revenue per wilaya for a date range."""
+    return _analytics_response(request, analytics.by_wilaya)
 
 
 # ============================================
@@ -73,6 +73,7 @@ export interface Order {
   reference: string
   status: string
   name: string
+  email?: string
   phone: string
   address: string
   wilaya: number
@@ -156,9 +157,25 @@ export async function validateCart(items: CartItem[]): Promise<any> {
   return response.data
 }
 
+export async function getShippingQuote(
+  wilaya: number,
+  items: CartItem[]
+): Promise<{
+  wilaya: number
+  zone: string | null
+  weight: string
+  subtotal: string
+  shipping_cost: string
+  total: string
+}> {
+  const response = await api.post('/shipping/quote/', { wilaya, items })
+  return response.data
+}
+
 export async function checkout(data: {
   items: CartItem[]
   name: string
+  email?: string
   phone: string
   address: string
   wilaya: number
@@ -180,9 +197,12 @@ export async function getBaladiyas(
   return response.data.results || response.data
 }
 
-export async function getOrderByReference(reference: string, email: string): Promise<Order> {
+export async function getOrderByReference(
+  reference: string,
+  contact: { email?: string; phone?: string }
+): Promise<Order> {
   const response = await api.get(`/orders/${reference}/`, {
-    params: { email },
+    params: contact,
   })
   return response.data
 }